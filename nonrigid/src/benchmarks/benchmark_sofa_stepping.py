@@ -0,0 +1,174 @@
+###############################################################
+# SOFA stepping benchmark
+# -------------------------------------------------------------
+# Measures the Python overhead per time step of the simulation
+# loop in blocks/simulation/simulation_block.py on a Tissue
+# scene (core.sofa.objects.tissue.Tissue), when stepping one
+# time step per call and when stepping in batches with the
+# BatchStepper (SimulationBlock's steps_per_call parameter).
+# The overhead is the difference to running all time steps with
+# a single Sofa.Simulation.animateNSteps call.
+# Run "python3 src/benchmarks/benchmark_sofa_stepping.py --help"
+# for an overview of parameters.
+###############################################################
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import types
+
+from vtk import *
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import Sofa
+import Sofa.Core
+import Sofa.Simulation
+import SofaRuntime
+SofaRuntime.importPlugin("Sofa.Component")
+
+from core.sofa.components.header import add_scene_header
+from core.sofa.components.forcefield import Material, ConstitutiveModel
+from core.sofa.components.solver import SolverType, TimeIntegrationType
+from core.sofa.objects.tissue import Tissue
+from blocks.simulation.simulation_block import SimulationBlock, BatchStepper
+
+def create_test_mesh(
+    resolution: int,
+    directory: str,
+) ->str:
+    """ Tetrahedralize a box of resolution^3 points, return the path to the .vtu file. """
+    points = vtkPoints()
+    for i in range(resolution):
+        for j in range(resolution):
+            for k in range(resolution):
+                points.InsertNextPoint(0.1*i/(resolution-1), 0.05*j/(resolution-1),
+                        0.05*k/(resolution-1))
+    cloud = vtkPolyData()
+    cloud.SetPoints(points)
+    delaunay = vtkDelaunay3D()
+    delaunay.SetInputData(cloud)
+    delaunay.Update()
+    filename = os.path.join(directory, "volume.vtu")
+    writer = vtkXMLUnstructuredGridWriter()
+    writer.SetFileName(filename)
+    writer.SetInputData(delaunay.GetOutput())
+    writer.Write()
+
+    # Tissue always loads this surface, relative to the working directory:
+    surface = vtkGeometryFilter()
+    surface.SetInputData(delaunay.GetOutput())
+    surface.Update()
+    os.makedirs(os.path.join(directory, "mesh"), exist_ok=True)
+    stl_writer = vtkSTLWriter()
+    stl_writer.SetFileName(os.path.join(directory, "mesh", "surface_A.stl"))
+    stl_writer.SetInputData(surface.GetOutput())
+    stl_writer.Write()
+    return filename
+
+class Simulation(Sofa.Core.Controller):
+    """ Minimal stand-in for a simulation class: a Tissue which never converges. """
+    def __init__(self, root, mesh_filename, dt):
+        super().__init__()
+        root.animate = True
+        add_scene_header(root, gravity=[0, 0, -9.81], dt=dt, alarm_distance=None,
+                contact_distance=None, friction=None)
+        self.tissue = root.addObject(Tissue(root, simulation_mesh_filename=mesh_filename,
+                material=Material(young_modulus=5000, poisson_ratio=0.45,
+                    constitutive_model=ConstitutiveModel.COROTATED, mass_density=1000),
+                solver=SolverType.CG, analysis=TimeIntegrationType.EULER))
+        self.deformed = vtkUnstructuredGrid()
+
+    def get_deformed_mesh(self):
+        return self.deformed
+
+def create_scene(
+    mesh_filename: str,
+    dt: float,
+    batched: bool,
+):
+    root = Sofa.Core.Node("root")
+    simulation = Simulation(root, mesh_filename, dt)
+    root.addObject(simulation)
+    stepper = None
+    if batched:
+        stepper = root.addObject(BatchStepper(root, simulation, name="BatchStepper"))
+    Sofa.Simulation.init(root)
+    return root, stepper
+
+def run_single_call(
+    root,
+    num_steps: int,
+) ->None:
+    Sofa.Simulation.animateNSteps(root, num_steps, root.dt.value)
+
+def run_loop(
+    root,
+    stepper,
+    block,
+    num_steps: int,
+) ->None:
+    """ Same bookkeeping as the loop in SimulationBlock.run (without writing the frames). """
+    simulation_time = 0
+    prev_id = 0
+    n_timesteps = 0
+    start_time = time.time()
+    while root.animate.value == True and n_timesteps < num_steps:
+        dt = root.dt.value
+        if stepper is None:
+            Sofa.Simulation.animate(root, dt)
+            n_steps = 1
+        else:
+            n_steps = stepper.step(min(SimulationBlock._steps_until_check(block,
+                simulation_time, prev_id, dt), num_steps - n_timesteps), dt)
+        for _ in range(n_steps):
+            simulation_time += dt
+        n_timesteps += n_steps
+        if not block.export_time == -1:
+            id = (simulation_time + 1e-08) // block.export_time
+            if not id == prev_id:
+                prev_id = id
+        if simulation_time > block.max_simulation_time:
+            break
+        if time.time() - start_time > block.max_time_before_timeout:
+            break
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser("SOFA stepping benchmark")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[5, 10],
+            help="Number of points along each axis of the test meshes.")
+    parser.add_argument("--num_steps", type=int, default=500,
+            help="Number of time steps per run.")
+    parser.add_argument("--steps_per_call", type=int, nargs="+", default=[10, 100],
+            help="Batch sizes to test.")
+    parser.add_argument("--dt", type=float, default=0.01)
+    parser.add_argument("--export_time", type=float, default=1.0,
+            help="Export interval, batches end at export times.")
+    args = parser.parse_args()
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for resolution in args.resolutions:
+            mesh_filename = create_test_mesh(resolution, directory)
+            print(f"Test mesh: {resolution**3} points")
+
+            root, _ = create_scene(mesh_filename, args.dt, batched=False)
+            start = time.time()
+            run_single_call(root, args.num_steps)
+            t_ref = (time.time() - start)/args.num_steps
+            print(f"\tsingle animateNSteps call: {t_ref*1e3:.3f} ms per step")
+
+            for steps_per_call in [1] + args.steps_per_call:
+                block = types.SimpleNamespace(steps_per_call=steps_per_call,
+                        export_time=args.export_time, max_simulation_time=1e10,
+                        max_time_before_timeout=1e10)
+                root, stepper = create_scene(mesh_filename, args.dt, batched=steps_per_call > 1)
+                start = time.time()
+                run_loop(root, stepper, block, args.num_steps)
+                t = (time.time() - start)/args.num_steps
+                print(f"\tsteps_per_call={steps_per_call}: {t*1e3:.3f} ms per step, " +\
+                        f"Python overhead {(t - t_ref)*1e6:.1f} us per step")
+        os.chdir(working_directory)
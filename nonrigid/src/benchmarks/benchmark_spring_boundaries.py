@@ -0,0 +1,129 @@
+###############################################################
+# Spring boundaries benchmark
+# -------------------------------------------------------------
+# Measures the time per simulation step of a Tissue scene
+# (core.sofa.objects.tissue.Tissue) with ligament-like springs
+# (core.sofa.objects.boundaries.SpringBoundaries), depending on
+# the number of springs. The springs are either created as one
+# SpringBoundaries object (as SofaSimulation.createGraph does)
+# or as one SpringBoundaries object per spring (as it used to).
+# With --incremental, the stiffness of the springs is ramped up
+# over the first steps, which are timed separately.
+# Run "python3 src/benchmarks/benchmark_spring_boundaries.py --help"
+# for an overview of parameters.
+###############################################################
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from vtk import vtkXMLUnstructuredGridReader
+from vtk.util.numpy_support import vtk_to_numpy
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import Sofa
+import Sofa.Core
+import Sofa.Simulation
+import SofaRuntime
+SofaRuntime.importPlugin("Sofa.Component")
+
+from core.sofa.components.header import add_scene_header
+from core.sofa.components.forcefield import Material, ConstitutiveModel
+from core.sofa.components.solver import SolverType, TimeIntegrationType
+from core.sofa.objects.tissue import Tissue
+from core.sofa.objects.boundaries import SpringBoundaries
+from benchmark_sofa_stepping import create_test_mesh
+
+def create_scene(
+    mesh_filename: str,
+    num_springs: int,
+    batched: bool,
+    incremental: bool,
+    ramp_steps: int,
+    dt: float,
+    seed: int = 0,
+):
+    root = Sofa.Core.Node("root")
+    root.animate = True
+    add_scene_header(root, gravity=[0, 0, -9.81], dt=dt, alarm_distance=None,
+            contact_distance=None, friction=None)
+    tissue = root.addObject(Tissue(root, simulation_mesh_filename=mesh_filename,
+            material=Material(young_modulus=5000, poisson_ratio=0.45,
+                constitutive_model=ConstitutiveModel.COROTATED, mass_density=1000),
+            solver=SolverType.CG, analysis=TimeIntegrationType.EULER))
+
+    # Attach the springs to random nodes, the other end lies 1 cm above the node:
+    reader = vtkXMLUnstructuredGridReader()
+    reader.SetFileName(mesh_filename)
+    reader.Update()
+    positions = vtk_to_numpy(reader.GetOutput().GetPoints().GetData()).astype(np.float64)
+    rng = np.random.default_rng(seed)
+    start_indices = rng.choice(len(positions), size=num_springs, replace=True)
+    end_points = positions[start_indices] + np.array([0, 0, 0.01])
+    kwargs = dict(attached_object=tissue, stiffness=10.0, active=True, incremental=incremental,
+            num_steps=ramp_steps, view=False)
+
+    start = time.time()
+    if batched:
+        root.addObject(SpringBoundaries(tissue.node, start_indices=start_indices.tolist(),
+                end_points=end_points, rest_length=0.005, name="Springs", **kwargs))
+    else:
+        for i in range(num_springs):
+            root.addObject(SpringBoundaries(tissue.node, start_indices=[int(start_indices[i])],
+                    end_points=[end_points[i].tolist()], rest_length=0.005, name=f"Springs{i}",
+                    **kwargs))
+    creation_time = time.time() - start
+    Sofa.Simulation.init(root)
+    return root, creation_time
+
+def time_steps(
+    root,
+    num_steps: int,
+) ->float:
+    """ Mean time per step (in seconds). """
+    start = time.time()
+    for _ in range(num_steps):
+        Sofa.Simulation.animate(root, root.dt.value)
+    return (time.time() - start)/num_steps
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser("Spring boundaries benchmark")
+    parser.add_argument("--num_springs", type=int, nargs="+", default=[10, 100, 500],
+            help="Numbers of springs to test.")
+    parser.add_argument("--resolution", type=int, default=8,
+            help="Number of points along each axis of the test mesh.")
+    parser.add_argument("--num_steps", type=int, default=50,
+            help="Number of timed steps (after the stiffness ramp, if any).")
+    parser.add_argument("--incremental", action="store_true",
+            help="Ramp up the spring stiffness over the first --ramp_steps steps.")
+    parser.add_argument("--ramp_steps", type=int, default=20)
+    parser.add_argument("--dt", type=float, default=0.01)
+    parser.add_argument("--skip_separate", action="store_true",
+            help="Only test springs in one SpringBoundaries object (creating one object " +\
+                    "per spring is slow for many springs).")
+    args = parser.parse_args()
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        mesh_filename = create_test_mesh(args.resolution, directory)
+        print(f"Test mesh: {args.resolution**3} points")
+        modes = [True] if args.skip_separate else [True, False]
+        for num_springs in args.num_springs:
+            print(f"{num_springs} springs:")
+            for batched in modes:
+                root, creation_time = create_scene(mesh_filename, num_springs, batched,
+                        args.incremental, args.ramp_steps, args.dt)
+                msg = f"\t{'one SpringBoundaries' if batched else 'one SpringBoundaries per spring'}: " +\
+                        f"creation {creation_time*1e3:.1f} ms"
+                if args.incremental:
+                    t_ramp = time_steps(root, args.ramp_steps)
+                    msg += f", {t_ramp*1e3:.3f} ms per step during the stiffness ramp"
+                t = time_steps(root, args.num_steps)
+                msg += f", {t*1e3:.3f} ms per step"
+                print(msg)
+        os.chdir(working_directory)
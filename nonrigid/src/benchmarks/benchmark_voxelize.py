@@ -0,0 +1,129 @@
+###############################################################
+# Voxelization benchmark
+# -------------------------------------------------------------
+# Compares the batched distance field functions in
+# blocks/voxelization/voxelize.py against the previous
+# per-grid-point implementation, for several grid resolutions.
+# Run "python3 src/benchmarks/benchmark_voxelize.py --help" for an
+# overview of parameters.
+###############################################################
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+from vtk import *
+from vtk.util.numpy_support import vtk_to_numpy
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from blocks.voxelization.voxelize import create_grid, distance_field, \
+        distance_field_from_cloud, enclosed_points
+
+def reference_distance_field(
+    mesh: vtkPolyData,
+    grid: vtkStructuredGrid,
+    signed: bool = False,
+) ->np.ndarray:
+    """ Previous implementation: one vtkCellLocator query and IsInside call per grid point. """
+    cellLocator = vtkCellLocator()
+    cellLocator.SetDataSet( mesh )
+    cellLocator.BuildLocator()
+    dist = np.empty( grid.GetNumberOfPoints() )
+    for i in range(0, grid.GetNumberOfPoints() ):
+        testPoint = [0]*3
+        grid.GetPoint( i, testPoint )
+        cID, subID, dist2 = mutable(0), mutable(0), mutable(0.0)
+        closestPoint = [0]*3
+        cellLocator.FindClosestPoint( testPoint, closestPoint, cID, subID, dist2 )
+        dist[i] = math.sqrt(dist2)
+    if signed:
+        pts = vtkPolyData()
+        pts.SetPoints( grid.GetPoints() )
+        enclosedPointSelector = vtkSelectEnclosedPoints()
+        enclosedPointSelector.CheckSurfaceOn()
+        enclosedPointSelector.SetInputData( pts )
+        enclosedPointSelector.SetSurfaceData( mesh )
+        enclosedPointSelector.SetTolerance( 1e-9 )
+        enclosedPointSelector.Update()
+        for i in range(0, grid.GetNumberOfPoints() ):
+            if enclosedPointSelector.IsInside(i):
+                dist[i] = -dist[i]
+    return dist
+
+def reference_distance_field_from_cloud(
+    cloud: vtkDataSet,
+    grid: vtkStructuredGrid,
+) ->np.ndarray:
+    """ Previous implementation: one vtkPointLocator query per grid point. """
+    pointLocator = vtkPointLocator()
+    pointLocator.SetDataSet( cloud )
+    pointLocator.BuildLocator()
+    dist = np.empty( grid.GetNumberOfPoints() )
+    for i in range(0, grid.GetNumberOfPoints() ):
+        testPoint = [0]*3
+        grid.GetPoint( i, testPoint )
+        closestPoint = [0]*3
+        cloud.GetPoint( pointLocator.FindClosestPoint( testPoint ), closestPoint )
+        dist[i] = math.sqrt( vtkMath.Distance2BetweenPoints( testPoint, closestPoint ) )
+    return dist
+
+def create_test_surface(
+    resolution: int,
+) ->vtkPolyData:
+    """ A closed, slightly irregular surface of roughly organ size. """
+    sphere = vtkSphereSource()
+    sphere.SetRadius( 0.08 )
+    sphere.SetThetaResolution( resolution )
+    sphere.SetPhiResolution( resolution )
+    sphere.Update()
+    surface = sphere.GetOutput()
+    points = vtk_to_numpy( surface.GetPoints().GetData() )
+    points *= np.array([1.0, 0.7, 0.5])
+    return surface
+
+def timed(
+    fnc,
+    *args,
+    **kwargs,
+):
+    start = time.time()
+    result = fnc(*args, **kwargs)
+    return result, time.time() - start
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser("Voxelization benchmark")
+    parser.add_argument("--num_cells", type=int, nargs="+", default=[32, 64, 128],
+            help="Grid resolutions to benchmark.")
+    parser.add_argument("--size", type=float, default=0.3,
+            help="Side-length of the grid in meters.")
+    parser.add_argument("--surface_resolution", type=int, default=100,
+            help="Theta and phi resolution of the test surface.")
+    parser.add_argument("--skip_reference", action="store_true",
+            help="Do not run the previous (slow) per-point implementation.")
+    args = parser.parse_args()
+
+    surface = create_test_surface( args.surface_resolution )
+    print(f"Test surface: {surface.GetNumberOfPoints()} points, {surface.GetNumberOfCells()} triangles")
+
+    for num_cells in args.num_cells:
+        print(f"num_cells: {num_cells} ({num_cells**3} grid points)")
+        for name, fnc, ref_fnc, kwargs in (
+                ("distance_field", distance_field, reference_distance_field, {}),
+                ("distance_field (signed)", distance_field, reference_distance_field,
+                    {"signed": True}),
+                ("distance_field_from_cloud", distance_field_from_cloud,
+                    reference_distance_field_from_cloud, {}),
+                ):
+            grid = create_grid( args.size, num_cells )
+            _, t = timed( fnc, surface, grid, "df", **kwargs )
+            result = vtk_to_numpy( grid.GetPointData().GetArray("df") )
+            msg = f"\t{name}: {t:.3f} s"
+            if not args.skip_reference:
+                reference, t_ref = timed( ref_fnc, surface, grid, **kwargs )
+                err = np.abs( result - reference ).max()
+                msg += f" (previous: {t_ref:.3f} s, speedup: {t_ref/t:.1f}x, max abs. diff: {err:.2e})"
+            print(msg)
@@ -0,0 +1,195 @@
+###############################################################
+# vtkutils micro-benchmarks
+# -------------------------------------------------------------
+# Times the array-based helpers in utils/vtkutils.py on meshes
+# of increasing size and compares them against the previous
+# per-point implementations.
+# Run "python3 src/benchmarks/benchmark_vtkutils.py --help" for an
+# overview of parameters.
+###############################################################
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+from vtk import *
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import vtkutils
+
+def reference_calc_displacement(
+    mesh_initial: vtkDataSet,
+    mesh_deformed: vtkDataSet,
+    mesh_initial_indices: list,
+) ->vtkFloatArray:
+    """ Previous implementation: fills the array tuple by tuple. """
+    displacement = vtkFloatArray()
+    displacement.SetNumberOfComponents(3)
+    displacement.SetNumberOfTuples(mesh_initial.GetNumberOfPoints())
+    for i in range(mesh_initial.GetNumberOfPoints()):
+        displacement.SetTuple3(i, 0.0, 0.0, 0.0)
+    for idx_deformed, idx_initial in enumerate(mesh_initial_indices):
+        p1 = mesh_initial.GetPoint(idx_initial)
+        p2 = mesh_deformed.GetPoint(idx_deformed)
+        displacement.SetTuple3(idx_initial, p2[0]-p1[0], p2[1]-p1[1], p2[2]-p1[2])
+    return displacement
+
+def reference_find_corresponding_indices(
+    mesh: vtkDataSet,
+    points: np.ndarray,
+) ->list:
+    """ Previous implementation: one vtkPointLocator query per point. """
+    locator = vtkPointLocator( )
+    locator.SetDataSet( mesh )
+    locator.SetNumberOfPointsPerBucket(1)
+    locator.BuildLocator()
+    return [locator.FindClosestPoint( point ) for point in points]
+
+def reference_calc_geodesic_distance(
+    mesh: vtkDataSet,
+    node_id: int,
+) ->vtkDoubleArray:
+    """ Previous implementation: FIFO front with re-queuing, neighbours via list lookups. """
+    neighbors = {}
+    for i in range(mesh.GetNumberOfPoints()):
+        neighbors[i] = vtkutils.get_connected_vertices(mesh, i)
+    distance = vtkDoubleArray()
+    distance.SetNumberOfTuples(mesh.GetNumberOfPoints())
+    distance.SetNumberOfComponents(1)
+    distance.Fill(1e10)
+    front = [node_id]
+    distance.SetTuple1(node_id, 0)
+    while len(front) > 0:
+        cur_id = front.pop(0)
+        cur_pt = mesh.GetPoint(cur_id)
+        cur_dist = distance.GetTuple1(cur_id)
+        for n_id in neighbors[cur_id]:
+            n_pt = mesh.GetPoint(n_id)
+            new_dist = math.sqrt(vtkMath.Distance2BetweenPoints(n_pt, cur_pt)) + cur_dist
+            if new_dist < distance.GetTuple1(n_id):
+                distance.SetTuple1(n_id, new_dist)
+                if not n_id in front:
+                    front.append(n_id)
+    return distance
+
+def create_test_mesh(
+    resolution: int,
+) ->vtkPolyData:
+    sphere = vtkSphereSource()
+    sphere.SetRadius( 0.1 )
+    sphere.SetThetaResolution( resolution )
+    sphere.SetPhiResolution( resolution )
+    sphere.Update()
+    return sphere.GetOutput()
+
+def deform(
+    mesh: vtkPolyData,
+    rnd: np.random.Generator,
+) ->vtkPolyData:
+    deformed = vtkPolyData()
+    deformed.DeepCopy( mesh )
+    points = vtk_to_numpy( deformed.GetPoints().GetData() )
+    points += rnd.normal( 0, 0.005, points.shape )
+    return deformed
+
+def timed(
+    fnc,
+    *args,
+    repetitions: int = 1,
+):
+    start = time.time()
+    for i in range(repetitions):
+        result = fnc(*args)
+    return result, (time.time() - start)/repetitions
+
+def report(
+    name: str,
+    t: float,
+    t_ref: float,
+    matches: bool,
+) ->None:
+    msg = f"\t{name}: {t*1000:.2f} ms (previous: {t_ref*1000:.2f} ms, " +\
+            f"speedup: {t_ref/t:.1f}x)"
+    if not matches:
+        msg += " RESULTS DIFFER!"
+    print(msg)
+
+def benchmark_calc_displacement(
+    mesh: vtkPolyData,
+    rnd: np.random.Generator,
+    repetitions: int,
+) ->None:
+    deformed = deform( mesh, rnd )
+    # Correspondences for a random subset of the points (as for partial surfaces):
+    indices = rnd.choice( mesh.GetNumberOfPoints(), mesh.GetNumberOfPoints()//2,
+            replace=False ).tolist()
+    subset = vtkPolyData()
+    subset_points = vtkPoints()
+    subset_points.SetData( numpy_to_vtk( vtk_to_numpy( deformed.GetPoints().GetData() )[indices] ) )
+    subset.SetPoints( subset_points )
+
+    result, t = timed( vtkutils.calc_displacement, mesh, subset, indices,
+            repetitions=repetitions )
+    reference, t_ref = timed( reference_calc_displacement, mesh, subset, indices,
+            repetitions=repetitions )
+    matches = np.allclose( vtk_to_numpy(result), vtk_to_numpy(reference), atol=1e-7 )
+    report( "calc_displacement", t, t_ref, matches )
+
+def benchmark_find_corresponding_indices(
+    mesh: vtkPolyData,
+    rnd: np.random.Generator,
+    repetitions: int,
+) ->None:
+    points = vtk_to_numpy( deform( mesh, rnd ).GetPoints().GetData() )
+    result, t = timed( vtkutils.find_corresponding_indices, mesh, points,
+            repetitions=repetitions )
+    reference, t_ref = timed( reference_find_corresponding_indices, mesh, points,
+            repetitions=repetitions )
+    # Ties may be resolved differently, so compare the distances instead of the indices:
+    mesh_points = vtk_to_numpy( mesh.GetPoints().GetData() )
+    dist = np.linalg.norm( mesh_points[result] - points, axis=1 )
+    dist_ref = np.linalg.norm( mesh_points[reference] - points, axis=1 )
+    report( "find_corresponding_indices", t, t_ref, np.allclose( dist, dist_ref ) )
+
+def benchmark_calc_geodesic_distance(
+    mesh: vtkPolyData,
+    rnd: np.random.Generator,
+    repetitions: int,
+) ->None:
+    node_id = int( rnd.integers( mesh.GetNumberOfPoints() ) )
+    result, t = timed( vtkutils.calc_geodesic_distance, mesh, node_id,
+            repetitions=repetitions )
+    reference, t_ref = timed( reference_calc_geodesic_distance, mesh, node_id,
+            repetitions=repetitions )
+    matches = np.allclose( vtk_to_numpy(result), vtk_to_numpy(reference) )
+    report( "calc_geodesic_distance", t, t_ref, matches )
+
+# All benchmarks. Each is called with a test mesh, a random generator and the number
+# of repetitions:
+BENCHMARKS = {
+    "calc_displacement": benchmark_calc_displacement,
+    "find_corresponding_indices": benchmark_find_corresponding_indices,
+    "calc_geodesic_distance": benchmark_calc_geodesic_distance,
+}
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser("vtkutils micro-benchmarks")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[50, 100, 200],
+            help="Theta and phi resolutions of the test meshes.")
+    parser.add_argument("--repetitions", type=int, default=3,
+            help="Number of times each function is run. The average time is reported.")
+    parser.add_argument("--benchmarks", type=str, nargs="+", choices=BENCHMARKS.keys(),
+            default=list(BENCHMARKS.keys()), help="Benchmarks to run.")
+    args = parser.parse_args()
+
+    rnd = np.random.default_rng( 0 )
+    for resolution in args.resolutions:
+        mesh = create_test_mesh( resolution )
+        print(f"Test mesh: {mesh.GetNumberOfPoints()} points, {mesh.GetNumberOfCells()} cells")
+        for name in args.benchmarks:
+            BENCHMARKS[name]( mesh, rnd, args.repetitions )
@@ -1,6 +1,20 @@
-from vtk import vtkPoints, vtkAdaptiveSubdivisionFilter, vtkDoubleArray, vtkPerlinNoise, vtkThreshold
+from vtk import vtkPoints, vtkAdaptiveSubdivisionFilter, vtkDataObject, vtkThreshold
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+import numpy as np
 import random
 
+def numpy_rng( rnd=random ):
+    """ Create a numpy random generator which is seeded from a python random generator.
+
+    This keeps the numpy random numbers reproducible for a seeded random.Random (e.g.
+    the sample's random generator).
+
+    Arguments:
+        rnd (random.Random or the random module):
+            generator to draw the seed from
+    """
+    return np.random.default_rng( rnd.getrandbits( 64 ) )
+
 def add_gauss_noise_to_surface( surface, sigma=0.001, rnd=random ):
     """ Take a surface and move the points randomly.
     Note: This replaces the surface's points with a new vtkPoints object.
@@ -10,19 +24,75 @@ def add_gauss_noise_to_surface( surface, sigma=0.001, rnd=random ):
             surface data
         sigma (float):
             standard deviation of the gaussian noise added to the point positions
+        rnd (random.Random or the random module):
+            random generator, used to seed the noise
     """
     pts = vtkPoints()
-    for i in range( surface.GetNumberOfPoints() ):
-        pt = surface.GetPoint( i )
-        x = rnd.gauss( pt[0], sigma )
-        y = rnd.gauss( pt[1], sigma )
-        z = rnd.gauss( pt[2], sigma )
-        pts.InsertNextPoint( (x,y,z) )
+    pts.DeepCopy( surface.GetPoints() )
+    # Perturb the copied point buffer in place:
+    points = vtk_to_numpy( pts.GetData() )
+    points += numpy_rng( rnd ).normal( 0, sigma, points.shape ).astype( points.dtype )
+    pts.Modified()
 
     surface.SetPoints( pts )
 
     return surface
 
+def _perlin_frand( s ):
+    # Hash from vtkPerlinNoise, computed with 32 bit integer overflow:
+    s = s.astype( np.uint32 )
+    s = (s << np.uint32(13)) ^ s
+    s = (s*(s*s*np.uint32(15731) + np.uint32(789221)) + np.uint32(1376312589)) & np.uint32(0x7fffffff)
+    return 1.0 - s.astype( np.float64 )/1073741824.0
+
+def _perlin_lattice( x, y, z ):
+    # Gradients (first three entries) and value (last entry) at integer lattice points:
+    return np.stack( [_perlin_frand( 67*x + 59*y + 71*z ),
+                      _perlin_frand( 73*x + 79*y + 83*z ),
+                      _perlin_frand( 89*x + 97*y + 101*z ),
+                      _perlin_frand( 103*x + 107*y + 109*z )], axis=-1 )
+
+def _perlin_hermite( p0, p1, r0, r1, t ):
+    tt = t*t
+    return p0*((2.0*t - 3.0)*tt + 1.0) + p1*(-2.0*t + 3.0)*tt + \
+            r0*((t - 2.0)*t + 1.0)*t + r1*(t - 1.0)*tt
+
+def _perlin_interpolate( i, n, xlim, xarg ):
+    # Recursively interpolate the lattice values along the axes n-1, ..., 0:
+    if n == 0:
+        return _perlin_lattice( xlim[:,0,i & 1], xlim[:,1,(i >> 1) & 1], xlim[:,2,i >> 2] )
+    n -= 1
+    f0 = _perlin_interpolate( i, n, xlim, xarg )
+    f1 = _perlin_interpolate( i | 1 << n, n, xlim, xarg )
+    t = xarg[:,n:n+1]
+    f = (1.0 - t)*f0 + t*f1
+    f[:,3] = _perlin_hermite( f0[:,3], f1[:,3], f0[:,n], f1[:,n], xarg[:,n] )
+    return f
+
+def perlin_noise( points, frequency, phase, amplitude=1.0 ):
+    """ Evaluate 3D perlin noise at many points at once.
+
+    Gives the same values as vtkPerlinNoise.EvaluateFunction (with the same frequency,
+    phase and amplitude), but evaluates all points in a few array operations.
+
+    Arguments:
+        points (np.ndarray):
+            Nx3 array of positions
+        frequency (float or tuple of 3 floats):
+            noise frequency along each axis
+        phase (tuple of 3 floats):
+            noise phase along each axis
+        amplitude (float):
+            noise amplitude
+    Returns:
+        np.ndarray: N noise values in the range (-amplitude, amplitude)
+    """
+    x = np.asarray( points, dtype=np.float64 )*np.asarray( frequency, dtype=np.float64 ) - \
+            np.asarray( phase, dtype=np.float64 )*2.0
+    lower = np.floor( x ).astype( np.int64 )
+    xlim = np.stack( [lower, lower + 1], axis=-1 )
+    return _perlin_interpolate( 0, 3, xlim, x - lower )[:,3]*amplitude
+
 def subdivide_surface( surface, subdivFactor ):
     """
     Subdivide a surface.
@@ -34,7 +104,7 @@ def subdivide_surface( surface, subdivFactor ):
 
     subdiv_filter = vtkAdaptiveSubdivisionFilter()
     max_new_triangles = int( surface.GetNumberOfCells()*(subdivFactor-1) )
-    subdiv_filter.SetMaximumNumberOfTriangles( maxNewTriangles )
+    subdiv_filter.SetMaximumNumberOfTriangles( max_new_triangles )
     subdiv_filter.SetMaximumTriangleArea( 0.00001 )
     subdiv_filter.SetMaximumEdgeLength( 0.00001 )
     subdiv_filter.SetInputData( surface )
@@ -43,7 +113,7 @@ def subdivide_surface( surface, subdivFactor ):
 
     return surface
     
-def sparsify_surface( surface, scale=1, shift=0, frequency=9 ):
+def sparsify_surface( surface, scale=1, shift=0, frequency=9, rnd=random ):
     """ Randomly "sparsifies" a point cloud.
 
     This function considers removing every point according to a 3D perlin noise function:
@@ -59,38 +129,35 @@ def sparsify_surface( surface, scale=1, shift=0, frequency=9 ):
         frequency (float):
             Noise frequency. High frequency leads to many small sparse areas, low frequency leads to fewer, larger ones.
             Default: 9
+        rnd (random.Random or the random module):
+            random generator, used for the noise phase and the removal decisions
     """
 
-    removal = vtkDoubleArray()
-    removal.SetName( "removeThreshold" )
-    removal.SetNumberOfTuples( surface.GetNumberOfPoints() )
-    removal.SetNumberOfComponents( 1 )
-    removal.Fill(0)
-    surface.GetPointData().AddArray( removal )
-
-    noise = vtkPerlinNoise()
-    noise.SetFrequency( frequency, frequency, frequency )
-    noise.SetPhase( random.random()*150, random.random()*150, random.random()*150 )
+    phase = (rnd.random()*150, rnd.random()*150, rnd.random()*150)
+    points = vtk_to_numpy( surface.GetPoints().GetData() )
 
-    for i in range( surface.GetNumberOfPoints() ):
-        pt = surface.GetPoint( i )
+    # Get random value at each point's position in the range of (0,1)
+    probability = (perlin_noise( points, frequency, phase ) + 1)/2
 
-        # Get random value at the point's position in the range of (0,1)
-        rnd = (noise.EvaluateFunction( pt ) + 1)/2
+    # Adjust the random value to the strength:
+    probability = probability*scale + shift
 
-        # Adjust the random value to the strength:
-        rnd = rnd*scale + shift
-
-        # Depending on random value...
-        if random.uniform( 0, 1 ) < rnd:
-            # Set up for removal:
-            removal.SetTuple1( i, 1 )
+    # Depending on random value, set up for removal:
+    remove = numpy_rng( rnd ).uniform( 0, 1, len(points) ) < probability
+    removal = numpy_to_vtk( remove.astype( np.float64 ), deep=True )
+    removal.SetName( "removeThreshold" )
+    surface.GetPointData().AddArray( removal )
 
     thresh = vtkThreshold()
     thresh.SetInputData( surface )
     thresh.SetInputArrayToProcess( 0,0,0,
             vtkDataObject.FIELD_ASSOCIATION_POINTS, "removeThreshold" )
-    thresh.ThresholdByLower( 0.5 ) # Everything higher than 0.5 will be removed
+    # Everything higher than 0.5 will be removed:
+    if hasattr( thresh, "SetThresholdFunction" ):
+        thresh.SetThresholdFunction( vtkThreshold.THRESHOLD_LOWER )
+        thresh.SetLowerThreshold( 0.5 )
+    else:   # VTK < 9.1
+        thresh.ThresholdByLower( 0.5 )
     thresh.Update()
 
     surface = thresh.GetOutput()
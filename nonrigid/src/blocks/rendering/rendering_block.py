@@ -12,6 +12,7 @@ from blocks.scene_objects.scene_object_generator_block import SceneObjectGenerat
 from core.log import Log
 from core.exceptions import SampleProcessingException
 from core.objects.sceneobjects import *
+from utils.blender_worker import get_blender_worker
 
 
 class RenderingBlock(PipelineBlock):
@@ -26,10 +27,17 @@ class RenderingBlock(PipelineBlock):
         max_time_before_timeout: int = 300,       # in seconds
         use_cpu: bool = False,
         max_num_frames: int = 15,
-        simulation_block: PipelineBlock = None
+        simulation_block: PipelineBlock = None,
+        use_persistent_blender: bool = False,
     ) ->None:
         """
         Args:
+            use_persistent_blender: Render in a blender process which is kept alive between
+                samples (see :class:`utils.blender_worker.BlenderWorker`) instead of starting
+                blender for every sample. Off by default, since this only pays off when many
+                samples are processed by the same process: unless the Pipeline runs with
+                run_sequential=True, its worker processes are recycled every
+                max_samples_per_worker samples, which restarts blender too.
         """
 
         if use_cpu:
@@ -61,6 +69,7 @@ class RenderingBlock(PipelineBlock):
         self.target_object = target_object
         self.objects_to_render = objects_to_render
         self.max_time_before_timeout = max_time_before_timeout   # in seconds
+        self.use_persistent_blender = use_persistent_blender
 
         super().__init__(inputs, outputs, optional_outputs=optional_outputs)
 
@@ -76,17 +85,8 @@ class RenderingBlock(PipelineBlock):
             sim_frames = int(sample.get_statistic( self.simulation_block, "simulation_frames" ))
             num_frames = min( sim_frames, num_frames )
 
-        a = [self.blender_exec]
-        a += ["--background"]
-        a += ["-noaudio"]
-        a += ["--threads"]
-        a += ["1"]
-        a += ["--python-exit-code"]
-        a += ["1"]
-        a += ["--python"]
-        a += ["src/blocks/rendering/render.py"]
-        a += ["--"]
-        a += ["--random_seed"]
+        script = "src/blocks/rendering/render.py"
+        a = ["--random_seed"]
         a += [str(sample.id)]
         a += ["--num_frames"]
         a += [str(num_frames)]
@@ -106,12 +106,22 @@ class RenderingBlock(PipelineBlock):
             sample.flush_data( regex = pattern )
             a += ["--other_object", json.dumps(o)]
 
+        if not self.use_persistent_blender:
+            a = [self.blender_exec, "--background", "-noaudio", "--threads", "1",
+                    "--python-exit-code", "1", "--python", script, "--"] + a
+
         #msg = "Running blender:\n\t" + " ".join(a).replace("{","'{").replace("}", "}'")
         msg = "Running blender"#)\n\t" + " ".join(a).replace("{","'{").replace("}", "}'")
         Log.log(module="RenderingBlock", msg=msg)
         Log.log(module="RenderingBlock", msg=" ".join(a))
         try:
-            p = subprocess.run(a, capture_output=True, text=True, timeout=self.max_time_before_timeout)
+            if self.use_persistent_blender:
+                worker = get_blender_worker(self.blender_exec)
+                p = worker.run(script, a, timeout=self.max_time_before_timeout)
+                sample.add_statistic(self, "blender_startup_time", worker.last_startup_time)
+                Log.log(module="RenderingBlock", msg=worker.report())
+            else:
+                p = subprocess.run(a, capture_output=True, text=True, timeout=self.max_time_before_timeout)
             Log.log(module="RenderingBlock", msg=p.stdout)
             if p.stderr != None and len(p.stderr.strip()) > 0:
                 Log.log(module="RenderingBlock", severity="ERROR", msg=p.stderr.strip())
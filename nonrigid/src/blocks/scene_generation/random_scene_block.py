@@ -12,7 +12,9 @@ from blocks.scene_objects.scene_object_generator_block import SceneObjectGenerat
 from core.log import Log
 from core.exceptions import SampleProcessingException
 from core.objects.sceneobjects import *
+from utils.blender_worker import get_blender_worker
 from .vascusynth_wrapper.vasculature_generator import LiverVasculatureGenerator
+from .vascusynth_wrapper.cache import VascuSynthCache
 
 
 class RandomSceneBlock(PipelineBlock):
@@ -26,6 +28,10 @@ class RandomSceneBlock(PipelineBlock):
         vascusynth_algorithm_params: dict = {},
         vascusynth_map_generation_params: dict = {},
         max_trials_vessel_generation = 10,
+        use_persistent_blender: bool = False,
+        vascusynth_cache_dir: str = None,
+        vascusynth_separate_runs: bool = False,
+        max_parallel_vascusynth_runs: int = 1,
     ) ->None:
         """
         Args:
@@ -35,6 +41,21 @@ class RandomSceneBlock(PipelineBlock):
             vascusynth_map_generation_params: Parameters to customise the MapGenerator.
             max_trials_vessel_generation: How often VascuSynth is called with the same parameter
                 files before quitting.
+            use_persistent_blender: Generate the scene in a blender process which is kept
+                alive between samples (see :class:`utils.blender_worker.BlenderWorker`)
+                instead of starting blender for every sample. Off by default, since this only
+                pays off when many samples are processed by the same process: unless the
+                Pipeline runs with run_sequential=True, its worker processes are recycled
+                every max_samples_per_worker samples, which restarts blender too.
+            vascusynth_cache_dir: If set, voxelized organs and generated vessel trees are
+                cached in this folder (see :class:`VascuSynthCache`), so samples which use the
+                same organ source file skip the voxelization, and VascuSynth is skipped
+                entirely when it is called with identical inputs (incl. the random seed) again.
+            vascusynth_separate_runs: Generate every vessel tree of a sample in its own,
+                concurrently running VascuSynth process. The trees are then generated
+                independently of each other.
+            max_parallel_vascusynth_runs: Maximum number of VascuSynth processes per pipeline
+                worker process that may run at the same time.
         """
         # object generation with blender
         blender_found = shutil.which("blender")
@@ -66,6 +87,7 @@ class RandomSceneBlock(PipelineBlock):
                         outputs.append(filename)
 
         self.max_time_before_timeout = max_time_before_timeout   # in seconds
+        self.use_persistent_blender = use_persistent_blender
 
         # vessel tree generation with VascuSynth
         vascusynth_path = os.environ.get("VASCUSYNTH_PATH")
@@ -78,6 +100,9 @@ class RandomSceneBlock(PipelineBlock):
         self.vascusynth_algorithm_params = vascusynth_algorithm_params
         self.vascusynth_map_generation_params = vascusynth_map_generation_params
         self.max_trials_vessel_generation = max_trials_vessel_generation
+        self.vascusynth_cache_dir = vascusynth_cache_dir
+        self.vascusynth_separate_runs = vascusynth_separate_runs
+        self.max_parallel_vascusynth_runs = max_parallel_vascusynth_runs
 
         super().__init__(inputs, outputs, optional_outputs=optional_outputs)
 
@@ -89,17 +114,8 @@ class RandomSceneBlock(PipelineBlock):
         #####################################################################################
         # Blender scene generation
 
-        a = ["blender"]
-        a += ["--background"]
-        a += ["-noaudio"]
-        a += ["--threads"]
-        a += ["1"]
-        a += ["--python-exit-code"]
-        a += ["1"]
-        a += ["--python"]
-        a += ["src/blocks/scene_generation/generation_utils/generate_laparoscopic_scene.py"]
-        a += ["--"]
-        a += ["--random_seed"]
+        script = "src/blocks/scene_generation/generation_utils/generate_laparoscopic_scene.py"
+        a = ["--random_seed"]
         a += [str(sample.id)]
         a += ["--outdir"]
         a += [sample.path]
@@ -151,12 +167,22 @@ class RandomSceneBlock(PipelineBlock):
                 args["size"] = (s.size_x, s.size_y, s.size_z)
                 a += ["--add_tumor", json.dumps(args)]
 
+        if not self.use_persistent_blender:
+            a = ["blender", "--background", "-noaudio", "--threads", "1",
+                    "--python-exit-code", "1", "--python", script, "--"] + a
+
         #msg = "Running blender:\n\t" + " ".join(a).replace("{","'{").replace("}", "}'")
         msg = "Running blender"#)\n\t" + " ".join(a).replace("{","'{").replace("}", "}'")
         Log.log(module="RandomSceneBlock", msg=msg)
         sample.write_log_new_subsection("blender")
         try:
-            p = subprocess.run(a, capture_output=True, text=True, timeout=self.max_time_before_timeout)
+            if self.use_persistent_blender:
+                worker = get_blender_worker("blender")
+                p = worker.run(script, a, timeout=self.max_time_before_timeout)
+                sample.add_statistic(self, "blender_startup_time", worker.last_startup_time)
+                Log.log(module="RandomSceneBlock", msg=worker.report())
+            else:
+                p = subprocess.run(a, capture_output=True, text=True, timeout=self.max_time_before_timeout)
             # Check if running was successful:
             # Note that the returncode is only != 0 because --python-exit-code 1 was set above, otherwise we
             # would not be notified about any issues.
@@ -260,11 +286,15 @@ class RandomSceneBlock(PipelineBlock):
                                               **self.vascusynth_algorithm_params,
                                               )
 
+        cache = None
+        if self.vascusynth_cache_dir:
+            cache = VascuSynthCache(self.vascusynth_cache_dir)
+
         # generate oxygen demand map and supply map from the containing organ object
         containing_organ = sample._read(organ_scene_object.filename)
         msg = "Generating demand maps"
         Log.log("RandomSceneBlock", msg=msg, severity="INFO")
-        demand_map, supply_map = generator.generate_demand_maps(containing_organ,
+        demand_map, supply_map = generator.generate_demand_maps(containing_organ, cache=cache,
                                                                 **self.vascusynth_map_generation_params)
         sample.write(organ_scene_object.filename_oxygen_demand_map, demand_map)
         sample.write(organ_scene_object.filename_supply_map, supply_map)
@@ -300,7 +330,10 @@ class RandomSceneBlock(PipelineBlock):
             try:
                 msg = f"VascuSynth call trial {i}"
                 Log.log(module="RandomSceneBlock", msg=msg, severity="INFO")
-                stdout, stderr = generator.generate_structure(sample.id, sample_directory=sample.path)
+                stdout, stderr = generator.generate_structure(sample.id, sample_directory=sample.path,
+                        cache=cache, separate_runs=self.vascusynth_separate_runs,
+                        max_parallel_runs=self.max_parallel_vascusynth_runs)
+                sample.add_statistic(self, "vascusynth_from_cache", generator.structure_from_cache)
 
                 output = f"Subprocess stdout:\n{stdout}\n"
                 output += f"Subprocess stderr:\n{stderr}\n"
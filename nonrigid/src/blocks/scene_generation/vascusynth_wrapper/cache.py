@@ -0,0 +1,94 @@
+import os
+import shutil
+import hashlib
+import numpy as np
+from typing import Union
+from vtk import vtkPolyData
+
+from core.log import Log
+from utils.file_cache import FileCache
+
+
+class VascuSynthCache(FileCache):
+    """
+    Content-addressed on-disk cache for the inputs and outputs of VascuSynth.
+
+    Many samples are generated from the same organ source files, so the same organ mesh
+    is voxelized again and again, and re-generating a data set calls VascuSynth with
+    identical inputs. This cache stores
+
+    - the voxelized oxygenation maps, keyed by the organ mesh and the map parameters and
+    - the generated GXL trees, keyed by the contents of all VascuSynth input files
+      (i.e. the oxygenation map, supply map and tree parameter files, which contain the
+      random seed).
+    """
+
+    @staticmethod
+    def mesh_hash(
+            mesh: vtkPolyData
+    ) -> str:
+        """
+        Hash of the point coordinates and the polygon connectivity of a mesh.
+        """
+        h = hashlib.sha256()
+        h.update(memoryview(mesh.GetPoints().GetData()))
+        h.update(memoryview(mesh.GetPolys().GetOffsetsArray()))
+        h.update(memoryview(mesh.GetPolys().GetConnectivityArray()))
+        return h.hexdigest()
+
+    def load_oxygenation_map(
+            self,
+            key: str
+    ) -> Union[np.ndarray, None]:
+        """
+        Returns:
+            The cached oxygenation map, or None if there is no entry for key.
+        """
+        path = self._path(key, ".npy")
+        if not os.path.exists(path):
+            return None
+        Log.log(module="VascuSynthCache", msg=f"Using cached oxygenation map {path}")
+        return np.load(path)
+
+    def store_oxygenation_map(
+            self,
+            key: str,
+            oxygenation_map: np.ndarray
+    ) -> None:
+        self._store(self._path(key, ".npy"), lambda f: np.save(f, oxygenation_map))
+
+    def load_trees(
+            self,
+            key: str,
+            filenames: list
+    ) -> bool:
+        """
+        Copy cached VascuSynth output trees to the given files.
+
+        Args:
+            key: Cache key of the VascuSynth run.
+            filenames: Output GXL files of the run, in the order of the parameter files.
+
+        Returns:
+            True if the trees were found in the cache and copied, False otherwise.
+        """
+        paths = [self._path(key, f"_{i}.gxl") for i in range(len(filenames))]
+        if not all(os.path.exists(p) for p in paths):
+            return False
+        for path, filename in zip(paths, filenames):
+            shutil.copyfile(path, filename)
+        Log.log(module="VascuSynthCache", msg=f"Using cached VascuSynth trees {key}")
+        return True
+
+    def store_trees(
+            self,
+            key: str,
+            filenames: list
+    ) -> None:
+        """
+        Add the output GXL files of a VascuSynth run to the cache.
+        """
+        for i, filename in enumerate(filenames):
+            with open(filename, "rb") as src:
+                self._store(self._path(key, f"_{i}.gxl"),
+                            lambda f: shutil.copyfileobj(src, f))
@@ -48,6 +48,7 @@ class MapGenerator:
             voxel_content_threshold: float = 0.5,
             oxygen_demand_voxel_value: float = 1.0,
             erosion_stencil_fraction: float = 20,
+            merge_voxels: bool = False,
             rng: 'random.Random' = None
     ) -> None:
         """
@@ -67,6 +68,10 @@ class MapGenerator:
             erosion_stencil_fraction: Fraction of the number of voxels
                 of the oxygenation map in x, y, z direction that will be used as
                 cuboid stencil in the binary erosion step.
+            merge_voxels: If True, runs of adjacent occupied voxels along the z axis are
+                written as a single box into the oxygen demand map instead of one box per
+                voxel. This describes the same volume, but makes the map file much smaller
+                and faster for VascuSynth to parse.
             rng: Random number generator of the DataSample. Under no circumstances
                 create an own new rng here.
         """
@@ -78,6 +83,7 @@ class MapGenerator:
         self._voxel_content_threshold = voxel_content_threshold
         self._oxygen_demand_voxel_value = oxygen_demand_voxel_value
         self._erosion_stencil_fraction = erosion_stencil_fraction
+        self._merge_voxels = merge_voxels
 
         msg = ("Random number generator of the DataSample needs to be passed to "
                "the MapGenerator to keep the pipeline deterministic!")
@@ -183,12 +189,55 @@ class MapGenerator:
         # a double value using <cstdlib> double atof (const char* str);
         return f"{lower_corner} {upper_corner}\n{self._oxygen_demand_voxel_value}\n"
 
-    def _generate_oxygenation_map(self) -> str:
+    def _occupied_boxes(self) -> np.ndarray:
+        """
+        Find the boxes of the oxygenation map which are occupied by the input volume.
+
+        Returns:
+            Array of shape (N, 6) holding the lower and upper corner voxel indices of each
+            box, in the same (i, j, k) order in which _voxel_to_str would visit them.
+            If self._merge_voxels is set, each box covers a run of adjacent occupied voxels
+            along the z axis, otherwise each box is a single voxel.
+        """
+        occupied = self._oxygenation_map.astype(int) >= self._voxel_content_threshold
+        if not self._merge_voxels:
+            lower = np.argwhere(occupied)
+            return np.hstack((lower, lower + 1))
+
+        # Runs start where the (padded) occupancy switches from 0 to 1 along z and end
+        # where it switches back. Both are found in the same order, so they pair up.
+        padded = np.zeros((self.nx, self.ny, self.nz + 2), dtype=np.int8)
+        padded[:, :, 1:-1] = occupied
+        steps = np.diff(padded, axis=2)
+        starts = np.argwhere(steps == 1)
+        ends = np.argwhere(steps == -1)
+        return np.hstack((starts, ends[:, :2] + 1, ends[:, 2:]))
+
+    def _oxygenation_map_to_str(self) -> str:
+        """
+        Create the string representation of all occupied boxes of the oxygenation map.
+        Equivalent to concatenating _voxel_to_str for all voxels (if voxels are not merged),
+        but formats all boxes at once.
+        """
+        boxes = self._occupied_boxes()
+        value = str(self._oxygen_demand_voxel_value).replace("%", "%%")
+        box_format = "%d %d %d %d %d %d\n" + value + "\n"
+        return (box_format * boxes.shape[0]) % tuple(boxes.ravel().tolist())
+
+    def _generate_oxygenation_map(self, oxygenation_map: np.ndarray = None) -> str:
         """
         Generates the oxygen demand map.
         This function is not intended to be called more than once for each instance.
+
+        Args:
+            oxygenation_map: Previously generated (eroded) oxygenation map for the same
+                organ and parameters, e.g. from a cache. If given, the voxelization is skipped.
         """
 
+        if oxygenation_map is not None:
+            self._oxygenation_map = oxygenation_map
+            return self._oxygenation_map_header() + self._oxygenation_map_to_str()
+
         oxygenation_map = self._voxelize_input()
 
         # _voxelize_input() stores labels for the surface of the organ in oxygenation_map
@@ -205,16 +254,20 @@ class MapGenerator:
         self._oxygenation_map = binary_erosion(self._oxygenation_map, structure=np.ones(r, int))
 
         # Generate string representation of the oxygen demand map
+        return self._oxygenation_map_header() + self._oxygenation_map_to_str()
+
+    def _oxygenation_map_header(self) -> str:
+        """
+        Map dimensions and a box with zero demand that covers the whole map.
+        """
         oxygenation_map_string = f"{self.upper_corner_voxel}\n0 0 0 "
         oxygenation_map_string += f"{self.upper_corner_voxel}\n0\n"
-        oxygenation_map_string += "".join(self._voxel_to_str(i, j, k) for i in range(self.nx)
-                                          for j in range(self.ny) for k in range(self.nz))
-
         return oxygenation_map_string
 
     def generate(
             self,
-            supply_map_parameters: List[float]
+            supply_map_parameters: List[float],
+            oxygenation_map: np.ndarray = None
     ) -> Tuple[str, str]:
         """
         Generate the oxygen demand and supply map.
@@ -222,9 +275,11 @@ class MapGenerator:
 
         Args:
             supply_map_parameters: Parameters for the oxygenation map update function.
+            oxygenation_map: Previously generated oxygenation map (see
+                :meth:`_generate_oxygenation_map`).
         """
 
-        oxygenation_map = self._generate_oxygenation_map()
+        oxygenation_map = self._generate_oxygenation_map(oxygenation_map)
         supply_map = self._generate_supply_map(supply_map_parameters)
 
         return oxygenation_map, supply_map
@@ -1,5 +1,7 @@
 import os
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from math import pi
 from inspect import cleandoc
 from typing import List, Tuple, Union, Dict, TYPE_CHECKING
@@ -10,12 +12,24 @@ if TYPE_CHECKING:
 
 from .vascular_tree import VascularTree, CurvedTree
 from .map_generator import MapGenerator
+from .cache import VascuSynthCache
 from . import model_generator
 from utils.utils import trunc_norm
 from utils.vtkutils import calc_volume
 from core.objects.sceneobjects import Vasculature, VolumetricOrgan, PortalVein, HepaticVein, HepaticArtery
 from core.log import Log
 
+# Bound the number of VascuSynth processes running at the same time in this process,
+# e.g. when several trees are generated in separate runs or blocks run in threads.
+_run_slots = {}
+_run_slots_lock = threading.Lock()
+
+def _get_run_slots(max_parallel_runs: int) -> threading.BoundedSemaphore:
+    with _run_slots_lock:
+        if max_parallel_runs not in _run_slots:
+            _run_slots[max_parallel_runs] = threading.BoundedSemaphore(max_parallel_runs)
+        return _run_slots[max_parallel_runs]
+
 
 class VasculatureGenerator:
     """
@@ -88,6 +102,8 @@ class VasculatureGenerator:
         self._map_generator = None
         self._perf_points = None
         self._voxel_width_ODM = 1.0
+        self._demand_map_key = None
+        self.structure_from_cache = False
 
         # Algorithm Parameters
         self.gamma_exponent = gamma_exponent
@@ -110,17 +126,25 @@ class VasculatureGenerator:
                                     min=viscosity_min,
                                     max=viscosity_max)
 
-    def generate_demand_maps(self, organ: vtkPolyData, **kwargs):
+    def generate_demand_maps(self, organ: vtkPolyData, cache: VascuSynthCache = None, **kwargs):
         """
         Generate the oxygen demand and supply map as VascuSynth inputs.
 
         Args:
             organ: Surface mesh representing the shape that the map should
                 be generated for.
+            cache: If given, the voxelized organ is looked up in (or added to) this cache.
         """
         # Generate VascuSynth supply map and oxygen demand map
         self._map_generator = MapGenerator(organ, rng=self.rng, **kwargs)
-        oxygenation_map, supply_map = self._map_generator.generate(self.supply_map_parameters)
+        cached_map = None
+        if cache is not None:
+            self._demand_map_key = cache.key(cache.mesh_hash(organ), kwargs)
+            cached_map = cache.load_oxygenation_map(self._demand_map_key)
+        oxygenation_map, supply_map = self._map_generator.generate(self.supply_map_parameters,
+                                                                   cached_map)
+        if cache is not None and cached_map is None:
+            cache.store_oxygenation_map(self._demand_map_key, self._map_generator._oxygenation_map)
 
         # Voxel width in ODM coordinates
         self._voxel_width_ODM = self.organ_scene_object.voxel_resolution / self._map_generator.scale_factor  # m
@@ -240,7 +264,10 @@ class VasculatureGenerator:
     def generate_structure(
             self,
             random_seed: int,
-            sample_directory: str = ''
+            sample_directory: str = '',
+            cache: VascuSynthCache = None,
+            separate_runs: bool = False,
+            max_parallel_runs: int = 1
     ) -> Tuple[str, str]:
         """
         Call VascuSynth to generate the vessel tree graph GXL file.
@@ -250,6 +277,14 @@ class VasculatureGenerator:
                 be set to the DataSample's ID for consistency.
             sample_directory: Directory that VascuSynth should generate the specified output files
                 into. Usually the DataSample's directory: sample.path.
+            cache: If given, the trees are copied from this cache if VascuSynth has been called
+                with identical input files before, and added to it otherwise.
+                self.structure_from_cache tells whether the cache was used.
+            separate_runs: If True, each vessel tree is generated by its own VascuSynth process
+                and these processes run concurrently. Note that the trees then do not know
+                about each other during the generation.
+            max_parallel_runs: Maximum number of VascuSynth processes running at the same time
+                in this process.
 
         Raises:
             subprocess.CalledProcessError if return code of VascuSynth call is != 0.
@@ -258,16 +293,60 @@ class VasculatureGenerator:
             (stdout, stderr) of the VascuSynth subprocess call as strings.
         """
         # Todo: random seed in VascuSynth's command line arguments
-        command = [str(self.VascuSynth_path)]
-        command += [os.path.join(sample_directory, str(self.organ_scene_object.filename_oxygen_demand_map))]
-        command += [os.path.join(sample_directory, str(self.organ_scene_object.filename_supply_map))]
-        command += [os.path.join(sample_directory, vessel.filename_parameters) for vessel in self.vessel_scene_objects]
+        maps = [os.path.join(sample_directory, str(self.organ_scene_object.filename_oxygen_demand_map))]
+        maps += [os.path.join(sample_directory, str(self.organ_scene_object.filename_supply_map))]
+        parameter_files = [os.path.join(sample_directory, vessel.filename_parameters)
+                           for vessel in self.vessel_scene_objects]
+        output_files = [os.path.join(sample_directory, vessel.filename_tree_struct_intermediate)
+                        for vessel in self.vessel_scene_objects]
+
+        self.structure_from_cache = False
+        if cache is not None:
+            key = self._structure_cache_key(cache, maps, parameter_files, separate_runs)
+            if cache.load_trees(key, output_files):
+                self.structure_from_cache = True
+                return f"Loaded trees from cache {cache.directory} (key {key})", ""
+
+        if separate_runs:
+            commands = [[str(self.VascuSynth_path)] + maps + [f] for f in parameter_files]
+        else:
+            commands = [[str(self.VascuSynth_path)] + maps + parameter_files]
 
-        process = subprocess.run(command, capture_output=True, check=True, text=True)
+        slots = _get_run_slots(max_parallel_runs)
+        def run(command):
+            with slots:
+                return subprocess.run(command, capture_output=True, check=True, text=True)
 
         # throws an Exception if returncode != 0
+        with ThreadPoolExecutor(max_workers=len(commands)) as executor:
+            processes = list(executor.map(run, commands))
+
+        if cache is not None:
+            cache.store_trees(key, output_files)
+
         # on success, return stdout and stderr
-        return process.stdout, process.stderr
+        return "".join(p.stdout for p in processes), "".join(p.stderr for p in processes)
+
+    def _structure_cache_key(
+            self,
+            cache: VascuSynthCache,
+            maps: List[str],
+            parameter_files: List[str],
+            separate_runs: bool
+    ) -> str:
+        """
+        Cache key for a VascuSynth run, computed from the contents of its input files.
+        The output filenames (which contain the sample directory) are left out.
+        """
+        parts = [str(separate_runs)]
+        if self._demand_map_key is not None:
+            parts.append(self._demand_map_key)
+            maps = maps[1:]
+        for filename in maps + parameter_files:
+            with open(filename) as f:
+                lines = [l for l in f.read().splitlines() if not l.startswith("OUTPUT_FILENAME:")]
+            parts.append("\n".join(lines))
+        return cache.key(*parts)
 
     def generate_3D_representation(
             self,
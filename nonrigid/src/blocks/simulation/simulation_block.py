@@ -8,6 +8,8 @@ from core.exceptions import SampleProcessingException
 from utils.vtkutils import calc_mesh_size
 from utils import meshutils
 from utils import vtkutils
+from core.sofa.objects.convergence import ConvergenceMonitor
+from blocks.simulation.state_cache import SimulationStateCache, steps_after_settling
 import sys
 import core.io
 import re
@@ -17,6 +19,46 @@ import sys
 import Sofa.Simulation
 import SofaRuntime, Sofa.Core,Sofa
 
+class BatchStepper(Sofa.Core.Controller):
+    """Advances a SOFA scene by several time steps per call from Python.
+
+    Sofa.Simulation.animate returns to Python after every time step. The BatchStepper uses
+    Sofa.Simulation.animateNSteps instead. If the simulation ends (i.e. root.animate is set to
+    False) within a batch, the step and the deformed mesh at that step are recorded, so the
+    result is the same as when stepping one by one - only the remaining steps of the batch
+    are computed in vain.
+    """
+    def __init__(self, root, simulation, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.root = root
+        self.simulation = simulation
+        self.steps = 0
+        self.end_step = None
+        self.end_mesh = None
+
+    def onAnimateEndEvent(self, event):
+        self.steps += 1
+        if self.end_step is None and not self.root.animate.value:
+            self.end_step = self.steps
+            self.end_mesh = self.simulation.get_deformed_mesh()
+
+    def step(self, n_steps: int, dt: float) -> int:
+        """Run up to n_steps time steps.
+
+        Returns:
+            Number of steps until the simulation ended, or n_steps if it did not end.
+        """
+        self.steps = 0
+        if hasattr(Sofa.Simulation, "animateNSteps"):
+            Sofa.Simulation.animateNSteps(self.root, n_steps, dt)
+        else:
+            # older SofaPython3 versions
+            for _ in range(n_steps):
+                Sofa.Simulation.animate(self.root, dt)
+                if not self.root.animate.value:
+                    break
+        return self.end_step if self.end_step is not None else n_steps
+
 # Pipeline block
 class SimulationBlock(PipelineBlock):
     """Simulation block, launching the specified simulation class.
@@ -37,6 +79,10 @@ class SimulationBlock(PipelineBlock):
         min_allowed_deformation: float = 0.0,  # 0.01 in old pipeline
         max_allowed_deformation: float = 0.1,
         max_volume_change_ratio: float = 1.5,
+        stream_frames: bool = False,
+        steps_per_call: int = 1,
+        convergence_monitor: ConvergenceMonitor = None,
+        warm_start_cache_dir: str = None,
         **kwargs
     ) ->None:
         """ 
@@ -63,6 +109,25 @@ class SimulationBlock(PipelineBlock):
                 simulation. Checked for all intermediate saved meshes.
             max_volume_change_ratio: Maximum allowed ratio of deformed volume over initial volume. If ratio is above,
                 simulation is considered to have failed due to excessive expansion of the mesh.
+            stream_frames: If True (and export_time is set), the exported frames are not kept in the
+                sample's cache but streamed to a single time series file on disk, which only stores the
+                point coordinates of each frame (see :meth:`DataSample.open_time_series`). Saves memory
+                for long simulations. The frames can still be read as e.g. 'deformed_f3.vtu'.
+            steps_per_call: Maximum number of time steps SOFA advances before returning to Python (see
+                :class:`BatchStepper`). Batches always end at the next export time and at max_simulation_time,
+                so the results do not change, but the real time timeout is only checked between batches.
+                1 steps SOFA one time step at a time.
+            convergence_monitor: Decides when the simulation has converged (see
+                :class:`core.sofa.objects.convergence.ConvergenceMonitor`). Passed to the simulation class
+                if given, otherwise the simulation class uses its default. The steps until convergence are added
+                to the sample statistics.
+            warm_start_cache_dir: If given, settled states are cached in this folder (see
+                :class:`SimulationStateCache`). The first sample of an organ, material and boundary
+                conditions settles under gravity without the nodal forces before the forces are applied,
+                and its settled state is stored. Later samples which only differ in the forces start from
+                the stored state and skip the settling. The settling steps are not exported and do not count
+                towards simulation_time (settling alone may take up to max_simulation_time). Whether a sample
+                was warm started is recorded in its config.
 
         """
         self.simulation_class = simulation_class
@@ -76,6 +141,10 @@ class SimulationBlock(PipelineBlock):
         self.min_allowed_deformation = min_allowed_deformation
         self.max_allowed_deformation = max_allowed_deformation
         self.max_volume_change_ratio = max_volume_change_ratio
+        self.stream_frames = stream_frames
+        self.steps_per_call = steps_per_call
+        self.convergence_monitor = convergence_monitor
+        self.warm_start_cache_dir = warm_start_cache_dir
 
         self.output_filename = output_filename
         self.max_time_before_timeout = max_time_before_timeout
@@ -89,6 +158,7 @@ class SimulationBlock(PipelineBlock):
         sample
     ):
 
+        series = None
         try:            
             Log.log(module="SimulationBlock", severity="INFO", msg="Running simulation...")
             Log.log(module="SimulationBlock", msg="Loading input")
@@ -102,7 +172,11 @@ class SimulationBlock(PipelineBlock):
                     "should be created for every DataSample!"
             sample.add_statistic(self, "young_modulus", d[0].young_modulus)
             sample.add_statistic(self, "poisson_ratio", d[0].poisson_ratio)
-            
+
+            # The simulation scene loads its meshes from disk, make sure they are not only cached:
+            sample.flush_data(filenames=[f for pattern in self.inputs
+                    for f in sample.find_matching_files(pattern)])
+
             # Create scene graph
             if issubclass(self.simulation_class, Sofa.Core.Controller):
                 root = Sofa.Core.Node("root")
@@ -120,15 +194,31 @@ class SimulationBlock(PipelineBlock):
                 #urdfNode.addObject('MeshSTLLoader', name='meshLoader', filename='path/to/your/robot_visual.obj')
                 #urdfNode.addObject('OglModel', src='@meshLoader', name='visual')
                 # Initialize simulation class
+                simulation_kwargs = {}
+                if self.convergence_monitor is not None:
+                    simulation_kwargs["convergence_monitor"] = self.convergence_monitor
+                if self.warm_start_cache_dir is not None:
+                    simulation_kwargs["state_cache"] = SimulationStateCache(self.warm_start_cache_dir)
                 simulation = self.simulation_class(
                     root, 
                     sample,  
                     self.inputs,
                     dt = self.dt,
                     gravity = self.gravity,
+                    **simulation_kwargs
                     )
+                monitor = getattr(simulation, "convergence_monitor", None)
+                if monitor is not None:
+                    sample.set_config_value(self, "convergence", monitor.config())
                 root.addObject( simulation )
+                stepper = None
+                if self.steps_per_call > 1:
+                    stepper = root.addObject( BatchStepper(root, simulation, name="BatchStepper") )
                 Sofa.Simulation.init(root)
+                if self.warm_start_cache_dir is not None:
+                    warm_started = simulation.warm_start()
+                    sample.set_config_value(self, "warm_start", warm_started)
+                    sample.set_config_value(self, "warm_start_key", simulation.warm_start_key)
                 # Simulation max time
                 simulation_time = 0
                 start_time = time.time()
@@ -151,9 +241,24 @@ class SimulationBlock(PipelineBlock):
 
                 else:
                     while root.animate.value == True:
-                        Sofa.Simulation.animate(root, root.dt.value)
-                        simulation_time += root.dt.value
-                        n_timesteps += 1
+                        dt = root.dt.value
+                        if stepper is None:
+                            Sofa.Simulation.animate(root, dt)
+                            n_steps = 1
+                        else:
+                            n_steps = stepper.step(self._steps_until_check(simulation_time, prev_id, dt), dt)
+                        n_timesteps += n_steps
+                        # The organ settles without the forces first (see SofaSimulation.warm_start).
+                        # These steps are neither exported nor counted as simulation time:
+                        settling = getattr(simulation, "settling", False)
+                        if settling and n_timesteps*dt > self.max_simulation_time:
+                            self._add_convergence_statistics(sample, simulation)
+                            raise SampleProcessingException(self, sample,
+                                    f"Sample did not settle within maximum simulation time.")
+                        n_steps = steps_after_settling(n_timesteps, n_steps, settling,
+                                getattr(simulation, "settle_steps", None))
+                        for _ in range(n_steps):
+                            simulation_time += dt
 
                         if not self.export_time == -1:
                             id = (simulation_time + 1e-08) // self.export_time
@@ -161,17 +266,24 @@ class SimulationBlock(PipelineBlock):
                             # Save file
                             if not id == prev_id:
                                 deformed = simulation.get_deformed_mesh()
-                                sample.write(self.output_filename, deformed, frame=int(n_exported_frames)) # self.validate_sample depends on this
+                                if self.stream_frames:
+                                    if series is None:
+                                        series = sample.open_time_series(self.output_filename, deformed)
+                                    series.append(int(n_exported_frames), deformed)
+                                else:
+                                    sample.write(self.output_filename, deformed, frame=int(n_exported_frames)) # self.validate_sample depends on this
                                 prev_id = id
                                 n_exported_frames += 1
                         if simulation_time > self.max_simulation_time:
                             sample.add_statistic(self, "simulation_time", simulation_time)
                             sample.add_statistic(self, "simulation_frames", n_exported_frames)
+                            self._add_convergence_statistics(sample, simulation)
                             raise SampleProcessingException(self, sample,
                                     f"Sample did not converge within maximum simulation time.")
                         if time.time() - start_time > self.max_time_before_timeout:
                             sample.add_statistic(self, "simulation_time", simulation_time)
                             sample.add_statistic(self, "simulation_frames", n_exported_frames)
+                            self._add_convergence_statistics(sample, simulation)
                             raise SampleProcessingException(self, sample,
                                     f"Timeout, aborting. Increase 'max_time_before_timeout' if this happens too often.")
 
@@ -180,6 +292,7 @@ class SimulationBlock(PipelineBlock):
                         msg=f"Simulation done after {simulation_time:.3f} simulated seconds.")
                 sample.add_statistic(self, "simulation_time", simulation_time)
                 sample.add_statistic(self, "simulation_frames", n_exported_frames)
+                self._add_convergence_statistics(sample, simulation)
 
                 if self.export_time > simulation_time:
                     msg = "Exported final mesh does not map to the export_time timestep! Simulation finished " + \
@@ -187,7 +300,11 @@ class SimulationBlock(PipelineBlock):
                     Log.log(severity="WARN", module="SimulationBlock", msg=msg)
 
                 # write out final result
-                deformed = simulation.get_deformed_mesh()
+                if stepper is not None and stepper.end_mesh is not None:
+                    # the batch continued after the simulation ended
+                    deformed = stepper.end_mesh
+                else:
+                    deformed = simulation.get_deformed_mesh()
                 # either: write final mesh as single file
                 # when no export time is set or when simulation finishes faster than first export
                 write_final_mesh_only = (self.export_time == -1) or (self.export_time > simulation_time)
@@ -196,7 +313,10 @@ class SimulationBlock(PipelineBlock):
                 # or: write final mesh as last part of time series
                 # - if export_time < simulation_time: get final equilibrated mesh even between export steps
                 elif simulation_time < (prev_id + 1) * self.export_time:
-                    sample.write(self.output_filename, deformed, frame=int(prev_id+1))
+                    if series is not None:
+                        series.append(int(prev_id+1), deformed)
+                    else:
+                        sample.write(self.output_filename, deformed, frame=int(prev_id+1))
                 self._calc_statistics(sample, deformed)
 
                 # Sofa.Simulation.reset(root)
@@ -208,6 +328,32 @@ class SimulationBlock(PipelineBlock):
         except AssertionError as e:
             raise SampleProcessingException(self, sample,
                     f"Simulation failed: {e}")
+        finally:
+            # wait until all streamed frames are on disk
+            if series is not None:
+                series.close()
+
+    def _steps_until_check(self, simulation_time, prev_id, dt):
+        """Number of time steps (at most self.steps_per_call) after which the loop in run() has to
+        check the simulation again: the next export or exceeding max_simulation_time. Uses the same
+        floating point accumulation of the simulation time as run()."""
+        n_steps = 0
+        while n_steps < self.steps_per_call:
+            simulation_time += dt
+            n_steps += 1
+            if simulation_time > self.max_simulation_time:
+                break
+            if not self.export_time == -1 and not (simulation_time + 1e-08) // self.export_time == prev_id:
+                break
+        return n_steps
+
+    def _add_convergence_statistics(self, sample, simulation):
+        # steps to convergence etc., if the simulation class uses a ConvergenceMonitor
+        monitor = getattr(simulation, "convergence_monitor", None)
+        if isinstance(monitor, ConvergenceMonitor):
+            monitor.add_statistics(sample, self)
+        if getattr(simulation, "settle_steps", None) is not None:
+            sample.add_statistic(self, "settle_steps", simulation.settle_steps)
 
     def _calc_statistics(self, sample, deformed_mesh):
         # number of points on the intraoperative volume
@@ -241,58 +387,47 @@ class SimulationBlock(PipelineBlock):
                 * remains_processable: True only if all validation checks are successful
                 * reason: explanation for failed validation checks
         """
-        # self intersection check
-        # convert (potentially cached) meshes
-        name, _ = os.path.splitext(self.output_filename)
-        sample.convert_all(self.output_filename, ".stl")
-        # write to disk so that meshlib can read the .stl files
-        file_pattern = sample.get_formatted_filepattern(name+".stl", all_frames=True)
-        sample.flush_data(regex=file_pattern) #f"^{name}.*\.stl$"
-        # call to meshlib
-        error_found, comment = meshutils.check_self_intersection_all_matches(sample.path, file_pattern)
-        if error_found:
-            return False, comment
-
-        # surface area, volume and deformation check
-        # load initial mesh for comparison
-        # surface for surface area comparison
-        if "preoperative_area" not in sample.statistics:
-            try:
-                _, init_surface, _, _, _ = next(sample.read_all(self.inputs[1]))
-            except:
-                return False, f"Could not load {self.inputs[1]}"
-            preoperative_area = vtkutils.calc_surface_area(init_surface)
-            # save computed value for future reference
-            sample.add_statistic( self, "preoperative_area", preoperative_area)
-        else:
-            preoperative_area = sample.statistics["preoperative_area"]
-        # volume for comparison to max/min allowed deformation
-        try:
-            _, init_mesh, _, _, _ = next(sample.read_all(self.inputs[0]))
-        except:
-            return False, f"Could not load {self.inputs[0]}"
-        if "preoperative_volume" not in sample.statistics:
-            preoperative_volume = vtkutils.calc_volume(init_mesh)
-            # save computed value for future reference
-            sample.add_statistic( self, "preoperative_volume", preoperative_volume)
-        else:
-            preoperative_volume = sample.statistics["preoperative_volume"]
-        # load meshes after simulation
-        deformed_meshes = {filename:mesh for filename,mesh,_,_,_ in sample.read_all(self.output_filename)}
+        # the meshes after simulation are only read one by one further below, so that not all
+        # frames of a long time series have to be in memory at once. Only list them here:
+        _, base_name, ext = sample.get_formatted_filename(self.output_filename)
+        deformed_files = sample.find_matching_files(sample.get_formatted_filepattern(f"{base_name}{ext}",
+                all_ids=True, all_frames=True))
         # it may be necessary at some point to exclude organs of the same type with different scene object IDs
         # check against min deformation only at final step -> find filename of last mesh
-        if len(deformed_meshes) == 0:
+        if len(deformed_files) == 0:
             return False, (f"No deformed meshes matching {self.output_filename} (also with scene object ID or frame "
                            f"number) could be found!")
         else:
             # this is a filename
-            last_file = sample.find_last_file(self.output_filename, deformed_meshes)
+            last_file = sample.find_last_file(self.output_filename, dict.fromkeys(deformed_files))
+
+        # surface area, volume and deformation check
+        # the preoperative area and volume are taken from the sample's geometry metadata,
+        # so they are only computed once per sample (not on every validation)
+        init_surface_geometry = sample.get_geometry(self.inputs[1], area=True)
+        if init_surface_geometry is None:
+            return False, f"Could not load {self.inputs[1]}"
+        preoperative_area = init_surface_geometry.area
+        sample.add_statistic( self, "preoperative_area", preoperative_area)
+        # initial mesh for comparison to max/min allowed deformation
+        try:
+            init_mesh_name, init_mesh, _, _, _ = next(sample.read_all(self.inputs[0]))
+        except:
+            return False, f"Could not load {self.inputs[0]}"
+        preoperative_volume = sample.get_geometry(init_mesh_name, volume=True, mesh=init_mesh).volume
+        sample.add_statistic( self, "preoperative_volume", preoperative_volume)
 
         # if block produced a time series, check all meshes
-        for filename, mesh in deformed_meshes.items():
-            surface = vtkutils.extract_surface(mesh)
-            area = vtkutils.calc_surface_area(surface)
-            area = area / 2  # quick fix because inner faces introduced by GMSH are counted as well, see issue #122
+        # self intersection check
+        # surfaces of the (potentially cached) meshes are passed to meshlib directly,
+        # several frames in parallel while the following ones are read
+        deformed_meshes = ((filename, mesh) for filename, mesh, _, _, _ in sample.read_all(self.output_filename))
+        for filename, mesh, error_found, comment in meshutils.check_self_intersection_all_meshes(deformed_meshes):
+            if error_found:
+                return False, comment
+
+            geometry = sample.get_geometry(filename, area=True, volume=True, mesh=mesh)
+            area = geometry.area / 2  # quick fix because inner faces introduced by GMSH are counted as well, see issue #122
             # comparisons done here to save computation time of remaining meshes
             # compare to initial surface area
             if area > preoperative_area * self.max_area_change_ratio:
@@ -303,7 +438,7 @@ class SimulationBlock(PipelineBlock):
                 return False, f"Surface area is too small: {area:.4f}, something went wrong in {filename}."
 
             # compare to allowed volume increase
-            volume = vtkutils.calc_volume(mesh)
+            volume = geometry.volume
             if volume > preoperative_volume * self.max_volume_change_ratio:
                 return False, f"Volume increased considerably during simulation, from {preoperative_volume:.4f} to " + \
                        f"{volume:.4f} in {filename}."
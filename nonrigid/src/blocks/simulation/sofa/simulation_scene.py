@@ -26,6 +26,13 @@ from core.sofa.components.solver import SolverType, TimeIntegrationType
 from core.sofa.objects.tissue import Tissue
 from core.sofa.objects.boundaries import FixedBoundaries, SpringBoundaries
 from core.sofa.objects.forces import NodalForce
+from core.sofa.objects.convergence import ConvergenceMonitor
+from core.geometry import calc_content_hash
+from blocks.simulation.state_cache import SimulationStateCache
+
+# Part of the warm start cache keys. Increase it whenever the scene changes in a way which
+# changes the settled state, but is not covered by SofaSimulation.settle_parameters:
+STATE_CACHE_VERSION = 1
 
 from core.log import Log
 from utils.sofautils import get_indices_in_roi, sofa2vtu
@@ -40,9 +47,29 @@ class SofaSimulation(Sofa.Core.Controller):
         inputs: list,
         dt: float,
         gravity: float,
+        convergence_monitor: Optional[ConvergenceMonitor] = None,
+        state_cache: Optional[SimulationStateCache] = None,
     ):
+        """
+        Args:
+            convergence_monitor: Decides when the simulation has converged. Defaults to a mean
+                velocity below 0.001, evaluated every time step.
+            state_cache: If given, the simulation first lets the organ settle under gravity and
+                its boundary conditions without the nodal forces, and stores the settled state
+                in the cache. Simulations of the same organ, material and boundary conditions
+                start from the cached state instead (see :meth:`warm_start`).
+        """
         super(SofaSimulation, self).__init__()
 
+        if convergence_monitor is None:
+            convergence_monitor = ConvergenceMonitor()
+        self.convergence_monitor = convergence_monitor
+        self.convergence_monitor.reset()
+        self.state_cache = state_cache
+        self.warm_start_key = None
+        self.settling = False
+        self.settle_steps = None
+
         # Load input files
         self.simulation_mesh_filename = os.path.join(os.getcwd(), sample.path, inputs[0]) 
         self.surface_filename         = os.path.join(os.getcwd(), sample.path, inputs[1])
@@ -65,6 +92,11 @@ class SofaSimulation(Sofa.Core.Controller):
 
         self.tissue = None
         self.root = root
+        # Everything which determines the settled state, except for the forces:
+        self.settle_parameters = [f"version {STATE_CACHE_VERSION}",
+                calc_content_hash(self.undeformed_simulation_mesh),
+                {"gravity": np.asarray(gravity).tolist(), "dt": dt,
+                    "convergence": self.convergence_monitor.config()}]
         
         add_scene_header( 
                         root,
@@ -95,10 +127,13 @@ class SofaSimulation(Sofa.Core.Controller):
                     print(org.mass_density)
                     print(self.undeformed_simulation_mesh)
                     print(f' surface file: {self.surface_filename}')
+                    constitutive_model = ConstitutiveModel.COROTATED
+                    solver = SolverType.CG
+                    analysis = TimeIntegrationType.EULER
                     material = Material(
                                         young_modulus = org.young_modulus,
                                         poisson_ratio = org.poisson_ratio,
-                                        constitutive_model = ConstitutiveModel.COROTATED,
+                                        constitutive_model = constitutive_model,
                                         mass_density = org.mass_density
                                     )
 
@@ -110,14 +145,18 @@ class SofaSimulation(Sofa.Core.Controller):
                                                 material=material,
                                                 node_name='Tissue',
                                                 #grid_resolution=[8,2,6], # for simulation with hexa
-                                                solver=SolverType.CG,
-                                                analysis=TimeIntegrationType.EULER,
+                                                solver=solver,
+                                                analysis=analysis,
                                                 surface_mesh=self.surface_filename, # e.g. surface for visualization or collision
                                                 view=True,
                                                 collision=True,
                                                 )
                                             )					
                     self.tissue = tissue
+                    self.settle_parameters.append({"young_modulus": org.young_modulus,
+                            "poisson_ratio": org.poisson_ratio, "mass_density": org.mass_density,
+                            "constitutive_model": constitutive_model.name, "solver": solver.name,
+                            "analysis": analysis.name})
 
                     assert len(self.tissue.volume_topology.position.value) > 0, "Volume topology has NOT been correctly initialized"
         else:
@@ -154,6 +193,7 @@ class SofaSimulation(Sofa.Core.Controller):
  
                 #print("FIXED INDICES:", fixed_indices)
                 self.fixed_indices = fixed_indices
+                self.settle_parameters.append(np.asarray(fixed_indices))
                 Log.log(module="SimulationBlock",
                         msg=f"Number of fixed points: {len(self.fixed_indices)}")
             
@@ -184,38 +224,39 @@ class SofaSimulation(Sofa.Core.Controller):
                 N_springs = int(points.shape[0]*0.5)
                 if N_springs < 1:
                     continue
-
-                for i in range(N_springs):
-                    start_point = points[i*2]
-                    end_point = points[i*2+1]
-                    spring_indices = find_corresponding_indices(
-                            self.undeformed_simulation_mesh, [start_point])
-                    spring_end_positions = [end_point]
-                    #print(f"Indices: {spring_indices}")
-                    #print(f"End position: {spring_end_positions}")
-                    #rest_length_factor = sample.get_config_value(SimulationBlock,
-                            #"rest_length_factor", lig.filename)
-                    spring_length = np.linalg.norm(end_point-start_point).item()
-                    rest_length = spring_length*lig.rest_length_factor
-
-                    springs = root.addObject(
-                                                SpringBoundaries(tissue.node,
-                                                                attached_object=tissue,
-                                                                start_indices=spring_indices,
-                                                                end_points=spring_end_positions,
-                                                                name = lig.filename,
-                                                                stiffness = lig.stiffness,
-                                                                rest_length = rest_length,
-                                                                incremental=False,
-                                                                active=True,
-                                                                view=True,
-                                                                view_end_points=True,
-                                                                )
-                                                )
-                    self.springs.append( springs )
+                start_points = points[0:N_springs*2:2]
+                end_points = points[1:N_springs*2:2]
+
+                # All springs of the ligament are created at once: the attachment indices are
+                # found with a single query, and the springs form one SpringBoundaries object.
+                spring_indices = find_corresponding_indices(
+                        self.undeformed_simulation_mesh, start_points)
+                #rest_length_factor = sample.get_config_value(SimulationBlock,
+                        #"rest_length_factor", lig.filename)
+                spring_lengths = np.linalg.norm(end_points-start_points, axis=1)
+                rest_lengths = spring_lengths*lig.rest_length_factor
+                self.settle_parameters += [np.asarray(spring_indices), end_points, rest_lengths,
+                        {"stiffness": lig.stiffness}]
+
+                springs = root.addObject(
+                                            SpringBoundaries(tissue.node,
+                                                            attached_object=tissue,
+                                                            start_indices=spring_indices,
+                                                            end_points=end_points,
+                                                            name = lig.filename,
+                                                            stiffness = lig.stiffness,
+                                                            rest_length = rest_lengths.tolist(),
+                                                            incremental=False,
+                                                            active=True,
+                                                            view=True,
+                                                            view_end_points=True,
+                                                            )
+                                            )
+                self.springs.append( springs )
 
         #####################################
         # Nodal force
+        self.nodal_forces = []
         forces = [so for so in sample.scene_objects if isinstance(so, Force)]
         if len(forces):
             for f in forces:
@@ -240,11 +281,12 @@ class SofaSimulation(Sofa.Core.Controller):
                             points=[force_vector_points[0]]
                             )
 
-                NodalForce(
+                nodal_force = NodalForce(
                     parent_node=tissue.node,
                     indices=force_indices,
                     magnitude=force_magnitude
                 )
+                self.nodal_forces.append((nodal_force, force_magnitude, force_indices))
 
         self.num_steps = 1
         self.deformedStates = []
@@ -260,11 +302,57 @@ class SofaSimulation(Sofa.Core.Controller):
 
     def init(self):
         pass
+
+    def warm_start(self) ->bool:
+        """ Start from the cached settled state, or settle first if there is none.
+
+        Must be called after the scene was initialized and before the first time step. Without
+        a state cache, nothing happens.
+
+        Returns:
+            True if the tissue state was initialized from the cache.
+        """
+        if self.state_cache is None:
+            return False
+        self.warm_start_key = self.state_cache.key(*self.settle_parameters)
+        cached = self.state_cache.load(self.warm_start_key)
+        if cached is not None:
+            positions, velocities = cached
+            if positions.shape == self.tissue.state.position.value.shape:
+                with self.tissue.state.position.writeable() as p:
+                    p[:] = positions
+                with self.tissue.state.velocity.writeable() as v:
+                    v[:] = velocities
+                return True
+            Log.log(module="SimulationBlock", severity="WARN",
+                    msg=f"Cached state has {len(positions)} instead of " +\
+                            f"{len(self.tissue.state.position.value)} points, not used")
+        # Settle without the nodal forces first:
+        self.settling = True
+        for nodal_force, magnitude, indices in self.nodal_forces:
+            nodal_force.set_forces(magnitude=np.zeros_like(magnitude), indices=indices)
+        return False
+
+    def finish_settling(self) ->None:
+        """ Store the settled state and apply the nodal forces. """
+        self.settling = False
+        self.settle_steps = self.convergence_monitor.step
+        self.state_cache.store(self.warm_start_key,
+                np.array(self.tissue.state.position.value),
+                np.array(self.tissue.state.velocity.value))
+        Log.log(module="SimulationBlock",
+                msg=f"Settled after {self.settle_steps} steps, applying forces")
+        for nodal_force, magnitude, indices in self.nodal_forces:
+            nodal_force.set_forces(magnitude=magnitude, indices=indices)
+        self.convergence_monitor.reset()
         
     def onAnimateBeginEvent(self,__):
         pass
 
     def onAnimateEndEvent(self, event):
+        # A BatchStepper may keep stepping after the simulation ended, ignore these steps:
+        if not self.root.animate.value:
+            return
         sim_end = False
         
         # Check for simulation instability at the end of each time step
@@ -272,24 +360,11 @@ class SofaSimulation(Sofa.Core.Controller):
             Log.log(module="SimulationBlock", msg="Simulation is UNSTABLE", severity="WARN")
             sim_end = True    
     
-        v = self.tissue.state.velocity.value
-        v_mag = np.linalg.norm(v, axis=1)
-        v_avg = v_mag.mean()
-        #print("Average velocity:", vAvg)
-        
-        if v_avg < 0.001:
-            sim_end = True
-
-        # if self.prevVel:
-        #     accelSum = 0
-        #     for i, v in enumerate(vel):
-        #         velDiff = np.linalg.norm( v - self.prevVel[i] )
-        #         accelSum = accelSum + velDiff
-        #     accelAvg = accelSum/len(vel)
-        #     print("Average acceleration:", accelAvg)
-        #     if vAvg < self.mean_velocity_thresh and accelAvg < self.mean_acceleration_thresh and self.step > self.min_simulation_steps:
-        #         sim_end = True
-        # self.prevVel = vel
+        if self.convergence_monitor.update(self.tissue.state, self.root.dt.value):
+            if self.settling:
+                self.finish_settling()
+            else:
+                sim_end = True
 
         if sim_end:
             self.actual_simulation_time = time.time()-self.start_time
@@ -0,0 +1,65 @@
+import os
+import numpy as np
+from typing import Optional, Tuple
+
+from core.log import Log
+from utils.file_cache import FileCache
+
+
+class SimulationStateCache(FileCache):
+    """
+    Content-addressed on-disk cache for settled simulation states.
+
+    Many samples simulate the same organ mesh with the same material and boundary conditions
+    and only differ in the applied forces. The state the organ settles into under gravity and
+    its boundary conditions alone is the same for all of them, so it is computed once, stored
+    here, and used as the initial state of the following samples (a warm start).
+    """
+
+    def load(
+            self,
+            key: str
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns:
+            The cached positions and velocities, or None if there is no entry for key.
+        """
+        path = self._path(key, ".npz")
+        if not os.path.exists(path):
+            return None
+        Log.log(module="SimulationStateCache", msg=f"Using cached simulation state {path}")
+        with np.load(path) as data:
+            return data["positions"], data["velocities"]
+
+    def store(
+            self,
+            key: str,
+            positions: np.ndarray,
+            velocities: np.ndarray
+    ) -> None:
+        self._store(self._path(key, ".npz"),
+                    lambda f: np.savez(f, positions=positions, velocities=velocities))
+
+
+def steps_after_settling(
+        n_timesteps: int,
+        n_steps: int,
+        settling: bool,
+        settle_steps: Optional[int]
+) -> int:
+    """
+    Number of the last n_steps time steps which were run after the settling phase of a warm
+    started simulation (see SofaSimulation.warm_start), i.e. which count as simulation time.
+
+    Args:
+        n_timesteps: Number of time steps run so far, including the last n_steps.
+        n_steps: Number of time steps run by the last call (e.g. a batch of a BatchStepper).
+        settling: Whether the simulation is still settling.
+        settle_steps: Number of time steps the settling took, None if there was no settling.
+    """
+    if settling:
+        return 0
+    if settle_steps is None:
+        return n_steps
+    # settling may have ended within the last call:
+    return max(min(n_steps, n_timesteps - settle_steps), 0)
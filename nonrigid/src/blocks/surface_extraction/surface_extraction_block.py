@@ -29,7 +29,7 @@ class SurfaceExtractionBlock(PipelineBlock):
                 between 0 and 1). If multiple partial surfaces are extracted in the same sample (i.e., multiple
                 input files are given), then a different percentage of surface is extracted for each input mesh.
             w_distance (tuple(float)):
-                Influence of the geodesic distance of a point to the center point c.
+                Influence of the euclidean distance of a point to the center point c.
                 If this value is > 0 and the other weights are == 0, only the distance will be
                 taken into account. Tuple must contain exactly two values: min and may
             w_normal (tuple(float)):
@@ -4,13 +4,16 @@ import math
 import inspect
 import sys
 import os
+import functools
+import numpy as np
+from scipy.spatial import cKDTree
 
 #from utils.generalutils import *
 from utils.vtkutils import *
 #from utils.pytorchutils import *
 
 def distance_field( 
-    mesh: vtkDataSet, 
+    mesh: vtkPolyData, 
     grid: vtkStructuredGrid, 
     name: str = "distance_field", 
     signed: bool = False,
@@ -18,8 +21,11 @@ def distance_field(
     """ 
     Embeds the mesh into a grid volume via its distance field. The provided grid is changed in-place.
 
+    Distances are computed for all grid points in one call, see :func:`surface_distance`. The
+    sign is determined for all points by a single vtkSelectEnclosedPoints run.
+
     Args:
-        mesh: The mesh that has to be encoded into the grid.
+        mesh: The surface mesh that has to be encoded into the grid.
         grid: The target grid where the mesh will be encoded.
         name: Name of the array of the grid where the distance field will be saved.
         signed: If True, the signed distance field is computed, instead of regular distance field. This
@@ -27,60 +33,87 @@ def distance_field(
             the mesh will be assigned with positive values.
     """
 
-    # Initialize distance field:
-    df = vtkFloatArray()
-    df.SetNumberOfTuples( grid.GetNumberOfPoints() )
-    df.SetName(name)
+    dist = surface_distance( mesh, vtk_to_numpy( grid.GetPoints().GetData() ) )
 
-    # Data structure to quickly find cells:
-    cellLocator = vtkCellLocator()
-    cellLocator.SetDataSet( mesh )
-    cellLocator.BuildLocator()
+    if signed:
+        inside = enclosed_points( mesh, grid )
+        dist[inside] = -dist[inside]     # invert sign
 
+    df = numpy_to_vtk( dist.astype(np.float32), deep=True )
+    df.SetName(name)
+    grid.GetPointData().AddArray( df )
 
-    for i in range(0, grid.GetNumberOfPoints() ):
-        # Take a point from the target...
-        testPoint = [0]*3
-        grid.GetPoint( i, testPoint )
-        # ... find the point in the surface closest to it
-        cID, subID, dist2 = mutable(0), mutable(0), mutable(0.0)
-        closestPoint = [0]*3
-        
-        cellLocator.FindClosestPoint( testPoint, closestPoint, cID, subID, dist2 )
-        #closestPoint = [0]*3
-        #mesh.GetPoint( closestPointID, closestPoint )
-        #dist = math.sqrt( vtkMath.Distance2BetweenPoints( testPoint, closestPoint ) )
-        dist = math.sqrt(dist2)
+def surface_distance(
+    mesh: vtkPolyData,
+    points: np.ndarray,
+) ->np.ndarray:
+    """
+    Computes the exact distance from each of the points to the closest point on the surface mesh.
 
-        df.SetTuple1( i, dist )
+    All points are passed to a vtkImplicitPolyDataDistance at once, which finds the closest
+    point on the surface for each of them with a cell locator, without a Python call per point.
 
-    if signed:
-        pts = vtkPolyData()
-        pts.SetPoints( grid.GetPoints() )
+    Args:
+        mesh: The surface. Non-triangular polygons are triangulated, lines and vertices are ignored.
+        points: Nx3 array of query points.
 
-        enclosedPointSelector = vtkSelectEnclosedPoints()
-        e = ErrorObserver()
-        enclosedPointSelector.AddObserver("ErrorEvent", e)
-        enclosedPointSelector.GetExecutive().AddObserver("ErrorEvent", e)
-        enclosedPointSelector.CheckSurfaceOn()
-        enclosedPointSelector.SetInputData( pts )
-        enclosedPointSelector.SetSurfaceData( mesh )
-        enclosedPointSelector.SetTolerance( 1e-9 )
-        enclosedPointSelector.Update()
+    Returns:
+        Array of N distances.
+    """
+    triangle_filter = vtkTriangleFilter()
+    triangle_filter.SetInputData( mesh )
+    triangle_filter.PassVertsOff()
+    triangle_filter.PassLinesOff()
+    triangle_filter.Update()
+    triangles = triangle_filter.GetOutput()
+    if triangles.GetNumberOfCells() == 0:
+        raise ArithmeticError( "Cannot calculate distance field of a mesh without triangles." )
+
+    implicit_distance = vtkImplicitPolyDataDistance()
+    implicit_distance.SetInput( triangles )
+    dist = vtkDoubleArray()
+    implicit_distance.FunctionValue(
+            numpy_to_vtk( np.ascontiguousarray( points, dtype=np.float64 ), deep=False ), dist )
+    # The function value is signed (by the surface normals), the sign is determined
+    # separately where needed:
+    return np.abs( vtk_to_numpy( dist ) )
+
+def enclosed_points(
+    mesh: vtkPolyData,
+    grid: vtkPointSet,
+) ->np.ndarray:
+    """
+    Checks which points of the grid lie inside the (closed) surface mesh.
 
-        enclosedPoints = enclosedPointSelector.GetOutput()
+    Args:
+        mesh: Closed surface mesh.
+        grid: The points to test.
 
+    Returns:
+        Boolean array with one entry per grid point, True where the point is inside the mesh.
 
-        if e.ErrorOccurred():
-            raise ArithmeticError( "Could not calculate enclosed points. Maybe mesh is not closed?\nFull error was: " + e.ErrorMessage())
+    Raises:
+        ArithmeticError: If the inside/outside test failed, for example because the
+            mesh is not closed.
+    """
+    pts = vtkPolyData()
+    pts.SetPoints( grid.GetPoints() )
 
-        enclosedPoints = enclosedPointSelector.GetOutput()
+    enclosedPointSelector = vtkSelectEnclosedPoints()
+    e = ErrorObserver()
+    enclosedPointSelector.AddObserver("ErrorEvent", e)
+    enclosedPointSelector.GetExecutive().AddObserver("ErrorEvent", e)
+    enclosedPointSelector.CheckSurfaceOn()
+    enclosedPointSelector.SetInputData( pts )
+    enclosedPointSelector.SetSurfaceData( mesh )
+    enclosedPointSelector.SetTolerance( 1e-9 )
+    enclosedPointSelector.Update()
 
-        for i in range(0, grid.GetNumberOfPoints() ):
-            if enclosedPointSelector.IsInside(i):
-                df.SetTuple1( i, -df.GetTuple1(i) )     # invert sign
+    if e.ErrorOccurred():
+        raise ArithmeticError( "Could not calculate enclosed points. Maybe mesh is not closed?\nFull error was: " + e.ErrorMessage())
 
-    grid.GetPointData().AddArray( df )
+    selected = enclosedPointSelector.GetOutput().GetPointData().GetArray("SelectedPoints")
+    return vtk_to_numpy( selected ) != 0
 
 def distance_field_from_cloud(
     cloud: vtkDataSet, 
@@ -96,33 +129,12 @@ def distance_field_from_cloud(
         name: Name of the array of the grid where the distance field will be saved.
     """
 
-    # Initialize distance field:
-    df = vtkFloatArray()
-    df.SetNumberOfTuples( grid.GetNumberOfPoints() )
-    df.SetName(name)
-
-    # Data structure to quickly find cells:
-    pointLocator = vtkPointLocator()
-    pointLocator.SetDataSet( cloud )
-    pointLocator.BuildLocator()
-
-    for i in range(0, grid.GetNumberOfPoints() ):
-        # Take a point from the target...
-        testPoint = [0]*3
-        grid.GetPoint( i, testPoint )
-        # ... find the point in the surface closest to it
-        cID, subID, dist2 = mutable(0), mutable(0), mutable(0.0)
-        closestPoint = [0]*3
-        
-        closestPointID = pointLocator.FindClosestPoint( testPoint )
-        closestPoint = [0]*3
-        cloud.GetPoint( closestPointID, closestPoint )
-        #closestPoint = [0]*3
-        #mesh.GetPoint( closestPointID, closestPoint )
-        dist = math.sqrt( vtkMath.Distance2BetweenPoints( testPoint, closestPoint ) )
-        #dist = math.sqrt(dist2)
-        df.SetTuple1( i, dist )
+    # Query the closest cloud point for all grid points at once:
+    tree = cKDTree( vtk_to_numpy( cloud.GetPoints().GetData() ) )
+    dist, _ = tree.query( vtk_to_numpy( grid.GetPoints().GetData() ) )
 
+    df = numpy_to_vtk( dist.astype(np.float32), deep=True )
+    df.SetName(name)
     grid.GetPointData().AddArray( df )
 
 def distance_field_GPU(
@@ -150,28 +162,11 @@ def to_SDF(
     targetArrayName
 ):
     # surfaceMesh.GetCell(0).GetPointIds().GetId(0) for corner of first triangle
-    pts = vtkPolyData()
-    pts.SetPoints(targetGrid.GetPoints())
-
-    enclosedPointSelector = vtkSelectEnclosedPoints()
-    e = ErrorObserver()
-    enclosedPointSelector.AddObserver("ErrorEvent", e)
-    enclosedPointSelector.GetExecutive().AddObserver("ErrorEvent", e)
-
-    enclosedPointSelector.CheckSurfaceOn()
-    enclosedPointSelector.SetInputData(pts)
-    enclosedPointSelector.SetSurfaceData(surfaceMesh)
-
-    enclosedPointSelector.SetTolerance(1e-9)
-    enclosedPointSelector.Update()
-
-    if e.ErrorOccurred():
-        raise Exception( "Could not calculate enclosed points. Maybe mesh is not closed?\nFull error was: " + e.ErrorMessage())
+    inside = enclosed_points(surfaceMesh, targetGrid)
     sdf = targetGrid.GetPointData().GetArray(targetArrayName)
-
-    for i in range(0, targetGrid.GetNumberOfPoints()):
-        if enclosedPointSelector.IsInside(i):
-            sdf.SetTuple1(i, -sdf.GetTuple1(i))  # invert sign
+    sdf_values = vtk_to_numpy(sdf)
+    sdf_values[inside] = -sdf_values[inside]  # invert sign (in-place, shares memory with sdf)
+    sdf.Modified()
 
     return sdf
 
@@ -181,6 +176,9 @@ def create_grid(
 ) ->vtkStructuredGrid:
     """ 
     Creates a vtk grid with side length size meters, and num_cells cells.
+
+    The grid is copied from a template which is only generated once per process for
+    every combination of size and num_cells, see :func:`_create_grid_template`.
     
     Args:
         size: side-length of the generated grid in meters
@@ -190,20 +188,31 @@ def create_grid(
         vtkStructuredGrid
     """
     grid = vtkStructuredGrid()
-    grid.SetDimensions((num_cells, num_cells, num_cells))
-    points = vtkPoints()
-    points.SetNumberOfPoints(num_cells**3)
-    pID = 0
+    grid.DeepCopy( _create_grid_template( size, num_cells ) )
+    return grid
+
+@functools.lru_cache(maxsize=4)
+def _create_grid_template(
+    size: float,
+    num_cells: int,
+) ->vtkStructuredGrid:
+    """ 
+    Generates the grid points for :func:`create_grid`. The result is cached and must
+    not be modified.
+
+    Points are ordered with x varying fastest, then y, then z.
+    """
     start = -size/2
     d = size/(num_cells-1)
-    for i in range(0, num_cells):
-        for j in range(0, num_cells):
-            for k in range(0, num_cells):
-                x = start + d*k
-                y = start + d*j
-                z = start + d*i
-                points.SetPoint(pID, x, y, z)
-                pID += 1
+    coords = start + d*np.arange( num_cells )
+    z, y, x = np.meshgrid( coords, coords, coords, indexing="ij" )
+    xyz = np.stack( (x.ravel(), y.ravel(), z.ravel()), axis=1 ).astype(np.float32)
+
+    points = vtkPoints()
+    # numpy_to_vtk keeps a reference to xyz, so no copy is required:
+    points.SetData( numpy_to_vtk( xyz, deep=False ) )
+    grid = vtkStructuredGrid()
+    grid.SetDimensions((num_cells, num_cells, num_cells))
     grid.SetPoints(points)
     return grid
 
@@ -0,0 +1,130 @@
+####################################################
+## Geometry metadata of the meshes of a DataSample
+import os
+import hashlib
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from utils import vtkutils
+
+
+@dataclass
+class MeshGeometry():
+    """ Geometry metadata of a mesh file, see :meth:`DataSample.get_geometry`.
+
+    The counts and bounds are filled whenever a mesh is written through
+    :meth:`DataSample.write`. The more expensive values (area, volume and content hash) are
+    None until they are requested for the first time.
+    """
+    num_points: int
+    num_cells: int
+    bounds: List[float]
+    area: Optional[float] = None
+    volume: Optional[float] = None
+    content_hash: Optional[str] = None
+    # Modification time (ns) and size of the file the values were computed for, used to
+    # notice files that were changed on disk since:
+    file_stamp: Optional[List[int]] = None
+
+    @classmethod
+    def from_mesh(
+        cls,
+        mesh: vtk.vtkDataSet,
+    ) ->"MeshGeometry":
+        """ Collect the values which are cheap to compute. """
+        bounds = [0.0]*6
+        mesh.GetBounds(bounds)
+        return cls(num_points=int(mesh.GetNumberOfPoints()),
+                   num_cells=int(mesh.GetNumberOfCells()),
+                   bounds=[float(b) for b in bounds])
+
+    @classmethod
+    def from_dict(
+        cls,
+        d: dict,
+    ) ->"MeshGeometry":
+        return cls(**d)
+
+    def to_dict(
+        self,
+    ) ->dict:
+        return asdict(self)
+
+    @property
+    def size(
+        self,
+    ) ->(float, float, float):
+        """ Dimensions of the bounding box, see :func:`vtkutils.calc_mesh_size`. """
+        return (self.bounds[1] - self.bounds[0],
+                self.bounds[3] - self.bounds[2],
+                self.bounds[5] - self.bounds[4])
+
+    def missing(
+        self,
+        area: bool = False,
+        volume: bool = False,
+        content_hash: bool = False,
+    ) ->bool:
+        """ True if one of the requested values has not been computed yet. """
+        return (area and self.area is None) or (volume and self.volume is None) or \
+                (content_hash and self.content_hash is None)
+
+    def complete(
+        self,
+        mesh: vtk.vtkDataSet,
+        area: bool = False,
+        volume: bool = False,
+        content_hash: bool = False,
+    ) ->None:
+        """ Compute the requested values, unless they are already known.
+
+        Args:
+            mesh: The mesh this metadata belongs to.
+            area: Compute the surface area. For volume meshes, this is the area of the
+                surface extracted with :func:`vtkutils.extract_surface`.
+            volume: Compute the volume with :func:`vtkutils.calc_volume`.
+            content_hash: Compute a hash of the point coordinates and cells.
+        """
+        if area and self.area is None:
+            surface = mesh if isinstance(mesh, vtk.vtkPolyData) else vtkutils.extract_surface(mesh)
+            self.area = float(vtkutils.calc_surface_area(surface))
+        if volume and self.volume is None:
+            self.volume = float(vtkutils.calc_volume(mesh))
+        if content_hash and self.content_hash is None:
+            self.content_hash = calc_content_hash(mesh)
+
+
+def calc_content_hash(
+    mesh: vtk.vtkDataSet,
+) ->str:
+    """ SHA-256 of the point coordinates and the cells of a mesh (data arrays are ignored). """
+    h = hashlib.sha256()
+    if mesh.GetPoints() is not None:
+        h.update(vtk_to_numpy(mesh.GetPoints().GetData()).tobytes())
+    if isinstance(mesh, vtk.vtkPolyData):
+        cell_arrays = [mesh.GetVerts(), mesh.GetLines(), mesh.GetPolys(), mesh.GetStrips()]
+    elif isinstance(mesh, vtk.vtkUnstructuredGrid):
+        cell_arrays = [mesh.GetCells()]
+        if mesh.GetCellTypesArray() is not None:
+            h.update(vtk_to_numpy(mesh.GetCellTypesArray()).tobytes())
+    else:
+        cell_arrays = []
+    for cells in cell_arrays:
+        if cells is None:
+            continue
+        h.update(vtk_to_numpy(cells.GetOffsetsArray()).tobytes())
+        h.update(vtk_to_numpy(cells.GetConnectivityArray()).tobytes())
+    return h.hexdigest()
+
+
+def file_stamp(
+    path: str,
+) ->Optional[List[int]]:
+    """ Modification time (ns) and size of a file, or None if it does not exist. """
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [int(stat.st_mtime_ns), int(stat.st_size)]
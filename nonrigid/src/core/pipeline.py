@@ -1,11 +1,9 @@
 import sys, os, psutil, time
-from concurrent.futures import ProcessPoolExecutor as Pool # requires python 3.8
-from concurrent.futures import as_completed
-from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import traceback
 import vtk
 import re
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Set
 import argparse
 import statistics
 
@@ -13,6 +11,7 @@ from core.pipeline_block import PipelineBlock
 from core.dataset import Dataset
 from core.datasample import DataSample
 from core.log import Log
+from core.worker_pool import WorkerPool
 import core.io
 from core.exceptions import SampleProcessingException, SampleValidationException
 import core.plot_statistics as plot_statistics
@@ -35,6 +34,9 @@ class Pipeline():
             launch_sofa_gui: bool = False,
             pre_existing_files: List[str] = [],
             max_processes: int = os.cpu_count()-1,
+            max_samples_per_worker: int = 5,
+            max_worker_memory: Optional[float] = None,
+            block_threads: int = 1,
             **kwargs
     ):
         """Initializes the pipeline class.
@@ -44,12 +46,24 @@ class Pipeline():
             do_not_retry_blocks: .
             statistics_only:.
             run_sequential:.
+            max_processes: Number of worker processes used to process samples in parallel.
+            max_samples_per_worker: Restart a worker process after it has processed this
+                many samples (to counter memory accumulation). 0 disables this.
+            max_worker_memory: Restart a worker process after a sample if its memory
+                consumption (RSS, in GB) exceeds this value. None or 0 disables this.
+            block_threads: Number of threads used to run independent blocks of the same
+                sample concurrently. With 1 (default), blocks run in the order they were
+                appended. With more threads, each block draws from its own random generator
+                (see :meth:`DataSample.block_random`), so results are reproducible for a given
+                seed, but differ from those of a run with block_threads=1.
             **kwargs
         """
  
         self.only_aggregate_statistics = statistics_only
 
         self.pipeline_blocks = []
+        # For every block, the indices of the previous blocks it depends on:
+        self.block_dependencies = []
         #self.all_filenames = []
 
         self.run_parallel = not run_sequential
@@ -86,6 +100,9 @@ class Pipeline():
             self.launch_sofa_gui = False
 
         self.max_workers = max_processes
+        self.max_samples_per_worker = max_samples_per_worker
+        self.max_worker_memory = max_worker_memory
+        self.block_threads = max(block_threads, 1)
         self.mem = {"main":[], "children":[], "total":[]}
 
         # result plotting
@@ -105,7 +122,7 @@ class Pipeline():
                 " from PipelineBlock!"
 
         # Check what previously created blocks produce and consume:
-        prev_outputs = self.pre_existing_files
+        prev_outputs = list(self.pre_existing_files)
         prev_inputs = []
         for b in self.pipeline_blocks:
             prev_outputs += b.outputs
@@ -115,12 +132,7 @@ class Pipeline():
         for inp in block.inputs:
             found = False
             for p in prev_outputs:
-                # DEBUG
-                # print(f"matching {p} against {inp}:")
-                # print(f"\twith match inp->p: {re.match(inp, p)}")
-                # print(f"\twith match p->inp: {re.match(p, inp)}")
-                # print(f"\twith equality: {p == inp}")
-                if p == inp or re.match(inp, p) or re.match(p, inp):
+                if Pipeline._filename_matches(p, inp):
                     found = True
                     break
             if not found:
@@ -150,6 +162,7 @@ class Pipeline():
             if type(b) == type(block):
                 type_id += 1
 
+        self.block_dependencies.append(self._find_dependencies(block))
         self.pipeline_blocks.append(block)
         block.set_block_id(len(self.pipeline_blocks)-1, type_id)
 
@@ -158,6 +171,51 @@ class Pipeline():
         #self.histogram_keys.append( "Timing_" + block_name )   # TODO
         #self.all_filenames += block.outputs
 
+    @staticmethod
+    def _filename_matches(
+        output: str,
+        inp: str,
+    ) ->bool:
+        """ Check if an output (pattern) of one block satisfies an input (pattern) of another.
+        """
+        return output == inp or bool(re.match(inp, output)) or bool(re.match(output, inp))
+
+    def _find_dependencies(
+        self,
+        block: PipelineBlock,
+    ) ->Set[int]:
+        """ Find the indices of all previously appended blocks which the given block depends on.
+
+        A block depends on every previous block that (optionally) produces one of its inputs.
+        Blocks can also communicate through the sample's config (for example the scene
+        objects), which is not declared. To be on the safe side, a block without inputs
+        depends on all previous blocks and a block without outputs is a dependency of all
+        following blocks.
+        """
+        dependencies = set()
+        for i, b in enumerate(self.pipeline_blocks):
+            if len(block.inputs) == 0 or len(b.outputs) == 0:
+                dependencies.add(i)
+                continue
+            for inp in block.inputs:
+                if any(Pipeline._filename_matches(p, inp)
+                        for p in b.outputs + b.optional_outputs):
+                    dependencies.add(i)
+                    break
+        return dependencies
+
+    def _find_successors(
+        self,
+        block_index: int,
+    ) ->Set[int]:
+        """ Find the indices of all blocks which (directly or indirectly) depend on a block. """
+        successors = set()
+        for i in range(block_index+1, len(self.pipeline_blocks)):
+            deps = self.block_dependencies[i]
+            if block_index in deps or len(deps & successors) > 0:
+                successors.add(i)
+        return successors
+
     def add_plot( self, plot_config ):
         self.plots.append( plot_config )
 
@@ -167,8 +225,9 @@ class Pipeline():
     ) ->None:
         """Run the whole pipeline, on each sample.
         
-        Currently, the pipeline is run for each sample in sequence, i.e. sample 1 is finished before sample 2 is started.
-        TODO: Threading of blocks!
+        Samples are distributed to worker processes (unless run_sequential is set). Within
+        a sample, blocks run in the order they were appended, or - if block_threads > 1 -
+        independent blocks run concurrently, see :meth:`Pipeline.run_sample`.
 
         Args:
             dataset:
@@ -207,6 +266,10 @@ class Pipeline():
                         msg=f"Using {self.max_workers} sub-processes.")
             else:
                 Log.log(module="Pipeline", severity="WARN", msg=f"Using 0 sub-processes.")
+            if self.block_threads > 1:
+                Log.log(module="Pipeline", severity="INFO",
+                        msg=f"Using {self.block_threads} threads per sample to run " +\
+                        "independent blocks concurrently.")
 
 
             start_time = time.time()
@@ -217,52 +280,25 @@ class Pipeline():
                     self.run_sample(sample)
             else:
 
-                # Note: The following may be slightly confusing. We use
-                # ProcessExecuterPool 'pool' to run multiple instances of the "run_sample"
-                # function in parallel. Each run_sample instance is passed a single
-                # DataSample to process. However, if a pool is created for the full
-                # dataset, the processes keep accumulating memory, an issue which we've
-                # not found a solution for yet.
-                # The workaround is to split the dataset into chunks of size
-                # "samples_per_iteration" and create a pool for each of these chunks
-                # (sequentially). The slowdown due to this is minor, but it seems to fix
-                # the memory leak.
-                total_samples = len(dataset)
-                done_samples = 0
-                samples_per_iteration = self.max_workers*5
-
-                while done_samples < total_samples:
-
-                    # Data-parallel:
-                    with Pool(max_workers=self.max_workers) as pool:
-                        try:
-                            samples_to_run = min(samples_per_iteration, total_samples - done_samples)
-                            subset = dataset[done_samples:done_samples+samples_to_run]
-                            # Map each sample to a process which will run the 'run_sample'
-                            # function on it:
-                            futures = [pool.submit(self.run_sample, s) for s in subset]
-
-                            for future in as_completed(futures):
-                                # Get result:
-                                result_sample = future.result()
-                                # The processes worked on copies of the samples, so return them back
-                                # into the original dataset:
-                                dataset.replace_sample(result_sample)
-                                # Keep track of current memory usage:
-                                self.print_memory_usage()
-
-                            # The processes worked on copies of the samples, so return them back
-                            # into the original dataset:
-                            #for i, sample in enumerate(results):
-                            #    dataset.replace_sample(i, sample)
-                        except BrokenProcessPool as e:
-                            msg="BrokenProcessPool! " +\
-                                "Something within a sub-process went wrong. The following error message " +\
-                                f"was received: {e}"
-                            Log.log( module="Pipeline", severity="FATAL", msg=msg )
-                            raise Exception( msg )
-                    done_samples += samples_to_run
-
+                # Note: We use a WorkerPool of long-lived processes to run multiple
+                # instances of the "run_sample" function in parallel. Each run_sample
+                # instance is passed a single DataSample to process, and a worker receives
+                # its next sample as soon as it is done with the previous one.
+                # The processes tend to accumulate memory, an issue which we've not found
+                # a solution for yet. As a workaround, the pool restarts each worker after
+                # "max_samples_per_worker" samples or when it exceeds "max_worker_memory".
+                pool = WorkerPool(self.run_sample,
+                        max_workers=self.max_workers,
+                        max_tasks_per_worker=self.max_samples_per_worker,
+                        max_worker_memory=self.max_worker_memory)
+                with pool:
+                    for result_sample in pool.imap_unordered(dataset):
+                        # The processes worked on copies of the samples, so return them back
+                        # into the original dataset:
+                        dataset.replace_sample(result_sample)
+                        # Keep track of current memory usage:
+                        self.print_memory_usage()
+                Log.log(module="Pipeline", severity="INFO", msg=pool.report())
 
             end_time = time.time()
             speed = len(dataset)/(end_time-start_time)
@@ -278,6 +314,8 @@ class Pipeline():
 
         stats, configs = dataset.aggregate_configs_and_statistics( )
 
+        self.print_block_timings(stats)
+
         self.plot_results(
                 stats = stats,
                 configs = configs,
@@ -303,47 +341,32 @@ class Pipeline():
         self,
         sample: DataSample,
     ) ->DataSample:
-        """
+        """ Run all blocks of the pipeline on a single sample.
+
+        A block is run if it has not yet been processed successfully for this sample, if
+        it was forced to run, if it produces no outputs or if a block it depends on was
+        run. If block_threads > 1, blocks whose dependencies are done are run concurrently
+        in separate threads.
+
         Args:
             sample:
         
         Returns:
             DataSample
         """
-        first_block_triggered = False
-        for block in self.pipeline_blocks:
-            if sample.processable:    # Only run if the sample has not encountered an error
-
-                # Check if the output files for this block already exist.
-                # If so, there's no need to re-run this block for this sample:
-                #requires_calculation = not sample.has_files(block.outputs)
-                # Check if a previous run has already successfuly processed _and validated_ this block
-                # for the current sample:
-                requires_calculation = not sample.get_successfully_processed( block )
-                # Check if the recalculation has been forced manually:
-                block_name = block.unique_name
-                # Check if a block needs to re-run or should be skipped.
-                # Note that these two conditions are mutually exclusive!
-                forced = block_name in self.force_run_blocks
-                if forced and not requires_calculation:
-                    msg = f"Forced recalculation of '{block_name}'"
-                    Log.log(module="Pipeline", severity="WARN", msg=msg)
-                has_outputs = len(block.outputs) > 0
-
-                if first_block_triggered or requires_calculation or forced or not has_outputs:
-                    # Before running, make sure previous output/config is deleted:
-                    self.remove_results(sample, block)
-
-                    if has_outputs:
-                        # If we run this block, make sure that all the following blocks
-                        # know that they need re-calculation:
-                        self.remove_results_of_successors(sample, block)
-                        # Remember that a block has been run, so that all future blocks will also need to be
-                        # run:
-                        first_block_triggered = True
-
-                    # Run block:
-                    self._safe_run(block, sample)
+        if self.block_threads > 1:
+            self._run_blocks_concurrently(sample)
+        else:
+            first_block_triggered = False
+            for block in self.pipeline_blocks:
+                if sample.processable:    # Only run if the sample has not encountered an error
+                    if self._prepare_block(sample, block, first_block_triggered):
+                        if len(block.outputs) > 0:
+                            # Remember that a block has been run, so that all future blocks
+                            # will also need to be run:
+                            first_block_triggered = True
+                        # Run block:
+                        self._safe_run(block, sample)
 
         sample.save_config()
         sample.save_statistics()
@@ -356,6 +379,110 @@ class Pipeline():
 
         return sample
 
+    def _prepare_block(
+        self,
+        sample: DataSample,
+        block: PipelineBlock,
+        triggered: bool,
+    ) ->bool:
+        """ Decide whether the block needs to run on the sample. If so, remove its previous
+        results and those of all blocks which depend on it.
+
+        Args:
+            sample:
+            block:
+            triggered: Whether a block which this block depends on was run.
+
+        Returns:
+            True if the block must be run.
+        """
+        # Check if the output files for this block already exist.
+        # If so, there's no need to re-run this block for this sample:
+        #requires_calculation = not sample.has_files(block.outputs)
+        # Check if a previous run has already successfuly processed _and validated_ this block
+        # for the current sample:
+        requires_calculation = not sample.get_successfully_processed( block )
+        # Check if the recalculation has been forced manually:
+        block_name = block.unique_name
+        # Check if a block needs to re-run or should be skipped.
+        # Note that these two conditions are mutually exclusive!
+        forced = block_name in self.force_run_blocks
+        if forced and not requires_calculation:
+            msg = f"Forced recalculation of '{block_name}'"
+            Log.log(module="Pipeline", severity="WARN", msg=msg)
+        has_outputs = len(block.outputs) > 0
+
+        if not (triggered or requires_calculation or forced or not has_outputs):
+            return False
+
+        # Before running, make sure previous output/config is deleted:
+        self.remove_results(sample, block)
+
+        if has_outputs:
+            # If we run this block, make sure that all the following blocks
+            # know that they need re-calculation:
+            self.remove_results_of_successors(sample, block)
+        return True
+
+    def _run_blocks_concurrently(
+        self,
+        sample: DataSample,
+    ) ->None:
+        """ Run the blocks on the sample, following the dependency graph of the blocks.
+
+        Every block is started as soon as all blocks it depends on are done, so independent
+        blocks run in parallel threads. Once the sample becomes unprocessable, no further
+        blocks are started.
+        """
+        num_blocks = len(self.pipeline_blocks)
+        done = [False]*num_blocks
+        # Whether running a block requires its dependants to run as well:
+        triggers = [False]*num_blocks
+        started = set()
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.block_threads) as executor:
+            while True:
+                # Start all blocks whose dependencies are done. Blocks which don't need
+                # to run are marked as done immediately, which may unlock further blocks:
+                progress = True
+                while progress and sample.processable:
+                    progress = False
+                    for i, block in enumerate(self.pipeline_blocks):
+                        if i in started:
+                            continue
+                        deps = self.block_dependencies[i]
+                        if not all(done[j] for j in deps):
+                            continue
+                        started.add(i)
+                        progress = True
+                        triggered = any(triggers[j] for j in deps)
+                        if self._prepare_block(sample, block, triggered):
+                            triggers[i] = triggered or len(block.outputs) > 0
+                            running[executor.submit(self._run_block_thread, block, sample, i)] = i
+                        else:
+                            triggers[i] = triggered
+                            done[i] = True
+                if len(running) == 0:
+                    break
+                finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    future.result()
+                    done[i] = True
+
+    def _run_block_thread(
+        self,
+        block: PipelineBlock,
+        sample: DataSample,
+        block_index: int,
+    ) ->None:
+        """ Run a block in a thread of :meth:`Pipeline._run_blocks_concurrently`, with a
+        random generator of its own.
+        """
+        with sample.block_random(block_index):
+            self._safe_run(block, sample)
+
     def _safe_run(
         self,
         block: PipelineBlock,
@@ -369,7 +496,10 @@ class Pipeline():
             sample: 
         """
 
-        start_time = time.process_time()
+        # CPU time of this thread only: with block_threads > 1, the process time would also
+        # contain the blocks running concurrently on other threads.
+        start_time = time.thread_time()
+        wall_start_time = time.time()
         block_name = block.unique_name
         
         try:
@@ -403,8 +533,9 @@ class Pipeline():
             msg += f"Traceback:\n\t{traceback.format_exc()}"
             Log.log(module="Pipeline", severity="FATAL", msg=msg)
 
-        end_time = time.process_time()
+        end_time = time.thread_time()
         sample.add_timing( block, end_time - start_time )
+        sample.add_statistic( block, "WallTime", time.time() - wall_start_time )
 
     def print_memory_usage(self):
 
@@ -450,20 +581,26 @@ class Pipeline():
         sample: DataSample,
         start_block: PipelineBlock,
     ) -> None:
-        """  
+        """ Remove the results of all blocks which (directly or indirectly) depend on start_block.
+
+        When blocks are run in order, this clears all following blocks. When independent
+        blocks run concurrently, only the blocks depending on start_block are cleared.
+
         Args:
             sample:
             start_block:
 
         """
-        found_start_block = False
-        for block in self.pipeline_blocks:
-            if found_start_block:
-                sample.clear_files(block.outputs)
-                sample.clear_config(block)
-                sample.clear_statistics(block)
-            if block == start_block:
-                found_start_block = True
+        start_index = self.pipeline_blocks.index(start_block)
+        if self.block_threads > 1:
+            successors = self._find_successors(start_index)
+        else:
+            successors = range(start_index+1, len(self.pipeline_blocks))
+        for i in successors:
+            block = self.pipeline_blocks[i]
+            sample.clear_files(block.outputs)
+            sample.clear_config(block)
+            sample.clear_statistics(block)
 
 #    def aggregate_statistics(
 #        self,
@@ -559,6 +696,13 @@ class Pipeline():
                 "labels":timing_labels,
                 "y_label":"sec",
             } )
+        self.add_plot( {
+                "type":"BOX",
+                "keys":[key.replace("|Timing", "|WallTime") for key in timing_keys],
+                "name":"BlockWallTime",
+                "labels":timing_labels,
+                "y_label":"sec",
+            } )
 
         # Plot every plot that was previously added via Pipeline.add_plot():
         for p in plots:
@@ -608,6 +752,50 @@ class Pipeline():
         #elif not self.only_aggregate_statistics:
         #    Log.log(severity="WARN", module="Pipeline", msg="No timings found for the configured blocks!")
 
+    def print_block_timings(
+        self,
+        stats: dict,
+    ) ->None:
+        """ Print the average wall time of every block and the critical path through the
+        dependency graph of the blocks.
+
+        The critical path is the chain of dependent blocks with the longest total wall time,
+        i.e. the minimum time per sample even if all independent blocks run concurrently.
+
+        Args:
+            stats: Nested dictionary of saved sample statistics as
+                {sample.id: sample.statistics}.
+        """
+        mean_times = []
+        msg = "Average wall time per block:"
+        for block in self.pipeline_blocks:
+            times = [s[block.unique_name]["WallTime"] for s in stats.values()
+                    if block.unique_name in s and "WallTime" in s[block.unique_name]]
+            mean_time = statistics.mean(times) if len(times) > 0 else 0
+            mean_times.append(mean_time)
+            msg += f"\n\t{block.unique_name}: {mean_time:.3f} s ({len(times)} samples)"
+
+        # Longest path through the graph. Blocks only depend on previous blocks, so the
+        # list order is a topological order:
+        path_time = []
+        path_prev = []
+        for i in range(len(self.pipeline_blocks)):
+            prev = max(self.block_dependencies[i], key=lambda j: path_time[j], default=None)
+            path_prev.append(prev)
+            path_time.append(mean_times[i] + (path_time[prev] if prev is not None else 0))
+        if len(path_time) == 0:
+            return
+        i = max(range(len(path_time)), key=lambda j: path_time[j])
+        critical_time = path_time[i]
+        critical_path = []
+        while i is not None:
+            critical_path.insert(0, self.pipeline_blocks[i].unique_name)
+            i = path_prev[i]
+
+        msg += f"\nCritical path ({critical_time:.3f} s of {sum(mean_times):.3f} s): " +\
+                " -> ".join(critical_path)
+        Log.log(module="Pipeline", severity="INFO", msg=msg)
+
     def print_pipeline(
         self
     ) ->None:
@@ -617,6 +805,11 @@ class Pipeline():
         prev_block_needs_rerun = False
         for i, block in enumerate(self.pipeline_blocks):
             msg += f"\n\tBlock: {block}"
+            deps = sorted(self.block_dependencies[i])
+            if self.block_threads > 1 and len(deps) > 0:
+                msg += f"\n\t\tWaits for:"
+                for j in deps:
+                    msg += f" {self.pipeline_blocks[j].unique_name}"
             msg += f"\n\t\tUses:"
             for filename in block.inputs:
                 msg += f" {filename}"
@@ -671,5 +864,15 @@ class Pipeline():
                 help="Launches the simulation with SOFA GUI. Useful for debugging, but much slower!")
         group.add_argument("--max_processes", type=int, default=os.cpu_count()-1,
                 help="Number of worker processes to use. Default: Number of CPU cores minus 1.")
+        group.add_argument("--max_samples_per_worker", type=int, default=5,
+                help="Restart a worker process after it has processed this many samples." +\
+                        " Counters memory accumulation in the workers. 0 disables restarts." +\
+                        " Default: 5")
+        group.add_argument("--max_worker_memory", type=float,
+                help="Restart a worker process once its memory consumption (RSS) exceeds" +\
+                        " this value (in GB). Checked after every sample.")
+        group.add_argument("--block_threads", type=int, default=1,
+                help="Number of threads per sample used to run blocks which don't depend" +\
+                        " on each other concurrently. Default: 1 (run blocks in order)")
 
 
@@ -1,3 +1,4 @@
+import io
 import numpy as np
 from typing import Optional, Union
 
@@ -64,8 +65,9 @@ class SpringBoundaries(Sofa.Core.Controller):
                 If a list is provided, it must be of length N (one value per spring).
             active: if True, springs are activated. Otherwise, spring stiffness is set to zero
                 at the beginning and activated once the flag is manually triggered during the simulation.
-            incremental: if True, spring stiffness is incremented at each simulation step (if "active" flag is also True)
-                until it reaches the final value provided in "stiffness" (default: False).
+            incremental: if True, spring stiffness starts at zero and is incremented at each simulation step (if "active"
+                flag is also True) until it reaches the final value provided in "stiffness" (default: False). All springs
+                are updated with a single write to the force field.
             num_steps: if spring stiffness is applied incrementally, it defines the number of steps to use to apply it (default: 10).
             view_end_points: If True, springs end points are drawn in green.
             view: If True, springs will be drawn as green cylinders.
@@ -87,7 +89,9 @@ class SpringBoundaries(Sofa.Core.Controller):
         self.stiff_springs = []
         self.ssff_start_id = np.asarray(self.start_indices, dtype=int)
         self.ssff_end_id   = np.arange(len(self.end_points), dtype=int)
-        self.ssff_k  	   = self.active * self.__init_array(self.stiffness, len(self.start_indices))
+        self.ssff_k_target = self.__init_array(self.stiffness, len(self.start_indices))
+        # Incremental springs start without stiffness and are ramped up to ssff_k_target
+        self.ssff_k  	   = (self.active and not self.incremental) * self.ssff_k_target
         self.ssff_kd 	   = np.zeros_like(self.ssff_start_id)
         self.ssff_l 	   = self.__init_array(self.rest_length, len(self.start_indices))
 
@@ -102,9 +106,8 @@ class SpringBoundaries(Sofa.Core.Controller):
         if not self.incremental:
             self.num_steps = 1.0
         else:
-            self.delta_k = np.asarray(self.stiffness) / self.num_steps
-            if isinstance(self.delta_k, float):
-                self.delta_k = self.delta_k * np.ones((len(self.start_indices),))
+            # One stiffness increment per spring, applied to all springs at once
+            self.delta_k = self.ssff_k_target / self.num_steps
         
         assert len(self.start_indices) == len(self.end_points), "Number of start_indices must be the same as number of end_points."
 
@@ -125,22 +128,25 @@ class SpringBoundaries(Sofa.Core.Controller):
         if self.view_end_pts:
             self.__visualize_end_pts()
 
-        # Create one stiff spring per point
-        for i in range(len(self.end_points)):
-            ss = self.node.addObject("StiffSpringForceField", 
-                                name="Spring"+str(i),
-                                stiffness = self.ssff_k[i],
-                                #length 	  = self.ssff_l[i],
-                                lengths   = [self.ssff_l[i]],
-                                damping   = self.ssff_kd[i],
-                                object1   = parent_node_state_link, 
-                                object2   = "@end_points", 
-                                indices1  = self.ssff_start_id[i],
-                                indices2  = self.ssff_end_id[i],
-                                listening = 1,
-                                drawMode  = 1,
-                                showArrowSize = int(view)*0.0002 )
-            self.stiff_springs.append(ss)
+        # Create all springs in one force field, with array-valued indices and lengths.
+        # (One force field per spring makes scene creation and every time step scale with the
+        # number of springs.)
+        uniform = self.__is_uniform()
+        ss = self.node.addObject("StiffSpringForceField", 
+                            name      = "Springs",
+                            stiffness = self.ssff_k[0] if uniform else 0.0,
+                            damping   = self.ssff_kd[0] if uniform else 0.0,
+                            lengths   = self.ssff_l.tolist(),
+                            object1   = parent_node_state_link, 
+                            object2   = "@end_points", 
+                            indices1  = self.ssff_start_id.tolist(),
+                            indices2  = self.ssff_end_id.tolist(),
+                            listening = 1,
+                            drawMode  = 1,
+                            showArrowSize = int(view)*0.0002 )
+        self.stiff_springs.append(ss)
+        if not uniform:
+            self.__populate_springs()
         
         #print('Number of spring attachments created:', len(self.stiff_springs))
 
@@ -156,13 +162,13 @@ class SpringBoundaries(Sofa.Core.Controller):
             # If springs needs to be incremented
             if self.incremental:
                 self.__increment_stiffness()
-                if self.ssff_k[0] >= (self.delta_k[0]*self.num_steps - 1e-05): 
+                if np.all(self.ssff_k >= self.ssff_k_target - 1e-05): 
                     #print('STOP incrementing spring stiffness')
                     self.incremental = False
                     self.__is_inactive = False
             elif self.__is_inactive:
-                self.ssff_k = self.__init_array(self.stiffness, len(self.start_indices))
-                self.__populate_springs()
+                self.ssff_k = self.ssff_k_target.copy()
+                self.__populate_springs(lengths=False)
                 self.__is_inactive = False
             
     def update_rest_length(self, pos1, pos2):
@@ -184,20 +190,39 @@ class SpringBoundaries(Sofa.Core.Controller):
         if isinstance(in_data, float) or isinstance(in_data, int):
             out_array = in_data * np.ones((out_length))
         else:
-            out_array = np.asarray(in_data)
+            out_array = np.asarray(in_data, dtype=float)
         return out_array
 
+    def __is_uniform(self):
+        """ True if all springs share the same stiffness and damping. """
+        return len(self.ssff_k) == 0 or \
+                (np.all(self.ssff_k == self.ssff_k[0]) and np.all(self.ssff_kd == self.ssff_kd[0]))
+
     def __increment_stiffness(self):
-        self.ssff_k += self.delta_k
-        self.__populate_springs()
+        self.ssff_k = np.minimum(self.ssff_k + self.delta_k, self.ssff_k_target)
+        self.__populate_springs(lengths=False)
     
-    def __populate_springs(self):
-        for i, ss in enumerate(self.stiff_springs):
-            ss.stiffness.value = self.ssff_k[i]
-            ss.damping.value   = self.ssff_kd[i]
-            #ss.d_length.value    = self.ssff_l[i]
-            ss.lengths.value    = [self.ssff_l[i]]
+    def __populate_springs(self, lengths=True):
+        """ Write the current spring parameters to the force field, in one update for all springs.
+
+        Args:
+            lengths: If False, the rest lengths are assumed unchanged and are not written
+                (e.g. while only the stiffness is ramped up).
+        """
+        ss = self.stiff_springs[0]
+        if self.__is_uniform():
+            ss.stiffness.value = float(self.ssff_k[0]) if len(self.ssff_k) else 0.0
+            ss.damping.value   = float(self.ssff_kd[0]) if len(self.ssff_kd) else 0.0
+            if lengths:
+                ss.lengths.value = np.asarray(self.ssff_l, dtype=float).tolist()
             ss.reinit()
+        else:
+            # Per-spring stiffness: write all springs ("index1 index2 stiffness damping length")
+            springs = np.column_stack((self.ssff_start_id, self.ssff_end_id, self.ssff_k,
+                    self.ssff_kd, np.asarray(self.ssff_l, dtype=float)))
+            buffer = io.StringIO()
+            np.savetxt(buffer, springs, fmt="%d %d %.17g %.17g %.17g", newline=" ")
+            ss.findData("spring").read(buffer.getvalue())
 
     def __visualize_end_pts(self, scale=10, color=[0,1,0,1] ):
         self.end_points_state.showObject=1
@@ -0,0 +1,137 @@
+import numpy as np
+from enum import Enum
+from typing import Optional
+
+
+class ConvergenceMetric(Enum):
+    """
+    Class with possible quantities used to decide whether a simulation has reached equilibrium.
+    """
+    # Mean norm of the nodal velocities
+    VELOCITY               = "velocity"
+    # Kinetic energy per unit mass, 0.5 * mean squared norm of the nodal velocities
+    KINETIC_ENERGY         = "kinetic_energy"
+    # Maximum distance a node moved since the previous evaluation, divided by the time in between
+    DISPLACEMENT_INCREMENT = "displacement_increment"
+    # Norm of the nodal forces relative to their norm at the first evaluation
+    RELATIVE_RESIDUAL      = "relative_residual"
+
+
+def _view(data: "Sofa.Core.Data") ->np.ndarray:
+    """ Read-only numpy view of a SOFA vector data field, without copying it where possible. """
+    if hasattr(data, "array"):
+        return data.array()
+    return np.asarray(data.value)
+
+
+class ConvergenceMonitor:
+    """ Decides when a simulation has converged, based on one of several metrics.
+
+    The metric is evaluated on the state of a MechanicalObject every check_every time steps
+    (directly on the SOFA arrays). The simulation is considered converged once the metric
+    drops below the threshold, but not before min_steps time steps.
+
+    Call :meth:`reset` before the first step of a simulation and :meth:`update` after every
+    step. The number of steps until convergence and the final value of the metric are
+    recorded and can be added to the sample statistics with :meth:`add_statistics`.
+    """
+
+    def __init__(
+        self,
+        metric: ConvergenceMetric = ConvergenceMetric.VELOCITY,
+        threshold: float = 0.001,
+        check_every: int = 1,
+        min_steps: int = 0,
+    ):
+        """
+        Args:
+            metric: Quantity which is compared to the threshold, see :class:`ConvergenceMetric`.
+            threshold: The simulation is converged when the metric is below this value.
+            check_every: Evaluate the metric only every check_every time steps. Convergence is
+                detected up to check_every - 1 steps late, but the evaluations cost less.
+            min_steps: Never report convergence before this many time steps.
+        """
+        assert check_every >= 1, "check_every must be at least 1"
+        self.metric = ConvergenceMetric(metric)
+        self.threshold = threshold
+        self.check_every = check_every
+        self.min_steps = min_steps
+        self.reset()
+
+    def reset(self) ->None:
+        """ Forget the previous simulation. """
+        self.step = 0
+        self.num_evaluations = 0
+        self.value = None
+        self.converged = False
+        self.steps_to_convergence = None
+        self._previous_positions = None
+        self._initial_residual = None
+
+    def _evaluate(self, state: "Sofa.Core.Object", dt: float) ->Optional[float]:
+        if self.metric == ConvergenceMetric.VELOCITY:
+            v = _view(state.velocity)
+            return float(np.sqrt(np.einsum("ij,ij->i", v, v)).mean())
+        elif self.metric == ConvergenceMetric.KINETIC_ENERGY:
+            v = _view(state.velocity)
+            return float(0.5*np.einsum("ij,ij->", v, v)/max(len(v), 1))
+        elif self.metric == ConvergenceMetric.DISPLACEMENT_INCREMENT:
+            x = _view(state.position)
+            if self._previous_positions is None:
+                self._previous_positions = np.array(x)
+                return None
+            increment = x - self._previous_positions
+            np.copyto(self._previous_positions, x)
+            return float(np.sqrt(np.einsum("ij,ij->i", increment, increment).max())/(self.check_every*dt))
+        elif self.metric == ConvergenceMetric.RELATIVE_RESIDUAL:
+            f = _view(state.force)
+            residual = float(np.sqrt(np.einsum("ij,ij->", f, f)))
+            if self._initial_residual is None:
+                self._initial_residual = residual
+            if self._initial_residual == 0:
+                return 0.0
+            return residual/self._initial_residual
+
+    def update(self, state: "Sofa.Core.Object", dt: float) ->bool:
+        """ Count one time step and evaluate the metric, if it is due.
+
+        Args:
+            state: The MechanicalObject of the simulated object.
+            dt: The time step.
+
+        Returns:
+            True if the simulation has converged. Once it has, further calls (e.g. for steps
+            which are still run by Sofa.Simulation.animateNSteps) are not counted.
+        """
+        if self.converged:
+            return True
+        self.step += 1
+        if self.step % self.check_every != 0:
+            return False
+        self.num_evaluations += 1
+        value = self._evaluate(state, dt)
+        if value is None:
+            return False
+        self.value = value
+        if self.step >= self.min_steps and value < self.threshold:
+            self.converged = True
+            self.steps_to_convergence = self.step
+        return self.converged
+
+    def config(self) ->dict:
+        """ Parameters of the monitor, for the sample config. """
+        return {"metric": self.metric.value, "threshold": self.threshold,
+                "check_every": self.check_every, "min_steps": self.min_steps}
+
+    def add_statistics(self, sample, block) ->None:
+        """ Record the outcome of the last simulation in the sample statistics.
+
+        Args:
+            sample: The DataSample which was simulated.
+            block: The PipelineBlock running the simulation.
+        """
+        sample.add_statistic(block, "converged", self.converged)
+        sample.add_statistic(block, "steps_to_convergence", self.steps_to_convergence)
+        sample.add_statistic(block, "convergence_steps_run", self.step)
+        sample.add_statistic(block, "convergence_evaluations", self.num_evaluations)
+        sample.add_statistic(block, f"convergence_{self.metric.value}", self.value)
@@ -0,0 +1,240 @@
+####################################################
+## Streaming storage for mesh time series
+##
+## A time series file (*.tseries) stores the topology of a mesh once and then one record
+## per frame with only the point coordinates:
+##
+##   b"NRTSERIE" | uint64 header length | json header | legacy VTK topology | records...
+##
+## Each record holds the int64 frame index followed by num_points x 3 coordinates. Since
+## all records have the same size, the file can be appended to while it is being read and
+## single frames can be loaded without reading the others.
+import os
+import json
+import queue
+import threading
+import numpy as np
+import vtk
+from typing import List, Optional
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+
+MAGIC = b"NRTSERIE"
+EXTENSION = ".tseries"
+
+
+def _record_dtype(
+    num_points: int,
+    dtype: str,
+) ->np.dtype:
+    return np.dtype([("frame", "<i8"), ("points", np.dtype(dtype).newbyteorder("<"), (num_points, 3))])
+
+
+class TimeSeriesWriter():
+    """ Appends the frames of a mesh time series to a single .tseries file.
+
+    Only the point coordinates of each frame are copied (in the calling thread) and
+    written to disk on a background thread, so the caller neither waits for the disk
+    nor keeps the frames in memory. All frames must have the topology of the reference mesh.
+
+    Usually created via :meth:`DataSample.open_time_series`. Must be closed after the last
+    frame, e.g. by using it as a context manager.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        reference: vtk.vtkPointSet,
+        frame_extension: str = ".vtu",
+        max_queued_frames: int = 4,
+    ) ->None:
+        """
+        Args:
+            path: Filename of the .tseries file. Overwritten if it exists.
+            reference: Mesh whose topology (cells and data arrays) is stored for all frames.
+            frame_extension: File extension the frames would have if written as single files.
+            max_queued_frames: Maximum number of frames which wait to be written. If the disk
+                is slower than the simulation, append() blocks when this is reached.
+        """
+        self.path = path
+        self.num_points = reference.GetNumberOfPoints()
+        self.dtype = vtk_to_numpy(reference.GetPoints().GetData()).dtype.name
+        self._record_dtype = _record_dtype(self.num_points, self.dtype)
+        self.frames = []
+        self._error = None
+
+        topology_writer = vtk.vtkDataSetWriter()
+        topology_writer.SetInputData(reference)
+        topology_writer.SetFileTypeToBinary()
+        topology_writer.WriteToOutputStringOn()
+        topology_writer.Write()
+        topology = topology_writer.GetOutputStdString()
+        if isinstance(topology, str):
+            topology = topology.encode("latin-1")
+        header = json.dumps({
+                "num_points": self.num_points,
+                "dtype": self.dtype,
+                "frame_extension": frame_extension,
+                "topology_length": len(topology),
+            }).encode()
+
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._file.write(np.uint64(len(header) + len(topology)).tobytes())
+        self._file.write(header)
+        self._file.write(topology)
+        self._file.flush()
+
+        self._queue = queue.Queue(maxsize=max_queued_frames)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def append(
+        self,
+        frame: int,
+        mesh: vtk.vtkPointSet,
+    ) ->None:
+        """ Add a frame. The point coordinates are copied, so the mesh may be reused.
+
+        Args:
+            frame: Frame index, as passed to :meth:`DataSample.write`.
+            mesh: Mesh with the same number of points as the reference mesh.
+        """
+        if self._error is not None:
+            raise self._error
+        if mesh.GetNumberOfPoints() != self.num_points:
+            raise ValueError(f"Frame {frame} has {mesh.GetNumberOfPoints()} points, but " +\
+                    f"the time series {self.path} was started with {self.num_points} points.")
+        record = np.zeros(1, dtype=self._record_dtype)
+        record["frame"] = frame
+        record["points"] = vtk_to_numpy(mesh.GetPoints().GetData())
+        self._queue.put(record)
+        self.frames.append(frame)
+
+    def _write_loop(
+        self,
+    ) ->None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            if self._error is None:
+                try:
+                    self._file.write(record.tobytes())
+                except Exception as e:
+                    self._error = e
+
+    def close(
+        self,
+    ) ->None:
+        """ Wait until all frames are written and close the file. """
+        if self._file.closed:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(
+        self,
+    ) ->"TimeSeriesWriter":
+        return self
+
+    def __exit__(
+        self,
+        *args,
+    ) ->None:
+        self.close()
+
+
+class TimeSeriesReader():
+    """ Lazily reads single frames from a .tseries file written by :class:`TimeSeriesWriter`.
+
+    The records are memory mapped, so only the requested frames are read from disk.
+    Frames which were appended after the reader was created are not visible.
+    """
+
+    def __init__(
+        self,
+        path: str,
+    ) ->None:
+        """
+        Args:
+            path: Filename of the .tseries file.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise IOError(f"{path} is not a time series file.")
+            header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header_and_topology = f.read(header_length)
+        decoder = json.JSONDecoder()
+        header, header_end = decoder.raw_decode(header_and_topology.decode("latin-1"))
+        self.num_points = header["num_points"]
+        self.frame_extension = header["frame_extension"]
+        self._topology = header_and_topology[header_end:header_end + header["topology_length"]]
+        self._reference = None
+
+        offset = len(MAGIC) + 8 + header_length
+        record_dtype = _record_dtype(self.num_points, header["dtype"])
+        # Ignore a partially written record at the end of the file:
+        num_records = (os.path.getsize(path) - offset) // record_dtype.itemsize
+        if num_records > 0:
+            self._records = np.memmap(path, dtype=record_dtype, mode="r", offset=offset,
+                    shape=(num_records,))
+            frames = np.array(self._records["frame"])
+        else:
+            self._records = None
+            frames = np.empty(0, dtype=np.int64)
+        # If a frame was written more than once, the last record is used:
+        self._index = {int(frame): i for i, frame in enumerate(frames)}
+
+    @property
+    def frames(
+        self,
+    ) ->List[int]:
+        return sorted(self._index.keys())
+
+    def reference(
+        self,
+    ) ->vtk.vtkPointSet:
+        """ The mesh the time series was started with (parsed on first use). """
+        if self._reference is None:
+            reader = vtk.vtkDataSetReader()
+            reader.ReadFromInputStringOn()
+            reader.SetBinaryInputString(self._topology, len(self._topology))
+            reader.Update()
+            self._reference = reader.GetOutput()
+        return self._reference
+
+    def read(
+        self,
+        frame: int,
+    ) ->Optional[vtk.vtkPointSet]:
+        """ Create the mesh of the given frame.
+
+        Returns:
+            A new mesh with the topology of the reference mesh and the points of the frame,
+            or None if the frame is not in the file.
+        """
+        if frame not in self._index:
+            return None
+        reference = self.reference()
+        mesh = reference.NewInstance()
+        mesh.DeepCopy(reference)
+        points = np.array(self._records[self._index[frame]]["points"])
+        mesh.GetPoints().SetData(numpy_to_vtk(points, deep=True))
+        return mesh
+
+
+def series_filename(
+    filename: str,
+) ->str:
+    """ Name of the time series file that holds the frames of filename, e.g.
+    'deformed.vtu' -> 'deformed_series.tseries', 'deformed_A.vtu' -> 'deformed_A_series.tseries'.
+
+    Chosen such that the file patterns of :meth:`DataSample.get_formatted_filepattern` for
+    the frames do not match it.
+    """
+    name, _ = os.path.splitext(filename)
+    return f"{name}_series{EXTENSION}"
@@ -0,0 +1,337 @@
+####################################################
+## Long-lived pool of worker processes with recycling
+import multiprocessing
+from multiprocessing.connection import wait
+import time
+import traceback
+from typing import Callable, Iterable, Iterator, Optional, Any, List
+
+import psutil
+
+from core.log import Log
+
+
+def _worker_loop(
+    fnc: Callable,
+    conn: "multiprocessing.connection.Connection",
+) ->None:
+    """ Main loop of a single worker process.
+
+    Receives tasks via conn, runs fnc on them and sends the results back. A task of
+    None tells the worker to shut down.
+
+    Args:
+        fnc: The function which is called for every received task.
+        conn: The worker's end of the pipe to the main process.
+    """
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        task_id, args = task
+        try:
+            result = fnc(*args)
+            conn.send((task_id, True, result))
+        except Exception:
+            conn.send((task_id, False, traceback.format_exc()))
+    conn.close()
+
+
+def get_process_rss(
+    pid: int,
+) ->int:
+    """ Return the resident set size (in bytes) of a process and all of its children.
+
+    Returns 0 if the process no longer exists.
+    """
+    try:
+        process = psutil.Process(pid)
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+    except psutil.NoSuchProcess:
+        return 0
+    return rss
+
+
+class _WorkerSlot():
+    """ Book-keeping for one slot of the pool. The process running in a slot may be
+    replaced (recycled) several times during a run.
+    """
+
+    def __init__(
+        self,
+        slot_id: int,
+    ) ->None:
+        self.slot_id = slot_id
+        self.process = None
+        self.conn = None
+        self.task_id = None
+        self.task_start = 0
+        self.tasks_since_start = 0
+        # Statistics over the whole lifetime of the pool:
+        self.num_tasks = 0
+        self.busy_time = 0
+        self.num_recycles = 0
+        self.max_rss = 0
+        self.last_rss = 0
+
+    @property
+    def busy(
+        self
+    ) ->bool:
+        return self.task_id is not None
+
+
+class WorkerPool():
+    """ Pool of long-lived worker processes which are fed from a continuous work queue.
+
+    In contrast to :class:`concurrent.futures.ProcessPoolExecutor`, each worker is handed a
+    new task as soon as it finishes the previous one, so a single slow task never keeps the
+    other workers idle. To avoid accumulating memory, a worker is replaced by a fresh
+    process after it has processed max_tasks_per_worker tasks or when its resident memory
+    (including its child processes) exceeds max_worker_memory.
+
+    The workers are not daemonic, so tasks may start processes of their own (e.g.
+    :class:`utils.gmsh_worker.GmshWorker`). They are therefore stopped explicitly when they
+    are recycled and when the pool is shut down.
+
+    Usage::
+
+        with WorkerPool(fnc, max_workers=4) as pool:
+            for result in pool.imap_unordered(items):
+                ...
+    """
+
+    def __init__(
+        self,
+        fnc: Callable,
+        max_workers: int,
+        max_tasks_per_worker: Optional[int] = None,
+        max_worker_memory: Optional[float] = None,
+    ) ->None:
+        """
+        Args:
+            fnc: The function to call for every task. Must be picklable if the
+                multiprocessing start method is not 'fork'.
+            max_workers: Number of worker processes which run concurrently.
+            max_tasks_per_worker: Restart a worker after it has processed this many
+                tasks. None or 0 disables this.
+            max_worker_memory: Restart a worker when its RSS (in GB) exceeds this value
+                after finishing a task. None or 0 disables this.
+        """
+        assert max_workers > 0, "WorkerPool requires at least one worker!"
+        self.fnc = fnc
+        self.max_workers = max_workers
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_worker_memory = max_worker_memory
+        self.slots = [_WorkerSlot(i) for i in range(max_workers)]
+        self.start_time = None
+        self.end_time = None
+
+    def __enter__(
+        self
+    ) ->"WorkerPool":
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type, exc_value, tb
+    ) ->None:
+        self.shutdown(terminate=exc_type is not None)
+
+    def start(
+        self
+    ) ->None:
+        """ Launch all worker processes. """
+        self.start_time = time.time()
+        for slot in self.slots:
+            self._start_worker(slot)
+
+    def shutdown(
+        self,
+        terminate: bool = False,
+    ) ->None:
+        """ Stop all worker processes.
+
+        Args:
+            terminate: If True, kill the workers instead of letting them finish their
+                current task.
+        """
+        for slot in self.slots:
+            self._stop_worker(slot, terminate=terminate)
+        self.end_time = time.time()
+
+    def _start_worker(
+        self,
+        slot: _WorkerSlot,
+    ) ->None:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker_loop,
+                args=(self.fnc, child_conn), daemon=False)
+        process.start()
+        child_conn.close()
+        slot.process = process
+        slot.conn = parent_conn
+        slot.tasks_since_start = 0
+
+    def _stop_worker(
+        self,
+        slot: _WorkerSlot,
+        terminate: bool = False,
+        timeout: float = 30,
+    ) ->None:
+        """ Stop the worker of a slot and wait for it to exit.
+
+        Args:
+            terminate: If True, terminate the worker instead of asking it to exit.
+            timeout: Time (in seconds) the worker gets to exit before it is killed.
+        """
+        if slot.process is None:
+            return
+        if terminate:
+            slot.process.terminate()
+        else:
+            try:
+                slot.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        slot.process.join(timeout=timeout)
+        if slot.process.is_alive():
+            Log.log(module="WorkerPool", severity="WARN",
+                    msg=f"Worker {slot.slot_id} did not exit within {timeout} s, killing it.")
+            slot.process.kill()
+            slot.process.join()
+        slot.conn.close()
+        slot.process = None
+        slot.conn = None
+
+    def _needs_recycling(
+        self,
+        slot: _WorkerSlot,
+    ) ->bool:
+        """ Check if a (currently idle) worker should be replaced by a fresh process. """
+        if self.max_tasks_per_worker and slot.tasks_since_start >= self.max_tasks_per_worker:
+            return True
+        rss = slot.last_rss
+        if self.max_worker_memory and rss > self.max_worker_memory:
+            Log.log(module="WorkerPool",
+                    msg=f"Worker {slot.slot_id} uses {rss:.2f} GB (limit: " +\
+                        f"{self.max_worker_memory} GB), restarting it.")
+            return True
+        return False
+
+    def _recycle(
+        self,
+        slot: _WorkerSlot,
+    ) ->None:
+        self._stop_worker(slot)
+        self._start_worker(slot)
+        slot.num_recycles += 1
+
+    def _submit(
+        self,
+        slot: _WorkerSlot,
+        task_id: int,
+        args: tuple,
+    ) ->None:
+        slot.conn.send((task_id, args))
+        slot.task_id = task_id
+        slot.task_start = time.time()
+
+    def imap_unordered(
+        self,
+        items: Iterable[Any],
+    ) ->Iterator[Any]:
+        """ Run the pool's function on every item and yield results as they become ready.
+
+        The results are yielded in order of completion, not in order of the items.
+        An exception raised by the function inside a worker is re-raised in the main
+        process. If a worker dies unexpectedly, an Exception is raised.
+
+        Args:
+            items: The single argument which is passed to the function for each task.
+        """
+        pending = iter(enumerate(items))
+        exhausted = False
+
+        def feed(slot):
+            nonlocal exhausted
+            if exhausted:
+                return
+            try:
+                task_id, item = next(pending)
+            except StopIteration:
+                exhausted = True
+                return
+            self._submit(slot, task_id, (item,))
+
+        for slot in self.slots:
+            feed(slot)
+
+        while any(slot.busy for slot in self.slots):
+            busy = [slot for slot in self.slots if slot.busy]
+            waitables = {}
+            for slot in busy:
+                waitables[slot.conn] = slot
+                waitables[slot.process.sentinel] = slot
+            ready = wait(list(waitables.keys()))
+
+            finished = []
+            for r in ready:
+                slot = waitables[r]
+                if slot in finished:
+                    continue
+                finished.append(slot)
+
+            for slot in finished:
+                # The pipe of a dead worker is readable too (EOF), so its death is only
+                # noticed when receiving:
+                try:
+                    task_id, ok, result = slot.conn.recv()
+                except (EOFError, OSError):
+                    slot.process.join(timeout=30)
+                    msg = f"Worker process {slot.slot_id} (PID {slot.process.pid}) died " +\
+                            f"unexpectedly with exit code {slot.process.exitcode}."
+                    Log.log(module="WorkerPool", severity="FATAL", msg=msg)
+                    raise Exception(msg)
+                slot.busy_time += time.time() - slot.task_start
+                slot.task_id = None
+                slot.num_tasks += 1
+                slot.tasks_since_start += 1
+                slot.last_rss = get_process_rss(slot.process.pid)/1e9
+                slot.max_rss = max(slot.max_rss, slot.last_rss)
+                if not ok:
+                    msg = f"Worker process {slot.slot_id} raised an exception:\n{result}"
+                    Log.log(module="WorkerPool", severity="FATAL", msg=msg)
+                    raise Exception(msg)
+                if not exhausted and self._needs_recycling(slot):
+                    self._recycle(slot)
+                feed(slot)
+                yield result
+
+    def report(
+        self
+    ) ->str:
+        """ Summarize how busy each worker was and how often it was recycled. """
+        end_time = self.end_time if self.end_time else time.time()
+        wall_time = max(end_time - self.start_time, 1e-9)
+        msg = "Worker statistics:"
+        for slot in self.slots:
+            utilization = slot.busy_time/wall_time*100
+            msg += f"\n\tWorker {slot.slot_id}: {slot.num_tasks} samples, " +\
+                    f"utilization {utilization:.1f}%, recycled {slot.num_recycles} times, " +\
+                    f"max RSS {slot.max_rss:.2f} GB"
+        total_busy = sum(slot.busy_time for slot in self.slots)
+        total_utilization = total_busy/(wall_time*len(self.slots))*100
+        total_recycles = sum(slot.num_recycles for slot in self.slots)
+        msg += f"\n\tTotal: utilization {total_utilization:.1f}%, " +\
+                f"{total_recycles} recycles"
+        return msg
@@ -0,0 +1,91 @@
+####################################################
+## Request loop of a long-lived blender worker.
+## Runs inside blender, started by utils/blender_worker.py:
+##   blender --background --python src/utils/blender_server.py -- --fd <socket fd>
+import argparse
+import contextlib
+import os
+import runpy
+import sys
+import tempfile
+import traceback
+from multiprocessing.connection import Connection
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import blenderutils
+
+
+@contextlib.contextmanager
+def capture_output(
+    fd: int,
+):
+    """ Redirect a file descriptor into a temporary file.
+
+    Redirecting on the file descriptor level (instead of replacing sys.stdout) also
+    captures the output of blender itself, just like capture_output of subprocess.run.
+    """
+    stream = sys.stdout if fd == 1 else sys.stderr
+    stream.flush()
+    saved = os.dup(fd)
+    with tempfile.TemporaryFile() as tmp:
+        os.dup2(tmp.fileno(), fd)
+        captured = []
+        try:
+            yield captured
+        finally:
+            stream.flush()
+            os.dup2(saved, fd)
+            os.close(saved)
+            tmp.seek(0)
+            captured.append(tmp.read().decode(errors="replace"))
+
+
+def run_script(
+    script: str,
+    args: list,
+) ->int:
+    """ Run script as if blender had been started with --python script -- args.
+
+    Returns:
+        The exit code blender would have returned with --python-exit-code 1.
+    """
+    blenderutils.reset_scene()
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    sys.argv = [saved_argv[0], "--"] + args
+    try:
+        runpy.run_path(script, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        return e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+
+
+if __name__ == "__main__":
+
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="Blender worker request loop.")
+    parser.add_argument("--fd", type=int, required=True,
+            help="File descriptor of the socket connected to the pipeline worker.")
+    args = parser.parse_args(argv)
+
+    conn = Connection(args.fd)
+    conn.send({"ready": True})
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        with capture_output(1) as stdout, capture_output(2) as stderr:
+            returncode = run_script(request["script"], request["args"])
+        conn.send({"returncode": returncode, "stdout": stdout[0], "stderr": stderr[0]})
+    conn.close()
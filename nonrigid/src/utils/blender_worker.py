@@ -0,0 +1,211 @@
+####################################################
+## Long-lived headless blender process which runs scripts on request
+import atexit
+import os
+import socket
+import subprocess
+import threading
+import time
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional
+
+from core.log import Log
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blender_server.py")
+
+
+class BlenderWorker():
+    """ A headless blender instance which stays alive between samples.
+
+    Starting blender and importing its python modules takes several seconds, which used to
+    be paid for every sample. A BlenderWorker starts blender once (running
+    utils/blender_server.py) and then sends it one request per script run over a socket.
+    Between requests, the scene is reset with :func:`blenderutils.reset_scene`.
+
+    If a request does not finish within the timeout, the blender process is killed and a
+    new one is started for the next request.
+
+    Use :func:`get_blender_worker` to get the worker of the current process.
+    """
+
+    def __init__(
+        self,
+        blender_exec: str = "blender",
+    ) ->None:
+        """
+        Args:
+            blender_exec: Name of the blender executable, e.g. "blender" or
+                "blender-softwaregl".
+        """
+        self.blender_exec = blender_exec
+        self.process = None
+        self.conn = None
+        self.lock = threading.Lock()
+        # Statistics:
+        self.num_starts = 0
+        self.num_requests = 0
+        self.total_startup_time = 0
+        self.last_startup_time = 0
+
+    @property
+    def running(
+        self
+    ) ->bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(
+        self,
+        timeout: Optional[float] = None,
+    ) ->float:
+        """ Launch blender and wait until it is ready to accept requests.
+
+        Args:
+            timeout: Maximum time (in seconds) to wait for blender to start.
+        Returns:
+            The time it took to start blender.
+        """
+        start_time = time.time()
+        parent_sock, child_sock = socket.socketpair()
+        a = [self.blender_exec]
+        a += ["--background"]
+        a += ["-noaudio"]
+        a += ["--threads"]
+        a += ["1"]
+        a += ["--python"]
+        a += [SERVER_SCRIPT]
+        a += ["--"]
+        a += ["--fd"]
+        a += [str(child_sock.fileno())]
+        self.process = subprocess.Popen(a, pass_fds=(child_sock.fileno(),),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+        if not self.conn.poll(timeout):
+            self.stop(kill=True)
+            raise subprocess.TimeoutExpired(a, timeout)
+        try:
+            self.conn.recv()
+        except EOFError:
+            returncode = self.process.wait()
+            self.stop()
+            raise RuntimeError(f"Blender worker could not be started, exit code {returncode}")
+        self.last_startup_time = time.time() - start_time
+        self.total_startup_time += self.last_startup_time
+        self.num_starts += 1
+        Log.log(module="BlenderWorker",
+                msg=f"Started {self.blender_exec} (PID {self.process.pid}) " +\
+                    f"in {self.last_startup_time:.2f} s")
+        return self.last_startup_time
+
+    def stop(
+        self,
+        kill: bool = False,
+    ) ->None:
+        """ Shut down the blender process.
+
+        Args:
+            kill: If True, kill blender instead of asking it to exit.
+        """
+        if self.process is None:
+            return
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def run(
+        self,
+        script: str,
+        args: List[str],
+        timeout: Optional[float] = None,
+    ) ->subprocess.CompletedProcess:
+        """ Run a python script inside blender.
+
+        Behaves like running
+        `blender --background --python-exit-code 1 --python script -- args` with
+        subprocess.run(..., capture_output=True, text=True, timeout=timeout).
+
+        Args:
+            script: Path to the python script.
+            args: Arguments passed to the script (the arguments after '--').
+            timeout: Maximum time in seconds for the script (including starting blender,
+                if necessary).
+        Returns:
+            The returncode, stdout and stderr of the script. The startup time paid for this
+            request (0 if blender was already running) is stored in self.last_startup_time.
+        Raises:
+            subprocess.TimeoutExpired: If blender does not answer within timeout.
+                Blender is restarted for the next request.
+        """
+        cmd = [self.blender_exec, "--python", script, "--"] + args
+        with self.lock:
+            start_time = time.time()
+            self.last_startup_time = 0
+            if not self.running:
+                self.stop(kill=True)
+                self.start(timeout=timeout)
+            if timeout is not None:
+                timeout = max(timeout - (time.time() - start_time), 0)
+            self.conn.send({"script": script, "args": args})
+            if not self.conn.poll(timeout):
+                self.stop(kill=True)
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            try:
+                reply = self.conn.recv()
+            except EOFError:
+                returncode = self.process.wait()
+                self.stop()
+                return subprocess.CompletedProcess(cmd, returncode or 1, "",
+                        f"Blender worker exited unexpectedly with exit code {returncode}")
+            self.num_requests += 1
+            return subprocess.CompletedProcess(cmd, reply["returncode"],
+                    reply["stdout"], reply["stderr"])
+
+    def report(
+        self
+    ) ->str:
+        """ Summarize how much startup time was saved by reusing the blender process. """
+        if self.num_starts == 0:
+            return "Blender worker was never started."
+        mean_startup = self.total_startup_time/self.num_starts
+        saved = max(self.num_requests - self.num_starts, 0)*mean_startup
+        amortized = self.total_startup_time/max(self.num_requests, 1)
+        return f"Blender worker: {self.num_requests} requests, {self.num_starts} starts " +\
+                f"({mean_startup:.2f} s each), amortized startup {amortized:.2f} s per " +\
+                f"request, saved {saved:.1f} s in total"
+
+
+# One worker per process and blender executable:
+_workers: Dict[tuple, BlenderWorker] = {}
+
+def get_blender_worker(
+    blender_exec: str = "blender",
+) ->BlenderWorker:
+    """ Return the blender worker of the current (pipeline worker) process.
+
+    The worker is created on first use. Workers inherited from a parent process are not
+    reused, since their connection belongs to the parent.
+    """
+    key = (os.getpid(), blender_exec)
+    if key not in _workers:
+        _workers[key] = BlenderWorker(blender_exec)
+    return _workers[key]
+
+def _stop_workers(
+) ->None:
+    for (pid, _), worker in _workers.items():
+        if pid == os.getpid():
+            worker.stop()
+
+atexit.register(_stop_workers)
@@ -32,6 +32,20 @@ def clear_scene() -> None:
     #bpy.ops.object.delete()
 
 
+def reset_scene() -> None:
+    """ Bring blender back into a clean state between two scripts.
+
+    Reloads the startup file (which also removes view layers, collections, materials
+    and compositing nodes created by a previous script) and removes all objects. Used
+    by long-lived blender workers between requests.
+    """
+    try:
+        bpy.ops.wm.read_homefile()
+    except RuntimeError as e:
+        print("WARNING: Could not reload the startup file:", e)
+    clear_scene()
+
+
 def new_empty_object(
         name: str = "Unknown"
 ):
@@ -0,0 +1,71 @@
+####################################################
+## Base class of the content-addressed on-disk caches
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+from typing import Callable, IO, Union
+
+
+class FileCache:
+    """
+    Content-addressed on-disk cache: entries are files named after a hash of everything
+    which determines their content (see :meth:`key`).
+
+    Entries are written atomically, so the cache can be shared between the worker
+    processes of a pipeline (and between pipeline runs).
+    """
+
+    def __init__(
+            self,
+            directory: str
+    ) -> None:
+        """
+        Args:
+            directory: Folder in which the cached files are stored. Created if necessary.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(
+            *parts: Union[str, dict, list, np.ndarray]
+    ) -> str:
+        """
+        Combine several strings, numpy arrays or (json serializable) parameter sets into one
+        cache key.
+        """
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                h.update(str((part.dtype.str, part.shape)).encode())
+                h.update(np.ascontiguousarray(part).tobytes())
+            else:
+                if not isinstance(part, str):
+                    part = json.dumps(part, sort_keys=True)
+                h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(
+            self,
+            key: str,
+            extension: str
+    ) -> str:
+        return os.path.join(self.directory, key + extension)
+
+    def _store(
+            self,
+            path: str,
+            write: Callable[[IO[bytes]], None]
+    ) -> None:
+        """ Write to a temporary file first, then move it to path in one step. """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
@@ -0,0 +1,332 @@
+####################################################
+## Long-lived gmsh process which tetrahedralizes surfaces on request
+import argparse
+import atexit
+import os
+import socket
+import subprocess
+import sys
+import time
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+from typing import Dict, Optional
+
+import numpy as np
+import gmsh
+
+from core.log import Log
+
+# gmsh element types:
+TRIANGLE = 2
+TETRAHEDRON = 4
+
+# Folder containing the utils and core packages, for the worker process:
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _share(
+    array: np.ndarray,
+) ->dict:
+    """ Copy an array into a new shared memory block, return its description. """
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    shm.close()
+    return {"name": shm.name, "shape": array.shape, "dtype": array.dtype.str}
+
+def _take(
+    desc: dict,
+    unlink: bool,
+) ->np.ndarray:
+    """ Copy an array out of the shared memory block described by desc. """
+    shm = shared_memory.SharedMemory(name=desc["name"])
+    try:
+        array = np.ndarray(desc["shape"], dtype=desc["dtype"], buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+    return array
+
+def _unlink(
+    desc: dict,
+) ->None:
+    try:
+        shm = shared_memory.SharedMemory(name=desc["name"])
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _mesh(
+    request: dict,
+) ->dict:
+    """ Tetrahedralize the surface of a request. Runs in the worker process. """
+    vertices = _take(request["vertices"], unlink=False).astype(np.float64)
+    faces = _take(request["faces"], unlink=False).astype(np.uint64)
+
+    gmsh.clear()
+    for name, value in request["options"].items():
+        gmsh.option.setNumber(name, value)
+
+    # Same model as when opening the surface as a .stl file: a discrete surface, which
+    # bounds the volume to mesh.
+    surface = gmsh.model.addDiscreteEntity(2)
+    gmsh.model.mesh.addNodes(2, surface, np.arange(1, len(vertices) + 1, dtype=np.uint64),
+            vertices.flatten())
+    gmsh.model.mesh.addElementsByType(surface, TRIANGLE, [], (faces + 1).flatten())
+    l = gmsh.model.geo.addSurfaceLoop([surface])
+    gmsh.model.geo.addVolume([l])
+    gmsh.model.geo.synchronize()
+
+    gmsh.model.mesh.generate(dim=3)
+    gmsh.model.mesh.optimize(method="Netgen", force=True)
+
+    node_tags, coords, _ = gmsh.model.mesh.getNodes()
+    index = np.zeros(int(node_tags.max()) + 1, dtype=np.int64)
+    index[node_tags] = np.arange(len(node_tags))
+    _, triangle_nodes = gmsh.model.mesh.getElementsByType(TRIANGLE)
+    _, tetrahedron_nodes = gmsh.model.mesh.getElementsByType(TETRAHEDRON)
+    return {"points": _share(coords.reshape(-1, 3)),
+            "triangles": _share(index[triangle_nodes].reshape(-1, 3)),
+            "tetrahedra": _share(index[tetrahedron_nodes].reshape(-1, 4))}
+
+def _serve(
+    conn,
+) ->None:
+    """ Main loop of the worker process. """
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    conn.send("ready")
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        gmsh.logger.start()
+        try:
+            reply = _mesh(request)
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+        reply["logs"] = gmsh.logger.get()
+        gmsh.logger.stop()
+        conn.send(reply)
+    gmsh.finalize()
+
+
+class GmshWorker():
+    """ A process with an initialized gmsh instance which stays alive between samples.
+
+    Surfaces are sent to the worker as vertex and face arrays in shared memory, so they do
+    not have to be written to disk first, and the resulting volume mesh is returned the same
+    way instead of being written to (and read back from) a file.
+
+    If a request does not finish within the timeout, the worker process is killed and a new
+    one is started for the next request.
+
+    The worker is a new python interpreter running this module (like a process started with
+    the "spawn" method), not a fork of the calling process: the caller may run other
+    threads (see the block_threads argument of the Pipeline), and forking those can
+    deadlock the child. multiprocessing's spawn and forkserver methods are not used since
+    they import the main script again, and the run_*.py scripts start the pipeline at
+    module level.
+
+    Use :func:`get_gmsh_worker` to get the worker of the current process.
+    """
+
+    def __init__(
+        self,
+    ) ->None:
+        self.process = None
+        self.conn = None
+        self.last_logs = []
+        # Statistics:
+        self.num_starts = 0
+        self.num_requests = 0
+        self.total_startup_time = 0
+
+    @property
+    def running(
+        self
+    ) ->bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(
+        self,
+        timeout: Optional[float] = None,
+    ) ->float:
+        """ Start the worker process and wait until gmsh is initialized.
+
+        Args:
+            timeout: Maximum time (in seconds) to wait for the worker to start.
+        Returns:
+            The time it took to start the worker.
+        """
+        start_time = time.time()
+        # Shared memory blocks are created by both processes, make sure they share one
+        # resource tracker which cleans up blocks left behind by a killed worker:
+        resource_tracker.ensure_running()
+        tracker_fd = resource_tracker.getfd()
+        parent_sock, child_sock = socket.socketpair()
+        a = [sys.executable]
+        a += ["-m"]
+        a += ["utils.gmsh_worker"]
+        a += ["--fd"]
+        a += [str(child_sock.fileno())]
+        a += ["--tracker-fd"]
+        a += [str(tracker_fd)]
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")]))
+        self.process = subprocess.Popen(a, pass_fds=(child_sock.fileno(), tracker_fd), env=env)
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+        if not self.conn.poll(timeout):
+            self.stop(kill=True)
+            raise TimeoutError(f"GMSH worker did not start within {timeout} seconds")
+        try:
+            self.conn.recv()
+        except EOFError:
+            exitcode = self.process.wait()
+            self.stop()
+            raise RuntimeError(f"GMSH worker could not be started, exit code {exitcode}")
+        startup_time = time.time() - start_time
+        self.total_startup_time += startup_time
+        self.num_starts += 1
+        Log.log(module="GmshWorker",
+                msg=f"Started GMSH worker (PID {self.process.pid}) in {startup_time:.2f} s")
+        return startup_time
+
+    def stop(
+        self,
+        kill: bool = False,
+    ) ->None:
+        """ Shut down the worker process.
+
+        Args:
+            kill: If True, kill the worker instead of asking it to exit.
+        """
+        if self.process is None:
+            return
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def mesh(
+        self,
+        vertices: np.ndarray,
+        faces: np.ndarray,
+        options: Dict[str, float] = {},
+        timeout: Optional[float] = None,
+    ) ->(np.ndarray, np.ndarray, np.ndarray):
+        """ Tetrahedralize the volume enclosed by a closed triangle surface.
+
+        The gmsh log messages of the request are stored in self.last_logs, also if it fails.
+
+        Args:
+            vertices: Nx3 array of surface point coordinates.
+            faces: Mx3 array of point indices, one row per triangle.
+            options: Numeric gmsh options to set before meshing, e.g.
+                {"Mesh.CharacteristicLengthMax": 0.01}.
+            timeout: Maximum time in seconds for meshing (including starting the worker,
+                if necessary).
+        Returns:
+            points, triangles, tetrahedra
+                * points: Kx3 array of point coordinates of the volume mesh.
+                * triangles: Array of point indices of the surface triangles, one row per triangle.
+                * tetrahedra: Array of point indices of the tetrahedra, one row per tetrahedron.
+        Raises:
+            TimeoutError: If gmsh does not finish within timeout. The worker is restarted
+                for the next request.
+            RuntimeError: If gmsh fails.
+        """
+        start_time = time.time()
+        self.last_logs = []
+        if not self.running:
+            self.stop(kill=True)
+            self.start(timeout=timeout)
+        if timeout is not None:
+            timeout = max(timeout - (time.time() - start_time), 0)
+        request = {"vertices": _share(vertices), "faces": _share(faces), "options": options}
+        try:
+            self.conn.send(request)
+            if not self.conn.poll(timeout):
+                self.stop(kill=True)
+                raise TimeoutError(f"GMSH timed out (waited for {timeout:.1f} seconds)")
+            try:
+                reply = self.conn.recv()
+            except EOFError:
+                exitcode = self.process.wait()
+                self.stop()
+                raise RuntimeError(f"GMSH worker exited unexpectedly with exit code {exitcode}")
+        finally:
+            _unlink(request["vertices"])
+            _unlink(request["faces"])
+        self.num_requests += 1
+        self.last_logs = reply["logs"]
+        if "error" in reply:
+            raise RuntimeError(f"{reply['error']}\n{reply['traceback']}")
+        return (_take(reply["points"], unlink=True),
+                _take(reply["triangles"], unlink=True),
+                _take(reply["tetrahedra"], unlink=True))
+
+    def report(
+        self
+    ) ->str:
+        """ Summarize how often the worker was (re)started. """
+        if self.num_starts == 0:
+            return "GMSH worker was never started."
+        return f"GMSH worker: {self.num_requests} requests, {self.num_starts} starts " +\
+                f"({self.total_startup_time/self.num_starts:.2f} s each)"
+
+
+# One worker per process:
+_workers: Dict[int, GmshWorker] = {}
+
+def get_gmsh_worker(
+) ->GmshWorker:
+    """ Return the gmsh worker of the current (pipeline worker) process.
+
+    The worker is created on first use. Workers inherited from a parent process are not
+    reused, since their connection belongs to the parent.
+    """
+    pid = os.getpid()
+    if pid not in _workers:
+        _workers[pid] = GmshWorker()
+    return _workers[pid]
+
+def _stop_workers(
+) ->None:
+    for pid, worker in _workers.items():
+        if pid == os.getpid():
+            worker.stop()
+
+atexit.register(_stop_workers)
+
+
+if __name__ == "__main__":
+    # Worker process, started by GmshWorker.start:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fd", type=int, required=True,
+            help="File descriptor of the socket connected to the GmshWorker")
+    parser.add_argument("--tracker-fd", type=int, required=True,
+            help="File descriptor of the resource tracker of the GmshWorker's process")
+    args = parser.parse_args()
+    # Use the parent's resource tracker, just like multiprocessing.spawn does:
+    resource_tracker._resource_tracker._fd = args.tracker_fd
+    _serve(Connection(args.fd))
@@ -1,9 +1,15 @@
 """Operations on meshes with other libraries than vtk, blender or sofa."""
 
-from meshlib import mrmeshpy
+from meshlib import mrmeshpy, mrmeshnumpy
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Generator, Iterable, Optional, Tuple
+import numpy as np
 import re
 import os
 
+from utils import vtkutils
+
 def check_self_intersection(
         filename: str
 ) -> (bool, str):
@@ -55,3 +61,100 @@ def check_self_intersection_all_matches(
     else:
         # if nothing is found, the last return value from check_self_intersection gives the appropriate details
         return error_found, comment
+
+def check_self_intersection_arrays(
+        vertices: np.ndarray,
+        faces: np.ndarray,
+        name: str = "mesh"
+) -> (bool, str):
+    """Check for self intersections of a triangle mesh given as arrays using meshlib.
+    Works the same as check_self_intersection() but without writing and reading a file.
+
+    Args:
+        vertices: Nx3 array of point coordinates.
+        faces: Mx3 array of point indices of the triangles.
+        name: Name of the mesh used in the comment.
+
+     Returns
+     -------
+     error_found, comment
+        * error_found = True if there is a self intersection or a meshlib processing error
+        * comment: explanation if error_found is True
+     """
+    if len(faces) == 0:
+        return True, f"Mesh {name} has no triangles."
+    # meshlib works with float vertices and int faces, just like the STL round-trip did
+    try:
+        mesh = mrmeshnumpy.meshFromFacesVerts(np.ascontiguousarray(faces, dtype=np.int32),
+                                              np.ascontiguousarray(vertices, dtype=np.float32))
+    except RuntimeError as e:
+        return True, f"Meshlib cannot create mesh {name}: {e}"
+
+    mp = mrmeshpy.MeshPart(mesh)
+    ret = mrmeshpy.findSelfCollidingTriangles(mp)
+    if ret.empty():
+        return False, ""
+    else:
+        return True, f"Self intersection found in mesh {name}."
+
+def check_self_intersection_mesh(
+        mesh: "vtkDataSet",
+        name: str = "mesh"
+) -> (bool, str):
+    """Check for self intersections of the surface of a mesh using meshlib, directly from memory.
+
+    Args:
+        mesh: Mesh to check. The surface is extracted if it is not a vtkPolyData.
+        name: Name of the mesh used in the comment.
+
+     Returns
+     -------
+     error_found, comment
+        * error_found = True if there is a self intersection or a meshlib processing error
+        * comment: explanation if error_found is True
+     """
+    if not mesh.IsA("vtkPolyData"):
+        mesh = vtkutils.extract_surface(mesh)
+    if mesh.GetNumberOfPoints() == 0:
+        return True, f"Mesh {name} is empty."
+    vertices, faces = vtkutils.get_triangles(mesh)
+    return check_self_intersection_arrays(vertices, faces, name)
+
+def check_self_intersection_all_meshes(
+        meshes: Iterable[Tuple[str, "vtkDataSet"]],
+        max_workers: Optional[int] = None
+) -> Generator[Tuple[str, "vtkDataSet", bool, str], None, None]:
+    """Check for self intersections of the surfaces of several (e.g. all frames of a simulated)
+    meshes using meshlib. The meshes are checked in parallel threads and directly from memory.
+
+    The meshes are taken from the iterable only as needed, so that at most about max_workers
+    of them are in memory at once when it is e.g. a generator reading the frames one by one.
+
+    Args:
+        meshes: Iterable of names (e.g. filenames) and meshes. Surfaces are extracted
+            from meshes which are not vtkPolyData.
+        max_workers: Maximum number of meshes checked in parallel. Defaults to the number of CPUs.
+
+     Yields
+     -------
+     name, mesh, error_found, comment
+        * name, mesh: The checked mesh, in the order of meshes
+        * error_found = True if there is a self intersection or a meshlib processing error
+        * comment: explanation if error_found is True
+     """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = deque()
+    try:
+        for name, mesh in meshes:
+            pending.append((name, mesh, executor.submit(check_self_intersection_mesh, mesh, name)))
+            if len(pending) >= max_workers:
+                name, mesh, future = pending.popleft()
+                yield (name, mesh) + future.result()
+        while pending:
+            name, mesh, future = pending.popleft()
+            yield (name, mesh) + future.result()
+    finally:
+        # e.g. when the caller stops at the first error:
+        executor.shutdown(cancel_futures=True)
@@ -168,6 +168,50 @@ def convert2rigid( positions, quaternions=[0,0,0,1] ):
 	rigid_positions = np.hstack( (positions, quat) )
 	return rigid_positions.tolist()
 
+def positions2vtk( state ):
+	"""
+	Converts the current positions of a SOFA mechanical object to vtkPoints.
+
+	The positions are copied once (SOFA keeps changing its own buffer while the simulation
+	runs), the VTK array then wraps this copy without copying again.
+
+	Parameters
+	----------
+	state ():
+		SOFA mechanical object
+
+	Returns
+	----------
+	vtkPoints:
+		The current positions.
+	"""
+	positions = np.array( state.position.value, dtype=np.float64 ).reshape((-1,3))
+	points = vtkPoints()
+	points.SetData( numpy_support.numpy_to_vtk( positions, deep=False ) )
+	return points
+
+def triangles2vtk( triangles ):
+	"""
+	Converts triangles to a vtkCellArray, built from a single offsets and a single
+	connectivity buffer (instead of inserting the cells one by one).
+
+	Parameters
+	----------
+	triangles (array_like):
+		N x 3 point indices, e.g. the triangles field of a SOFA topology.
+
+	Returns
+	----------
+	vtkCellArray:
+		The triangles.
+	"""
+	connectivity = np.array( triangles, dtype=np.int64 ).reshape(-1)
+	offsets = np.arange( 0, len(connectivity) + 1, 3, dtype=np.int64 )
+	cells = vtkCellArray()
+	cells.SetData( numpy_support.numpy_to_vtkIdTypeArray( offsets, deep=False ),
+		numpy_support.numpy_to_vtkIdTypeArray( connectivity, deep=False ) )
+	return cells
+
 def sofa2vtk( state, topology ):
 	"""
 	Converts a sofa object to a vtkPolyData. 
@@ -180,44 +224,30 @@ def sofa2vtk( state, topology ):
 		SOFA object containing information about triangles (either topology or a loader)
 
 	"""
-
-	# Convert the current positions to VTK:
-	points = vtkPoints()
-	for i, p in enumerate( state.position.value ):
-		points.InsertNextPoint( p )
-
-	# Convert triangles to VTK:
-	cells = vtkCellArray()
-	cellTypes = []
-	for i, t in enumerate( topology.triangles.value ):
-		cells.InsertNextCell( 3, t )
-		cellTypes.append( VTK_TRIANGLE )
-
-	# Create vtk polydata from the data:
+	# Create vtk polydata from the current positions and the triangles:
 	polydata = vtkPolyData()
-	polydata.SetPoints( points )
-	polydata.SetPolys( cells )
+	polydata.SetPoints( positions2vtk( state ) )
+	polydata.SetPolys( triangles2vtk( topology.triangles.value ) )
 	
 	return polydata
 
 def sofa2vtu( state, vtk_mesh ):
 	"""
 	Converts a sofa object to a vtkUnstructuredGrid. 
+
+	The returned mesh shares its cells and data arrays with vtk_mesh (a shallow copy, since the
+	connectivity does not change during a simulation), only the points are new. vtk_mesh itself
+	is not modified.
 	
 	Parameters
 	----------
 	state ():
 		SOFA mechanical object
-	topology (?):
-		SOFA object containing information about triangles (either topology or a loader)
+	vtk_mesh (vtkUnstructuredGrid):
+		Mesh with the topology of the simulated object, e.g. the undeformed mesh.
 
 	"""
-
-	# Convert the current positions to VTK:
-	updated_points = numpy_support.numpy_to_vtk(state.position.value)
-	vtk_mesh.GetPoints().SetData(updated_points)
-	
 	output_vtk_mesh = vtkUnstructuredGrid()
-	output_vtk_mesh.DeepCopy(vtk_mesh)
+	output_vtk_mesh.ShallowCopy(vtk_mesh)
+	output_vtk_mesh.SetPoints(positions2vtk(state))
 	return output_vtk_mesh
-
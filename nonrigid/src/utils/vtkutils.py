@@ -1,10 +1,13 @@
 import random
 
 import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 from vtk import *
 from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
 import math
-from typing import Optional, Union
+from typing import Optional, Union, List
 
 def polyDataToUnstructuredGrid(
         pd: vtkPolyData,
@@ -40,6 +43,45 @@ def has_tetra(
     mesh.GetCellTypes(cell_types)
     return cell_types.IsType(VTK_TETRA)
 
+# Number of points of the fixed-size VTK cell types:
+CELL_SIZES = {VTK_VERTEX: 1, VTK_LINE: 2, VTK_TRIANGLE: 3, VTK_QUAD: 4, VTK_TETRA: 4,
+        VTK_PYRAMID: 5, VTK_WEDGE: 6, VTK_HEXAHEDRON: 8}
+
+def create_unstructured_grid(
+        points: np.ndarray,
+        cells: List[tuple],
+) -> vtkUnstructuredGrid:
+    """
+    Creates an unstructured grid from numpy arrays.
+
+    Args:
+        points: Nx3 array of point coordinates.
+        cells: List of (cell_type, connectivity) tuples, where cell_type is a VTK cell type
+            (e.g. VTK_TETRA) and connectivity is an MxK array of point indices, one row per cell.
+            The cells are added in the given order. M may be 0 for the cell types in CELL_SIZES.
+
+    Returns:
+        The unstructured grid.
+    """
+    vtk_points = vtkPoints()
+    vtk_points.SetData(numpy_to_vtk(np.ascontiguousarray(points), deep=True))
+
+    connectivity = [np.asarray(c, dtype=np.int64).reshape(len(c), CELL_SIZES.get(t, -1)) for t, c in cells]
+    sizes = np.concatenate([np.full(len(c), c.shape[1], dtype=np.int64) for c in connectivity] +\
+            [np.zeros(0, dtype=np.int64)])
+    offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    types = np.concatenate([np.full(len(c), t, dtype=np.uint8) for (t, _), c in zip(cells, connectivity)] +\
+            [np.zeros(0, dtype=np.uint8)])
+    flat = np.concatenate([c.flatten() for c in connectivity] + [np.zeros(0, dtype=np.int64)])
+
+    cell_array = vtkCellArray()
+    cell_array.SetData(numpy_to_vtk(offsets, deep=True, array_type=VTK_ID_TYPE),
+                       numpy_to_vtk(flat, deep=True, array_type=VTK_ID_TYPE))
+    grid = vtkUnstructuredGrid()
+    grid.SetPoints(vtk_points)
+    grid.SetCells(numpy_to_vtk(types, deep=True, array_type=VTK_UNSIGNED_CHAR), cell_array)
+    return grid
+
 def create_random_rigid_transform(
     max_rotation: float, 
     max_translation: float, 
@@ -175,18 +217,15 @@ def calc_displacement(
 
     assert len(mesh_initial_indices) == mesh_deformed.GetNumberOfPoints()
 
-    displacement = vtkFloatArray()
-    displacement.SetNumberOfComponents(3)
-    displacement.SetNumberOfTuples(mesh_initial.GetNumberOfPoints())
+    points_initial = vtk_to_numpy(mesh_initial.GetPoints().GetData()).astype(np.float64)
+    points_deformed = vtk_to_numpy(mesh_deformed.GetPoints().GetData()).astype(np.float64)
 
-    for i in range(mesh_initial.GetNumberOfPoints()):
-        displacement.SetTuple3(i, 0.0, 0.0, 0.0)
+    # Points of mesh_initial without a corresponding deformed point keep a zero displacement:
+    displ = np.zeros((mesh_initial.GetNumberOfPoints(), 3), dtype=np.float32)
+    mesh_initial_indices = np.asarray(mesh_initial_indices, dtype=np.int64)
+    displ[mesh_initial_indices] = points_deformed - points_initial[mesh_initial_indices]
 
-    for idx_deformed, idx_initial in enumerate(mesh_initial_indices):
-        p1 = mesh_initial.GetPoint(idx_initial)
-        p2 = mesh_deformed.GetPoint(idx_deformed)
-        displ = (p2[0]-p1[0], p2[1]-p1[1], p2[2]-p1[2])
-        displacement.SetTuple3(idx_initial, displ[0], displ[1], displ[2])
+    displacement = numpy_to_vtk(displ, deep=True, array_type=VTK_FLOAT)
     return displacement
 
 
@@ -262,6 +301,36 @@ def extract_surface(
     return geometryFilter.GetOutput()
 
 
+def get_triangles(
+    surface: vtkPolyData,
+) ->(np.ndarray, np.ndarray):
+    """
+    Returns the points and triangles of a surface as numpy arrays, without a copy where
+    possible. Polygons and triangle strips are triangulated first if necessary.
+
+    Args:
+        surface: A vtkPolyData object.
+
+    Returns:
+        vertices, faces
+            * vertices: Nx3 array of point coordinates.
+            * faces: Mx3 array of point indices, one row per triangle.
+    """
+    polys = surface.GetPolys()
+    sizes = np.diff(vtk_to_numpy(polys.GetOffsetsArray()))
+    if surface.GetNumberOfStrips() > 0 or np.any(sizes != 3):
+        triangle_filter = vtkTriangleFilter()
+        triangle_filter.PassVertsOff()
+        triangle_filter.PassLinesOff()
+        triangle_filter.SetInputData(surface)
+        triangle_filter.Update()
+        surface = triangle_filter.GetOutput()
+        polys = surface.GetPolys()
+    vertices = vtk_to_numpy(surface.GetPoints().GetData())
+    faces = vtk_to_numpy(polys.GetConnectivityArray()).reshape(-1, 3)
+    return vertices, faces
+
+
 def generate_point_normals(
     mesh: vtkPolyData,
 ) ->vtkPolyData:
@@ -322,59 +391,94 @@ def get_connected_vertices(
     return connected_vertices
 
 
+def calc_edge_graph(
+    mesh: vtkDataSet,
+) ->csr_matrix:
+    """
+    Builds a sparse graph which connects every pair of points that share a cell, weighted by
+    the euclidean distance between the points.
+
+    Args:
+        mesh: The vtkDataSet object.
+
+    Returns:
+        A symmetric NxN scipy.sparse.csr_matrix, where N is the number of points in mesh.
+    """
+    num_points = mesh.GetNumberOfPoints()
+
+    # Gather the point ids of all cells as a flat connectivity array with offsets:
+    if isinstance(mesh, vtkPolyData):
+        cell_arrays = [mesh.GetVerts(), mesh.GetLines(), mesh.GetPolys(), mesh.GetStrips()]
+    elif isinstance(mesh, vtkUnstructuredGrid):
+        cell_arrays = [mesh.GetCells()]
+    else:
+        cell_arrays = []
+        cells = vtkCellArray()
+        for i in range(mesh.GetNumberOfCells()):
+            cells.InsertNextCell(mesh.GetCell(i).GetPointIds())
+        cell_arrays.append(cells)
+
+    pairs = [np.empty((0, 2), dtype=np.int64)]
+    for cells in cell_arrays:
+        if cells is None or cells.GetNumberOfCells() == 0:
+            continue
+        offsets = vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64)
+        connectivity = vtk_to_numpy(cells.GetConnectivityArray()).astype(np.int64)
+        sizes = np.diff(offsets)
+        # Handle all cells with the same number of points at once:
+        for size in np.unique(sizes):
+            if size < 2:
+                continue
+            starts = offsets[:-1][sizes == size]
+            cell_points = connectivity[starts[:, None] + np.arange(size)]
+            first, second = np.triu_indices(size, k=1)
+            pairs.append(np.stack((cell_points[:, first].ravel(),
+                cell_points[:, second].ravel()), axis=1))
+    pairs = np.concatenate(pairs)
+
+    # Every edge only once, in both directions:
+    pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    points = vtk_to_numpy(mesh.GetPoints().GetData()).astype(np.float64)
+    lengths = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    rows = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    cols = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    return csr_matrix((np.concatenate((lengths, lengths)), (rows, cols)),
+            shape=(num_points, num_points))
+
+
 def calc_geodesic_distance(
     mesh: vtkDataSet, 
-    node_id: int,
+    node_id: Union[int, List[int]],
+    edge_graph: Optional[csr_matrix] = None,
 ) ->vtkDoubleArray:
     """
     Computes the geodesic distance of each point in the input mesh with respect to the 
     point with index node_id.
 
+    The geodesic distance is approximated by the length of the shortest path along the
+    edges of the mesh, calculated with Dijkstra's algorithm.
+
     Args:
         mesh: The vtkDataSet object. 
-        node_id: The ID of the node for which neighbors are to be found.
+        node_id: The ID of the node from which distances are measured. If a list of IDs is
+            given, the distance to the closest of these nodes is computed.
+        edge_graph: The result of :func:`calc_edge_graph` for this mesh. Pass this when
+            calling the function multiple times for the same mesh, to avoid rebuilding it.
 
     Returns:
         A vtkDoubleArray named "geodesic_distance" containing the geodesic distance 
-        of each point in the mesh to the point node_id.
+        of each point in the mesh to the point node_id. Unreachable points have a
+        distance of 1e10.
     """
+    if edge_graph is None:
+        edge_graph = calc_edge_graph(mesh)
 
-    # pre-compute cell neighbors:
-    neighbors = {}
-    for i in range(mesh.GetNumberOfPoints()):
-        neighbors[i] = get_connected_vertices(mesh, i)
+    dist = dijkstra(edge_graph, directed=False, indices=node_id, min_only=True)
+    dist[np.isinf(dist)] = 1e10
 
-    distance = vtkDoubleArray()
-    distance.SetNumberOfTuples(mesh.GetNumberOfPoints())
-    distance.SetNumberOfComponents(1)
-    distance.Fill(1e10)   # initialize with large numbers
+    distance = numpy_to_vtk(dist, deep=True, array_type=VTK_DOUBLE)
     distance.SetName("geodesic_distance")
-
-    front = [node_id]
-    distance.SetTuple1(node_id, 0)
-
-    while len(front) > 0:
-
-        cur_id = front.pop(0)
-        cur_pt = mesh.GetPoint(cur_id)
-        cur_dist = distance.GetTuple1(cur_id)
-        cur_neighbors = neighbors[cur_id]
-
-        # Go through all neighboring points. Check if the distance in those points
-        # is still up to date or whether there is a shorter path to them:
-        for n_id in cur_neighbors:
-
-            # Find distance between this neighbour and the current point:
-            n_pt = mesh.GetPoint(n_id)
-            dist = math.sqrt(vtkMath.Distance2BetweenPoints(n_pt, cur_pt))
-
-            new_dist = dist + cur_dist
-            if new_dist < distance.GetTuple1(n_id):
-                distance.SetTuple1(n_id, new_dist)
-                if not n_id in front:
-                    # This neighbor node needs to be checked again!
-                    front.append(n_id)
-
     return distance
 
 
@@ -510,18 +614,10 @@ def find_corresponding_indices(
         A list of int with the ids of mesh vertices closest to each point.
 
     """
-    locator = vtkPointLocator( )
-    locator.SetDataSet( mesh )
-    locator.SetNumberOfPointsPerBucket(1)
-    locator.BuildLocator()
-
-    corresponding_indices = []
-
-    for idx in range(len(points)):
-        point = points[idx]
-        mesh_id = locator.FindClosestPoint( point )
-        corresponding_indices.append(mesh_id)
-    return corresponding_indices
+    # Query all points at once instead of one vtkPointLocator search per point:
+    tree = cKDTree(vtk_to_numpy(mesh.GetPoints().GetData()))
+    _, corresponding_indices = tree.query(np.asarray(points, dtype=np.float64).reshape(-1, 3))
+    return corresponding_indices.tolist()
 
 def remap_arrays(
     input_geometry: vtkDataSet,
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The pipeline modules are imported relative to src/, like in the benchmarks:
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
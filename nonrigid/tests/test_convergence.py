@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from core.sofa.objects.convergence import ConvergenceMonitor, ConvergenceMetric
+
+
+def test_steps_after_convergence_are_not_counted():
+    monitor = ConvergenceMonitor(ConvergenceMetric.VELOCITY, threshold=0.5, min_steps=3)
+    # Stand-in for a MechanicalObject at rest:
+    state = SimpleNamespace(velocity=SimpleNamespace(value=np.zeros((4, 3))))
+
+    # e.g. the remaining steps of a batch run by Sofa.Simulation.animateNSteps:
+    for _ in range(10):
+        monitor.update(state, 0.01)
+
+    assert monitor.converged
+    assert monitor.steps_to_convergence == 3
+    assert monitor.step == 3
+    assert monitor.num_evaluations == 3
@@ -0,0 +1,56 @@
+import pickle
+import threading
+
+from core.datasample import DataSample
+
+
+def test_block_random_is_independent_of_thread_order(tmp_path):
+    sample = DataSample(str(tmp_path), 3)
+    draws = {}
+    barrier = threading.Barrier(2)
+
+    def draw(block_index):
+        with sample.block_random(block_index):
+            barrier.wait()
+            draws[block_index] = [sample.random.random() for _ in range(100)]
+
+    threads = [threading.Thread(target=draw, args=(i,)) for i in (0, 1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for i in (0, 1):
+        with sample.block_random(i):
+            assert draws[i] == [sample.random.random() for _ in range(100)]
+    assert draws[0] != draws[1]
+    # Outside of a block, the sample's own generator is used:
+    assert sample.random is sample._random
+
+def test_concurrent_config_values(tmp_path):
+    sample = DataSample(str(tmp_path), 1)
+
+    def insert(block):
+        for i in range(200):
+            sample.set_config_value(block, f"value{i}", i)
+
+    # Values are stored under the class name of the block:
+    blocks = [type(f"Block{b}", (), {})() for b in range(8)]
+    threads = [threading.Thread(target=insert, args=(block,)) for block in blocks]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(len(sample.config[f"Block{b}"]) == 200 for b in range(8))
+
+    # The lock is re-created when the sample is sent to another process:
+    copy = pickle.loads(pickle.dumps(sample))
+    copy.set_config_value(blocks[0], "after_pickle", 1)
+    assert copy.config["Block0"]["after_pickle"] == 1
+
+def test_clear_files_without_sample_folder(tmp_path):
+    sample = DataSample(str(tmp_path / "sample"), 2)
+    sample.write("mesh.txt", "data")
+    # Nothing was flushed yet, so the folder does not exist:
+    sample.clear_files(["mesh.txt"])
+    assert "mesh.txt" not in sample._cache
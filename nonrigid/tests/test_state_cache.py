@@ -0,0 +1,35 @@
+import numpy as np
+
+from blocks.simulation.state_cache import SimulationStateCache, steps_after_settling
+
+
+def test_store_and_load(tmp_path):
+    cache = SimulationStateCache(str(tmp_path))
+    key = cache.key("mesh", {"dt": 0.01}, np.arange(3))
+    assert cache.load(key) is None
+    positions = np.random.rand(10, 3)
+    velocities = np.random.rand(10, 3)
+    cache.store(key, positions, velocities)
+    loaded_positions, loaded_velocities = cache.load(key)
+    assert np.array_equal(loaded_positions, positions)
+    assert np.array_equal(loaded_velocities, velocities)
+    # no temporary files are left behind:
+    assert [p.name for p in tmp_path.iterdir()] == [key + ".npz"]
+
+def test_key_depends_on_all_parts():
+    key = SimulationStateCache.key("mesh", {"dt": 0.01}, np.arange(3))
+    assert key == SimulationStateCache.key("mesh", {"dt": 0.01}, np.arange(3))
+    assert key != SimulationStateCache.key("mesh", {"dt": 0.02}, np.arange(3))
+    assert key != SimulationStateCache.key("mesh", {"dt": 0.01}, np.arange(3, dtype=np.float32))
+
+def test_steps_after_settling():
+    # No warm start cache or cache hit: all steps count
+    assert steps_after_settling(10, 10, False, None) == 10
+    # Still settling: nothing counts
+    assert steps_after_settling(10, 10, True, None) == 0
+    # Settled after 25 steps within the batch of steps 21..30: only 26..30 count
+    assert steps_after_settling(30, 10, False, 25) == 5
+    # Settled in the last step of the batch: nothing counts
+    assert steps_after_settling(30, 10, False, 30) == 0
+    # Batches after the one in which settling ended count completely
+    assert steps_after_settling(40, 10, False, 25) == 10
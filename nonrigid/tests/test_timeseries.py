@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from core.datasample import DataSample
+from core.timeseries import TimeSeriesReader, TimeSeriesWriter, series_filename
+
+
+def _mesh():
+    source = vtk.vtkSphereSource()
+    source.Update()
+    return source.GetOutput()
+
+def _moved(mesh, offset):
+    moved = vtk.vtkPolyData()
+    moved.DeepCopy(mesh)
+    points = vtk_to_numpy(moved.GetPoints().GetData())
+    points += offset
+    return moved
+
+def _points(mesh):
+    return vtk_to_numpy(mesh.GetPoints().GetData())
+
+
+def test_write_and_read_frames(tmp_path):
+    reference = _mesh()
+    path = str(tmp_path / "deformed_series.tseries")
+    with TimeSeriesWriter(path, reference, frame_extension=".vtp") as writer:
+        for frame in range(1, 4):
+            writer.append(frame, _moved(reference, frame))
+        # A frame written again replaces the earlier one:
+        writer.append(2, _moved(reference, 10))
+
+    reader = TimeSeriesReader(path)
+    assert reader.frames == [1, 2, 3]
+    assert reader.frame_extension == ".vtp"
+    assert reader.read(4) is None
+    for frame, offset in [(1, 1), (2, 10), (3, 3)]:
+        mesh = reader.read(frame)
+        assert mesh.GetNumberOfCells() == reference.GetNumberOfCells()
+        assert np.allclose(_points(mesh), _points(reference) + offset)
+
+def test_partially_written_record_is_ignored(tmp_path):
+    reference = _mesh()
+    path = str(tmp_path / "deformed_series.tseries")
+    with TimeSeriesWriter(path, reference) as writer:
+        writer.append(1, reference)
+        writer.append(2, reference)
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 5)
+    assert TimeSeriesReader(path).frames == [1]
+
+def test_frame_with_other_number_of_points_is_rejected(tmp_path):
+    with TimeSeriesWriter(str(tmp_path / "a_series.tseries"), _mesh()) as writer:
+        with pytest.raises(ValueError):
+            writer.append(1, vtk.vtkPolyData())
+
+def test_series_filename():
+    assert series_filename("deformed.vtu") == "deformed_series.tseries"
+    assert series_filename("deformed_A.vtu") == "deformed_A_series.tseries"
+
+
+def test_datasample_frames(tmp_path):
+    reference = _mesh()
+    # The sample folder does not exist yet:
+    path = str(tmp_path / "sample")
+    sample = DataSample(path, 1)
+    with sample.open_time_series("deformed.vtp", reference) as writer:
+        for frame in range(1, 4):
+            writer.append(frame, _moved(reference, frame))
+
+    # A new sample has not listed its files yet, frames are still found by name:
+    sample = DataSample(path, 1)
+    assert np.allclose(_points(sample._read("deformed_f2.vtp")), _points(reference) + 2)
+    assert sample._read("deformed_f4.vtp") is None
+    assert sample._read("deformed_f2.vtu") is None
+
+    frames = [(name, frame) for name, _, _, frame, _ in sample.read_all("deformed.vtp")]
+    assert frames == [("deformed_f1.vtp", 1), ("deformed_f2.vtp", 2), ("deformed_f3.vtp", 3)]
+
+    sample.clear_files(["deformed.vtp"])
+    assert list(sample.read_all("deformed.vtp")) == []
+    assert sample._read("deformed_f2.vtp") is None
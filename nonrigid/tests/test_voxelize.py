@@ -0,0 +1,35 @@
+import numpy as np
+from vtk import vtkCylinderSource, vtkCellLocator, vtkTriangleFilter, mutable
+from vtk.util.numpy_support import vtk_to_numpy
+
+from blocks.voxelization.voxelize import create_grid, surface_distance
+
+
+def _reference_distance(mesh, points):
+    locator = vtkCellLocator()
+    locator.SetDataSet(mesh)
+    locator.BuildLocator()
+    closest = [0.0, 0.0, 0.0]
+    cell_id, sub_id, dist2 = mutable(0), mutable(0), mutable(0.0)
+    dist = np.empty(len(points))
+    for i, p in enumerate(points):
+        locator.FindClosestPoint(p, closest, cell_id, sub_id, dist2)
+        dist[i] = np.sqrt(dist2.get())
+    return dist
+
+
+def test_surface_distance_thin_triangles():
+    # The sides and caps of a finely resolved cylinder consist of long, thin triangles,
+    # whose centroids are far from most of their points:
+    cylinder = vtkCylinderSource()
+    cylinder.SetRadius(0.05)
+    cylinder.SetHeight(0.3)
+    cylinder.SetResolution(200)
+    triangle_filter = vtkTriangleFilter()
+    triangle_filter.SetInputConnection(cylinder.GetOutputPort())
+    triangle_filter.Update()
+    mesh = triangle_filter.GetOutput()
+
+    points = vtk_to_numpy(create_grid(size=0.5, num_cells=11).GetPoints().GetData())
+    dist = surface_distance(mesh, points)
+    np.testing.assert_allclose(dist, _reference_distance(mesh, points), rtol=0, atol=1e-9)
@@ -0,0 +1,16 @@
+import numpy as np
+from vtk import VTK_TETRA, VTK_TRIANGLE
+
+from utils.vtkutils import create_unstructured_grid
+
+
+def test_create_unstructured_grid_with_empty_cell_block():
+    points = np.random.rand(4, 3)
+    triangles = np.array([[0, 1, 2], [0, 2, 3]])
+    tetrahedra = np.zeros(0, dtype=np.int64)    # e.g. no volume elements from gmsh
+
+    grid = create_unstructured_grid(points, [(VTK_TRIANGLE, triangles), (VTK_TETRA, tetrahedra)])
+
+    assert grid.GetNumberOfPoints() == 4
+    assert grid.GetNumberOfCells() == 2
+    assert all(grid.GetCellType(i) == VTK_TRIANGLE for i in range(2))
@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+
+import pytest
+
+from core.worker_pool import WorkerPool
+
+
+def _child(queue, value):
+    queue.put(value*2)
+
+def _start_child(value):
+    """ A task which starts a process of its own, as e.g. the GMSH worker does. """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child, args=(queue, value))
+    process.start()
+    result = queue.get(timeout=30)
+    process.join()
+    return result, process.exitcode
+
+def _pid(value):
+    return value, os.getpid()
+
+
+def test_task_can_start_child_process():
+    with WorkerPool(_start_child, max_workers=2) as pool:
+        results = sorted(pool.imap_unordered(range(6)))
+    assert results == [(2*i, 0) for i in range(6)]
+
+def test_workers_are_recycled_and_stopped():
+    pool = WorkerPool(_pid, max_workers=1, max_tasks_per_worker=2)
+    with pool:
+        processes = [pool.slots[0].process]
+        results = list(pool.imap_unordered(range(5)))
+    assert [value for value, _ in results] == list(range(5))
+    # Two tasks per process, the last process is not recycled:
+    assert len(set(pid for _, pid in results)) == 3
+    assert pool.slots[0].num_recycles == 2
+    assert pool.slots[0].process is None
+    assert not processes[0].is_alive()
+    # Memory is sampled after every task, also after the last one:
+    assert pool.slots[0].last_rss > 0
+    assert pool.slots[0].max_rss > 0
+
+def _exit(value):
+    os._exit(3)
+
+def test_dying_worker_is_reported():
+    with WorkerPool(_exit, max_workers=1) as pool:
+        with pytest.raises(Exception, match="died unexpectedly with exit code 3"):
+            list(pool.imap_unordered(range(2)))
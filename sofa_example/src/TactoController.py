@@ -60,13 +60,14 @@ def findClosestVerts(verts, pos, num_closest=1):
     closest_verts = [verts[i] for i in closest_indices]
     
     return closest_verts
-mesh=None
 def exportMesh(node):
-    global mesh
-    triangles=node.parent.Tissue.Visual.VMapping.output.triangles.value
-    positions=node.parent.Tissue.Visual.VMapping.output.position.value
-    mesh=trimesh.Trimesh(vertices=positions, faces=triangles)
-    return mesh
+    """Publish the tissue surface through the shared transport. The triangles are only
+    sent once, afterwards only the vertex positions are copied into shared memory."""
+    visual=node.parent.Tissue.Visual.VMapping.output
+    if not node.dataSender.topologySent:
+        node.dataSender.updateMesh(visual.position.value,faces=visual.triangles.value)
+    else:
+        node.dataSender.updateMesh(visual.position.value)
 def faceNormal(points):
     p1, p2, p3 = points
     
@@ -221,7 +222,8 @@ class TactoController(Sofa.Core.Controller):
         if self.getCollisionEstimatedForce()==0 or self.mode==1:
             sendForce=0.0
         self.dataSender.update("Sensor",self.transformWrapper.getPosition(),self.getAngles(),sendForce,mesh=None)
-        self.dataSender.update(name="Tissue",pos=None,orientation=None,mesh=exportMesh(self))
+        self.dataSender.update(name="Tissue",pos=None,orientation=None)
+        exportMesh(self)
     def reset(self):
         self.transformWrapper.setPosition([0.0, 0.13, 0, 0, 0, -0.7071068, 0.7071068])
         self.rigidobject.velocity.value=[[0, 0, 0, 0, 0, 0]]
@@ -1,7 +1,6 @@
-import threading
-from multiprocessing import Pipe
+from multiprocessing import shared_memory
 from time import sleep
-import copy
+import numpy as np
 class sofaObject:
     def __init__(self,name,position=None,orientation=None,forces=None,mesh=None):
         self.containsForces=True
@@ -53,53 +52,230 @@ class TransportData:
             s+=f"TransportData({v})"
         return s
 
-class DataReceiver(threading.Thread):
-    def __init__(self, conn):
-        super().__init__()
-        self.conn = conn
-        self.latest_data = TransportData()
-        self.running = True
-
-    def run(self):
-        while self.running:
-            if self.conn.poll(0.1):  # Poll for 0.1 second
-                self.latest_data = self.conn.recv()
-                #print(f"Received: {self.latest_data}")
-    def get(self):
-        return self.latest_data
+
+class SharedMesh:
+    """Read-only snapshot of a mesh published through a SharedTransport.
+
+    vertices and faces are copies made under the transport's seqlock, so they stay
+    consistent however long they are used. frame increases with every published vertex
+    update, topologyVersion whenever new faces were sent.
+    """
+    def __init__(self,vertices,faces,frame,topologyVersion):
+        self.vertices=vertices
+        self.faces=faces
+        self.frame=frame
+        self.topologyVersion=topologyVersion
+    def __repr__(self):
+        return f"SharedMesh(vertices={len(self.vertices)}, faces={len(self.faces)}, frame={self.frame}, topologyVersion={self.topologyVersion})"
+
+class SharedTransport:
+    """Fixed-layout shared memory block used to exchange poses, forces and a deforming
+    mesh between the SOFA process and the Tacto process.
+
+    Create it in the parent process before starting the child processes, then hand it to a Sender (SOFA
+    side) and a DataReceiver (Tacto side). There must only be a single writer.
+
+    Layout:
+        header   int64[8]: sequence counter (seqlock), frame, number of vertices,
+                 number of faces, topology version, index of the front vertex buffer
+        objects  float64[len(names),8]: position(3), orientation(3), forces, flags
+        vertices float32[2,maxVertices,3]: double buffered vertex positions
+        faces    int32[maxFaces,3]: topology, only written when it changes
+
+    Poses, forces, faces and the mesh header are protected by the seqlock: the writer
+    makes the sequence counter odd while writing and even again when done, a reader
+    retries until it saw the same even counter before and after copying. Vertex
+    positions are written into the back buffer outside of the lock and made visible by
+    flipping the front buffer index inside of it. The writer only starts overwriting the
+    front buffer after the next flip, which changes the counter, so the same check also
+    guarantees that the copied vertices are not torn.
+
+    Only the name and size of the shared memory block are pickled, so the transport
+    can also be passed to processes started with the spawn or forkserver methods.
+    """
+    HEADER_SIZE=8
+    OBJECT_SIZE=8
+    FLAG_VALID=1
+    FLAG_FORCES=2
+    FLAG_MESH=4
+    def __init__(self,names=("Sensor","Tissue"),meshName="Tissue",maxVertices=200000,maxFaces=400000):
+        self.names=list(names)
+        self.index={name:i for i,name in enumerate(self.names)}
+        self.meshName=meshName
+        self.maxVertices=maxVertices
+        self.maxFaces=maxFaces
+        headerBytes=self.HEADER_SIZE*8
+        objectBytes=len(self.names)*self.OBJECT_SIZE*8
+        vertexBytes=2*maxVertices*3*4
+        faceBytes=maxFaces*3*4
+        self.shm=shared_memory.SharedMemory(create=True,size=headerBytes+objectBytes+vertexBytes+faceBytes)
+        self._attach()
+        self.header[:]=0
+        self.objects[:]=0
+
+    def _attach(self):
+        """Create the numpy views into the shared memory block."""
+        headerBytes=self.HEADER_SIZE*8
+        objectBytes=len(self.names)*self.OBJECT_SIZE*8
+        vertexBytes=2*self.maxVertices*3*4
+        offset=0
+        self.header=np.ndarray((self.HEADER_SIZE,),dtype=np.int64,buffer=self.shm.buf,offset=offset)
+        offset+=headerBytes
+        self.objects=np.ndarray((len(self.names),self.OBJECT_SIZE),dtype=np.float64,buffer=self.shm.buf,offset=offset)
+        offset+=objectBytes
+        self.vertices=np.ndarray((2,self.maxVertices,3),dtype=np.float32,buffer=self.shm.buf,offset=offset)
+        offset+=vertexBytes
+        self.faces=np.ndarray((self.maxFaces,3),dtype=np.int32,buffer=self.shm.buf,offset=offset)
+
+    def __getstate__(self):
+        # The views would be pickled as copies of the arrays, re-attach by name instead:
+        return {"names":self.names,"meshName":self.meshName,"maxVertices":self.maxVertices,
+                "maxFaces":self.maxFaces,"shmName":self.shm.name}
+    def __setstate__(self,state):
+        self.names=state["names"]
+        self.index={name:i for i,name in enumerate(self.names)}
+        self.meshName=state["meshName"]
+        self.maxVertices=state["maxVertices"]
+        self.maxFaces=state["maxFaces"]
+        self.shm=shared_memory.SharedMemory(name=state["shmName"])
+        self._attach()
+
+    # Writer side:
+    def _beginWrite(self):
+        self.header[0]+=1
+    def _endWrite(self):
+        self.header[0]+=1
+    def writeObject(self,name,pos=None,orientation=None,forces=None):
+        row=self.objects[self.index[name]]
+        self._beginWrite()
+        if pos is not None:
+            row[0:3]=pos
+        if orientation is not None:
+            row[3:6]=orientation
+        flags=int(row[7])|self.FLAG_VALID
+        if forces is not None:
+            row[6]=forces
+            flags|=self.FLAG_FORCES
+        row[7]=flags
+        self._endWrite()
+    def writeFaces(self,faces):
+        faces=np.asarray(faces).reshape(-1,3)
+        if len(faces)>self.maxFaces:
+            raise ValueError(f"Mesh has {len(faces)} faces, but the shared transport only holds {self.maxFaces}")
+        self._beginWrite()
+        self.faces[:len(faces)]=faces
+        self.header[3]=len(faces)
+        self.header[4]+=1
+        self._endWrite()
+    def writeVertices(self,vertices):
+        vertices=np.asarray(vertices).reshape(-1,3)
+        if len(vertices)>self.maxVertices:
+            raise ValueError(f"Mesh has {len(vertices)} vertices, but the shared transport only holds {self.maxVertices}")
+        back=1-self.header[5]
+        self.vertices[back,:len(vertices)]=vertices
+        row=self.objects[self.index[self.meshName]]
+        self._beginWrite()
+        self.header[2]=len(vertices)
+        self.header[5]=back
+        self.header[1]+=1
+        row[7]=int(row[7])|self.FLAG_VALID|self.FLAG_MESH
+        self._endWrite()
+
+    # Reader side:
+    def frame(self):
+        return int(self.header[1])
+    def read(self,previousMesh=None):
+        """Return a consistent snapshot of all objects and of the mesh as (objects, mesh).
+
+        mesh is a SharedMesh with copies of the vertices and faces, or None if no vertices
+        were published yet. Pass the mesh of the previous call as previousMesh to copy only
+        what changed: it is returned as is if no new frame was published, and its faces are
+        reused as long as the topology did not change.
+        """
+        while True:
+            seq=int(self.header[0])
+            if seq&1:
+                sleep(0)
+                continue
+            objects=self.objects.copy()
+            frame,numVertices,numFaces,topologyVersion,front=[int(v) for v in self.header[1:6]]
+            mesh=None
+            sameTopology=previousMesh is not None and previousMesh.topologyVersion==topologyVersion
+            if sameTopology and previousMesh.frame==frame:
+                mesh=previousMesh
+            elif numVertices>0:
+                vertices=self.vertices[front,:numVertices].copy()
+                vertices.flags.writeable=False
+                if sameTopology:
+                    faces=previousMesh.faces
+                else:
+                    faces=self.faces[:numFaces].copy()
+                    faces.flags.writeable=False
+                mesh=SharedMesh(vertices,faces,frame,topologyVersion)
+            if int(self.header[0])==seq:
+                return objects,mesh
+
+    def close(self):
+        self.header=self.objects=self.vertices=self.faces=None
+        self.shm.close()
+    def unlink(self):
+        self.shm.unlink()
+
+class DataReceiver:
+    """Tacto side of a SharedTransport. Every access reads the latest published state,
+    there is no receiving thread anymore. Each access copies the poses (and the mesh if it
+    changed), so keep the result of latest_data instead of accessing it repeatedly."""
+    # Offset which was historically added to all received positions:
+    Z_OFFSET=2.0
+    def __init__(self, transport):
+        self.transport = transport
+        self.lastMesh = None
+
+    def _snapshot(self):
+        objects,mesh=self.transport.read(self.lastMesh)
+        self.lastMesh=mesh
+        data=TransportData()
+        for name,i in self.transport.index.items():
+            row=objects[i]
+            flags=int(row[7])
+            if not flags&SharedTransport.FLAG_VALID:
+                continue
+            pos=[float(row[0]),float(row[1]),float(row[2])+self.Z_OFFSET]
+            forces=float(row[6]) if flags&SharedTransport.FLAG_FORCES else None
+            objectMesh=mesh if flags&SharedTransport.FLAG_MESH else None
+            data.addObjectG(name,sofaObject(name=name,position=pos,orientation=row[3:6].tolist(),forces=forces,mesh=objectMesh))
+        return data
+    @property
+    def latest_data(self):
+        return self._snapshot()
     def get(self,name):
-        return self.latest_data.sofaOjectDict[name]
+        return self._snapshot().get(name)
     def tolist(self):
-        self.latest_data.tolist()
+        return self._snapshot().tolist()
+    def frame(self):
+        return self.transport.frame()
     def stop(self):
-        self.running = False
-        self.conn.close()
+        self.transport.close()
 
-class Sender(threading.Thread):
-    def __init__(self, conn):
-        super().__init__()
-        self.conn = conn
-        self.curData = TransportData()
-        self.running = True
+class Sender:
+    """SOFA side of a SharedTransport. Updates are written into shared memory
+    immediately, so there is no sending thread anymore."""
+    def __init__(self, transport):
+        self.transport = transport
+        self.topologySent = False
 
     def update(self, name, pos, orientation, forces=None,mesh=None):
-        self.curData.addObject(sofaObject(name=name,position=pos,orientation=orientation,forces=forces,mesh=mesh))
-        #self.curData = TransportData(pos, orientation, forces,self.curData.tissuePos,self.curData.tissueOr,mesh)
-    def copyLatest(self):
-        ret=TransportData()
-        for key,val in self.curData.getDict().items():
-            pos=[val.position[0],val.position[1],(val.position[2]+2.0)]
-            ret.addObjectG(key,sofaObject(name=val.name,position=pos,orientation=val.orientation,forces=val.forces,mesh=val.mesh))
-        #print(ret.sofaOjectDict)
-        return ret
-    def run(self):
-        while self.running:
-            if self.curData:
-                self.conn.send(self.copyLatest())
-                #print(f"Sent: {self.copyLatest()}")
-                  # Reset after sending
-            sleep(0.01)  # Simulate some delay
-
+        self.transport.writeObject(name,pos,orientation,forces)
+        if mesh is not None:
+            self.updateMesh(mesh.vertices,mesh.faces)
+    def updateMesh(self,vertices,faces=None):
+        """Publish new vertex positions. faces only has to be passed if the topology
+        changed, it is sent with the first update in any case."""
+        if faces is not None:
+            self.transport.writeFaces(faces)
+            self.topologySent=True
+        elif not self.topologySent:
+            raise ValueError("The first mesh update has to contain the faces")
+        self.transport.writeVertices(vertices)
     def stop(self):
-        self.running = False
-        self.conn.close()
\ No newline at end of file
+        self.transport.close()
@@ -9,7 +9,7 @@ from core.sofa.components.forcefield import Material, ConstitutiveModel
 from core.sofa.components.solver import SolverType, TimeIntegrationType
 from TactoController import TactoController,ControllMode,ForceMode
 import SofaRootConfig
-from multiprocessing import Process, Pipe
+from multiprocessing import Process
 from threading import Thread
 #from core.sofa.components.solver import TimeIntegrationType, ConstraintCorrectionType, SolverType, add_solver
 from SofaRootConfig import Environment,Solver
@@ -23,7 +23,7 @@ import numpy as np
 #import tacto  # Import TACTO
 import vtk
 import hydra
-from dataTransport import TransportData, Sender 
+from dataTransport import SharedTransport, Sender 
 # Choose in your script to activate or not the GUI
 USE_GUI = True
 
@@ -100,11 +100,10 @@ def createScene(root,dataSend):
     print(type(root))
     root.addObject(TactoController(name = "Tacto",meshfile="mesh/digit_transformed2.stl",senderD=dataSend,parent=root,solver=solver,stiffness=10.0,forceMode=ForceMode.dof,controllMode=ControllMode.forceField))
     return root
-def sofaSimLoop(root,sendConn):
+def sofaSimLoop(root,transport):
     
-    dataSend=Sender(sendConn)
+    dataSend=Sender(transport)
     createScene(root,dataSend)
-    dataSend.start()
     Sofa.Simulation.init(root)
     send=Thread()
     
@@ -117,22 +116,27 @@ def sofaSimLoop(root,sendConn):
         Sofa.Gui.GUIManager.SetDimension(1080, 1080)
         Sofa.Gui.GUIManager.MainLoop(root)
         Sofa.Gui.GUIManager.closeGUI()
-    dataSend.join()
+    dataSend.stop()
 @hydra.main(config_path="../config", config_name="digit")
 def main(cfg):
     import SofaRuntime
     import Sofa.Gui
     root = Sofa.Core.Node("root")
-    parent_conn, child_conn = Pipe()
+    # Shared memory block through which SOFA publishes poses, forces and the tissue mesh:
+    transport=SharedTransport(names=("Sensor","Tissue"),meshName="Tissue")
 
     
     
-    sofaProc=Process(target=sofaSimLoop,args=(root,parent_conn,))
-    tactoProc=Process(target=tactoEnvironment.tactoLaunch,args=(cfg,child_conn,))
-    tactoProc.start()
-    sofaProc.start()
-    sofaProc.join()
-    tactoProc.join()
+    sofaProc=Process(target=sofaSimLoop,args=(root,transport,))
+    tactoProc=Process(target=tactoEnvironment.tactoLaunch,args=(cfg,transport,))
+    try:
+        tactoProc.start()
+        sofaProc.start()
+        sofaProc.join()
+        tactoProc.join()
+    finally:
+        transport.close()
+        transport.unlink()
 
 
 
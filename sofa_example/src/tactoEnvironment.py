@@ -11,7 +11,7 @@ import tacto
 import threading
 import logging
 from time import sleep
-from dataTransport import TransportData,DataReceiver
+from dataTransport import DataReceiver
 log = logging.getLogger(__name__)
 
 def stlToPyrenderMesh(meshfile):
@@ -26,8 +26,8 @@ def tactoLoop(digits,dataReceive):
         
         color, depth = digits.render()
         digits.updateGUI(color, depth)
-def tactoLaunch(cfg,receiveConn):
-    dataReceive=DataReceiver(receiveConn)
+def tactoLaunch(cfg,transport):
+    dataReceive=DataReceiver(transport)
     # Load the config YAML file from examples/conf/digit.yaml
 
         # Initialize digits
@@ -52,11 +52,10 @@ def tactoLaunch(cfg,receiveConn):
     #panel = px.gui.PoseControlPanel(obj, **cfg.object_control_panel)
     #panel.start()
     #log.info("Use the slides to move the object until in contact with the DIGIT")
-    dataReceive.start()
     # run p.stepSimulation in another thread
     t = px.utils.SimulationThread(real_time_factor=1.0)
     t.start()
     thread = threading.Thread(target=tactoLoop, args=(digits,dataReceive,))
     thread.start()
     thread.join()
-    dataReceive.join()
+    dataReceive.stop()
@@ -9,19 +9,39 @@ from multiprocessing import Process, Queue
 
 
 class RandomNormalGenerator(Process):
-    def __init__(self, mean, std, size, prefetch=16):
+    def __init__(self, mean, std, size, prefetch=16, dtype=np.float64):
         super().__init__(daemon=True)
         self.mean = mean
         self.std = std
         self.size = size
+        self.dtype = dtype
 
         self._q = Queue(maxsize=prefetch)
         self.start()
 
     def run(self):
         while True:
-            noise = np.random.normal(self.mean, self.std, self.size)
+            noise = np.random.normal(self.mean, self.std, self.size).astype(self.dtype, copy=False)
             self._q.put(noise)
 
     def sample(self):
         return self._q.get()
+
+
+class RandomNormalPool:
+    """
+    Pool of pre-generated normal noise, so no noise has to be generated per frame.
+    sample() returns a read-only view into the pool that starts at a random offset,
+    so consecutive samples differ even though only pool_size images were drawn.
+    """
+
+    def __init__(self, mean, std, size, pool_size=32, dtype=np.float32):
+        self.size = tuple(size)
+        self.pool = np.random.normal(mean, std, (pool_size,) + self.size).astype(dtype)
+        self.pool.flags.writeable = False
+        self._flat = self.pool.reshape(-1)
+        self._n = int(np.prod(self.size))
+
+    def sample(self):
+        offset = np.random.randint(len(self._flat) - self._n + 1)
+        return self._flat[offset:offset + self._n].reshape(self.size)
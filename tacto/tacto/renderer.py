@@ -28,12 +28,110 @@ import numpy as np
 import pybullet as p
 import pyrender
 import trimesh
+from OpenGL import GL
 from omegaconf import OmegaConf
 from scipy.spatial.transform import Rotation as R
 
+from .random_normal_generator import RandomNormalGenerator, RandomNormalPool
+from .timeit import timeit
+
 logger = logging.getLogger(__name__)
 
 
+def vertex_normals(vertices, faces):
+    """
+    Area weighted vertex normals of a triangle mesh
+    :param vertices: (N, 3) array
+    :param faces: (M, 3) array of vertex indices
+    :return: (N, 3) array of unit normals
+    """
+    tris = vertices[faces]
+    face_normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    # Accumulate each face normal on its three vertices
+    indices = faces.ravel()
+    normals = np.stack(
+        [
+            np.bincount(indices, np.repeat(face_normals[:, i], 3), len(vertices))
+            for i in range(3)
+        ],
+        axis=1,
+    )
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.maximum(lengths, 1e-12)
+
+
+class DeformableMesh:
+    """
+    pyrender mesh with a single primitive whose vertices change every frame.
+    As long as the faces stay the same, new vertex positions are written into the
+    existing OpenGL vertex buffer instead of creating a new mesh.
+
+    This relies on pyrender internals (Primitive._vaid, Primitive._buffers, Mesh._bounds)
+    of the versions pinned in requirements.txt. If they are missing, the renderer falls
+    back to building a new primitive for every update.
+    """
+
+    def __init__(self, vertices, faces, topology_version=None):
+        self.faces = np.array(faces, dtype=np.uint32)
+        self.topology_version = topology_version
+        material = pyrender.MetallicRoughnessMaterial(
+            alphaMode="BLEND",
+            baseColorFactor=[0.3, 0.3, 0.3, 1.0],
+            metallicFactor=0.2,
+            roughnessFactor=0.8,
+        )
+        self.primitive = pyrender.Primitive(
+            positions=vertices,
+            normals=vertex_normals(vertices, self.faces),
+            indices=self.faces,
+            material=material,
+        )
+        self.mesh = pyrender.Mesh(primitives=[self.primitive])
+        self.dirty = False
+
+    @property
+    def updatable(self):
+        """
+        Check if the pyrender internals needed for in-place updates are available
+        """
+        return (
+            hasattr(self.primitive, "_vaid")
+            and hasattr(self.primitive, "_buffers")
+            and hasattr(self.mesh, "_bounds")
+        )
+
+    def matches(self, vertices, faces, topology_version=None):
+        """
+        Check if the vertex buffer can be reused for this geometry
+        """
+        if len(vertices) != len(self.primitive.positions):
+            return False
+        if topology_version is not None or self.topology_version is not None:
+            return topology_version == self.topology_version
+        return np.array_equal(faces, self.faces)
+
+    def update(self, vertices):
+        self.primitive.positions = vertices
+        self.primitive.normals = vertex_normals(self.primitive.positions, self.faces)
+        self.mesh._bounds = None
+        # Not yet uploaded: pyrender uses the new positions when it binds the primitive
+        self.dirty = self.primitive._vaid is not None
+
+    def upload(self):
+        """
+        Overwrite the vertex buffer, using pyrender's interleaved layout
+        (positions followed by normals). Requires the render context to be current.
+        """
+        vertex_data = np.ascontiguousarray(
+            np.hstack((self.primitive.positions, self.primitive.normals)),
+            dtype=np.float32,
+        )
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.primitive._buffers[0])
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, vertex_data.nbytes, vertex_data)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        self.dirty = False
+
+
 def euler2matrix(angles=[0, 0, 0], translation=[0, 0, 0], xyz="xyz", degrees=False):
     r = R.from_euler(xyz, angles, degrees=degrees)
 
@@ -54,16 +152,44 @@ def euler2matrix(angles=[0, 0, 0], translation=[0, 0, 0], xyz="xyz", degrees=Fal
 
 
 class Renderer:
-    def __init__(self, width, height, background, config_path):
+    def __init__(
+        self,
+        width,
+        height,
+        background,
+        config_path,
+        batch_render=False,
+        fused_post_process=False,
+        noise_source="pool",
+        noise_pool_size=32,
+    ):
         """
 
         :param width: scalar
         :param height: scalar
         :param background: image
         :param config_path:
+        :param batch_render: Bool, keep one persistent scene per camera with its lights
+                             already bound instead of swapping camera and lights per view
+        :param fused_post_process: Bool, calibrate and add noise in a single float32 pass
+                                   with cached background terms (see _post_process_fused)
+        :param noise_source: "pool" (pre-generated noise, see RandomNormalPool) or
+                             "prefetch" (RandomNormalGenerator process), only used with
+                             fused_post_process
+        :param noise_pool_size: number of noise images kept by the "pool" noise source
         """
         self._width = width
         self._height = height
+        self.batch_render = batch_render
+        self.fused_post_process = fused_post_process
+        assert noise_source in ("pool", "prefetch"), f"Unknown noise source {noise_source}"
+        self.noise_source = noise_source
+        self.noise_pool_size = noise_pool_size
+
+        # Caches of the fused post-processing, see _post_process_fused
+        self._noise_generators = {}
+        self._calibration_offsets = {}
+        self._post_buffers = {}
 
         if background is not None:
             self.set_background(background)
@@ -133,14 +259,22 @@ class Renderer:
         """
         self.object_nodes = {}
         self.current_object_nodes = {}
+        # {obj_name: DeformableMesh} for objects whose geometry is streamed in
+        self.deformable_meshes = {}
 
         self.current_light_nodes = []
+        self.current_light_ids = None
         self.cam_light_ids = []
 
         self._init_gel()
         self._init_camera()
         self._init_light()
 
+        # Persistent per-camera scenes, only used with batch_render
+        self.camera_scenes = []
+        if self.batch_render:
+            self._init_camera_scenes()
+
         self.r = pyrender.OffscreenRenderer(self.width, self.height)
 
         colors, depths = self.render(object_poses=None, noise=False, calibration=False)
@@ -368,9 +502,73 @@ class Renderer:
             # Add extra light node into scene_depth
             light_node_depth = pyrender.Node(light=light, matrix=light_pose_0)
             self.scene_depth.add_node(light_node_depth)
+    def _init_camera_scenes(self):
+        """
+        Create one scene per camera holding the camera, the gel and the camera's
+        lights. The nodes are shared with self.scene, so pose updates apply to all
+        scenes; object nodes are added and removed in all scenes together.
+        """
+        for i in range(self.nb_cam):
+            scene = pyrender.Scene(
+                bg_color=self.scene.bg_color, ambient_light=self.scene.ambient_light
+            )
+            scene.add_node(self.camera_nodes[i])
+            scene.main_camera_node = self.camera_nodes[i]
+            scene.add_node(self.gel_node)
+            for light_id in self.cam_light_ids[i]:
+                scene.add_node(self.light_nodes[light_id])
+            self.camera_scenes.append(scene)
+
+    def _add_object_node(self, node):
+        for scene in [self.scene] + self.camera_scenes:
+            scene.add_node(node)
+
+    def _remove_object_node(self, node):
+        for scene in [self.scene] + self.camera_scenes:
+            scene.remove_node(node)
+
     def update_Mesh(self,objTrimesh,obj_name):
         node=self.current_object_nodes[obj_name]
         node.mesh=objTrimesh
+
+    def update_object_mesh(self, obj_name, vertices, faces, topology_version=None):
+        """
+        Update the geometry of a deforming object. The vertex buffer is updated in
+        place; a new primitive is only created when the topology changes.
+        """
+        deformable = self.deformable_meshes.get(obj_name)
+        if (
+            deformable is not None
+            and deformable.updatable
+            and deformable.matches(vertices, faces, topology_version)
+        ):
+            deformable.update(vertices)
+            return
+        deformable = DeformableMesh(vertices, faces, topology_version)
+        self.deformable_meshes[obj_name] = deformable
+        self.object_nodes[obj_name].mesh = deformable.mesh
+
+    def _upload_deformable_meshes(self):
+        dirty = [m for m in self.deformable_meshes.values() if m.dirty]
+        if not dirty:
+            return
+        platform = getattr(self.r, "_platform", None)
+        if platform is None:
+            # Cannot make the context current: build new primitives instead
+            for obj_name, deformable in list(self.deformable_meshes.items()):
+                if not deformable.dirty:
+                    continue
+                deformable = DeformableMesh(
+                    deformable.primitive.positions,
+                    deformable.faces,
+                    deformable.topology_version,
+                )
+                self.deformable_meshes[obj_name] = deformable
+                self.object_nodes[obj_name].mesh = deformable.mesh
+            return
+        platform.make_current()
+        for deformable in dirty:
+            deformable.upload()
     def add_object(
         self, objTrimesh, obj_name, position=[0, 0, 0], orientation=[0, 0, 0]
     ):
@@ -381,7 +579,7 @@ class Renderer:
         mesh = pyrender.Mesh.from_trimesh(objTrimesh)
         pose = euler2matrix(angles=orientation, translation=position)
         obj_node = pyrender.Node(mesh=mesh, matrix=pose)
-        self.scene.add_node(obj_node)
+        self._add_object_node(obj_node)
 
         self.object_nodes[obj_name] = obj_node
         self.current_object_nodes[obj_name] = obj_node
@@ -415,12 +613,17 @@ class Renderer:
 
         node = self.object_nodes[obj_name]
         pose = euler2matrix(angles=orientation, translation=position)
-        self.scene.set_pose(node, pose=pose)
+        for scene in [self.scene] + self.camera_scenes:
+            scene.set_pose(node, pose=pose)
 
     def update_light(self, lightIDList):
         """
         Update the light node based on lightIDList, remove the previous light
         """
+        if self.current_light_ids == list(lightIDList):
+            return
+        self.current_light_ids = list(lightIDList)
+
         # Remove previous light nodes
         for node in self.current_light_nodes:
             self.scene.remove_node(node)
@@ -483,6 +686,7 @@ class Renderer:
     def set_background(self, background):
         self._background_real = cv2.resize(background, (self._width, self._height))
         self._background_real = self._background_real[:, :, ::-1]
+        self._calibration_offsets = {}
         return 0
 
     def adjust_with_force(
@@ -498,7 +702,7 @@ class Renderer:
         for obj_name in existing_obj_names:
             # Remove object from scene if not in contact
             if obj_name not in normal_forces:
-                self.scene.remove_node(self.current_object_nodes[obj_name])
+                self._remove_object_node(self.current_object_nodes[obj_name])
                 self.current_object_nodes.pop(obj_name)
 
         # Add/Update the objects' poses the scene if in contact
@@ -510,7 +714,7 @@ class Renderer:
             # Add the object node to the scene
             if obj_name not in self.current_object_nodes:
                 node = self.object_nodes[obj_name]
-                self.scene.add_node(node)
+                self._add_object_node(node)
                 self.current_object_nodes[obj_name] = node
             if self.force_enabled:
                 offset = -1.0
@@ -529,7 +733,83 @@ class Renderer:
 
             self.update_object_pose(obj_name, obj_pos, objOri)
 
+    def _noise_sample(self, shape):
+        """
+        Draw a noise image from the pre-generated pool or the prefetching process
+        """
+        generator = self._noise_generators.get(shape)
+        if generator is None:
+            mean = self.conf.sensor.noise.color.mean
+            std = self.conf.sensor.noise.color.std
+            if self.noise_source == "pool":
+                generator = RandomNormalPool(mean, std, shape, self.noise_pool_size)
+            else:
+                generator = RandomNormalGenerator(mean, std, shape, dtype=np.float32)
+            self._noise_generators[shape] = generator
+        return generator.sample()
+
+    def _calibration_offset(self, camera_index):
+        """
+        Constant part of the calibration: the blur is linear, so
+        blur((color - sim) * 0.5) + real = 0.5 * blur(color) + (real - 0.5 * blur(sim))
+        """
+        offset = self._calibration_offsets.get(camera_index)
+        if offset is None:
+            sim = self._background_sim[camera_index][:, :, :3].astype(np.float32)
+            offset = self._background_real.astype(np.float32) - 0.5 * cv2.GaussianBlur(
+                sim, (7, 7), 0
+            )
+            self._calibration_offsets[camera_index] = offset
+        return offset
+
+    def _post_buffer(self, color, camera_index):
+        """
+        Copy color into the camera's reusable float32 buffer
+        """
+        buf = self._post_buffers.get(camera_index)
+        if buf is None or buf.shape != color.shape:
+            buf = np.empty(color.shape, dtype=np.float32)
+            self._post_buffers[camera_index] = buf
+        np.copyto(buf, color)
+        return buf
+
+    @timeit
+    def _fused_blur(self, color, camera_index):
+        buf = self._post_buffer(color, camera_index)
+        cv2.GaussianBlur(buf, (7, 7), 0, dst=buf)
+        buf *= 0.5
+        return buf
+
+    @timeit
+    def _fused_combine(self, buf, camera_index, noise, calibration):
+        if calibration:
+            buf += self._calibration_offset(camera_index)
+        if noise:
+            buf += self._noise_sample(buf.shape)
+        np.clip(buf, 0, 255, out=buf)
+        return buf.astype(np.uint8)
+
+    def _post_process_fused(self, color, camera_index, noise=True, calibration=True):
+        """
+        Same result as _calibrate followed by _add_noise (up to float32 rounding and a
+        single instead of two uint8 truncations), computed in one pass over a reused
+        float32 buffer. The per-stage timings are collected by tacto.timeit.
+        """
+        calibration = calibration and self._background_real is not None
+        mean = self.conf.sensor.noise.color.mean
+        std = self.conf.sensor.noise.color.std
+        noise = noise and (mean != 0 or std != 0)
+        if not calibration and not noise:
+            return color
+        if calibration:
+            buf = self._fused_blur(color[:, :, :3], camera_index)
+        else:
+            buf = self._post_buffer(color, camera_index)
+        return self._fused_combine(buf, camera_index, noise, calibration)
+
     def _post_process(self, color, depth, camera_index, noise=True, calibration=True):
+        if self.fused_post_process:
+            return self._post_process_fused(color, camera_index, noise, calibration), depth
         if calibration:
             color = self._calibrate(color, camera_index)
         if noise:
@@ -547,26 +827,34 @@ class Renderer:
         :return:
         """
         colors, depths = [], []
-        for i in range(self.nb_cam):
-            # Set the main camera node for rendering
-            self.scene.main_camera_node = self.camera_nodes[i]
-
-            # Set up corresponding lights (max: 8)
-            self.update_light(self.cam_light_ids[i])
-
-            # Adjust contact based on force
-            if object_poses is not None and normal_forces is not None:
-                # Get camera pose for adjusting object pose
-                #camera_pose = self.camera_nodes[i].matrix
-                #camera_pos = camera_pose[:3, 3].T
-                #camera_ori = R.from_matrix(camera_pose[:3, :3]).as_quat()
-                camera_pos=pos
-                camera_ori=orient
-                self.adjust_with_force(
-                    camera_pos, camera_ori, normal_forces, object_poses,
-                )
+        self._upload_deformable_meshes()
+
+        # Adjust contact based on force. This only depends on the sensor pose, so it
+        # is done once for all cameras.
+        if object_poses is not None and normal_forces is not None:
+            # Get camera pose for adjusting object pose
+            #camera_pose = self.camera_nodes[i].matrix
+            #camera_pos = camera_pose[:3, 3].T
+            #camera_ori = R.from_matrix(camera_pose[:3, :3]).as_quat()
+            camera_pos=pos
+            camera_ori=orient
+            self.adjust_with_force(
+                camera_pos, camera_ori, normal_forces, object_poses,
+            )
 
-            color, depth = self.r.render(self.scene, flags=self.flags_render)
+        for i in range(self.nb_cam):
+            if self.batch_render:
+                # Camera and lights are already bound in the camera's own scene
+                scene = self.camera_scenes[i]
+            else:
+                # Set the main camera node for rendering
+                scene = self.scene
+                scene.main_camera_node = self.camera_nodes[i]
+
+                # Set up corresponding lights (max: 8)
+                self.update_light(self.cam_light_ids[i])
+
+            color, depth = self.r.render(scene, flags=self.flags_render)
             color, depth = self._post_process(color, depth, i, noise, calibration)
 
             colors.append(color)
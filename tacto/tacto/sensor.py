@@ -55,31 +55,36 @@ def getSofaName(linkobj):
     if linkobj.obj_id==2:
         return "Tissue"
     return ""
+def refreshCollisionShape(link,vertices,faces,pos,orient):
+    """Replace the pybullet body of a deforming object by one with the current geometry"""
+    vertexList=vertices.tolist()
+    indices=faces.flatten().tolist()
+    new_visual_shape = p.createVisualShape(shapeType=p.GEOM_MESH, vertices=vertexList, indices=indices)
+    new_collision_shape = p.createCollisionShape(shapeType=p.GEOM_MESH, vertices=vertexList, indices=indices)
+    old_id=link.pybullet_id
+    # orient holds Euler angles (see Link.get_pose), pybullet expects a quaternion:
+    link.pybullet_id = p.createMultiBody(basePosition=pos,baseOrientation=p.getQuaternionFromEuler(orient),
+                                         baseVisualShapeIndex=new_visual_shape,
+                                         baseCollisionShapeIndex=new_collision_shape)
+    p.removeBody(old_id)
+    link.collisionVertices=np.array(vertices)
 def tissueHandle(link,sofaObject,pos,orient):
-    link.mesh=sofaObject.mesh
-    if link.mesh is not None:
-        #print("updatingMesh")
-        
-        
-        #print(self.mesh)
-        vertices = link.mesh.vertices.tolist()  # Convert to list
-        indices = link.mesh.faces.flatten().tolist()     # Convert to list
-        #print(vertices)
-        #print(indices)
-        new_visual_shape = p.createVisualShape(
-            shapeType=p.GEOM_MESH, 
-            vertices=vertices, 
-            indices=indices
-        )
-        new_collision_shape = p.createCollisionShape(shapeType=p.GEOM_MESH, vertices=vertices, 
-            indices=indices)
-        old_id=link.pybullet_id
-
-        link.pybullet_id = p.createMultiBody(basePosition=pos,baseOrientation=orient,baseVisualShapeIndex=new_visual_shape, baseCollisionShapeIndex=new_collision_shape)
-        from time import sleep
-        sleep(0.01)
-        p.removeBody(old_id)
-                
+    mesh=sofaObject.mesh
+    if mesh is None or mesh.frame==link.meshFrame:
+        return pos,orient
+    rebuild=mesh.topologyVersion!=link.topologyVersion or link.collisionVertices is None or \
+            len(link.collisionVertices)!=len(mesh.vertices)
+    link.mesh=mesh
+    link.meshFrame=mesh.frame
+    link.meshUpdated=True
+    link.topologyVersion=mesh.topologyVersion
+    # Rebuilding the pybullet body is expensive, so only do it once the surface moved
+    # noticeably since the last rebuild:
+    if not rebuild:
+        displacement=np.linalg.norm(mesh.vertices-link.collisionVertices,axis=1).max()
+        rebuild=displacement>link.collisionThreshold
+    if rebuild:
+        refreshCollisionShape(link,mesh.vertices,mesh.faces,pos,orient)
     return pos,orient 
 def sensorHandle(link,sofaObject,pos,orient):
     link.force=sofaObject.forces
@@ -101,6 +106,13 @@ class Link:
     initSofaPos=None
     force=None
     mesh=None
+    meshFrame=None
+    meshUpdated=False
+    topologyVersion=None
+    # Vertices of the current pybullet collision shape and the maximum vertex
+    # displacement (in m) before that shape is rebuilt:
+    collisionVertices=None
+    collisionThreshold=1e-3
     sofaName=""
     pybullet_id: int #ID used explicitly for pybullet
     def get_pose(self,dataReceive=None):
@@ -143,14 +155,16 @@ class Link:
         if dataReceive==None:
             #print("receiveNone")
             return position, orientation
-        if dataReceive.latest_data is None:
+        # One consistent snapshot of all objects per call:
+        latestData=dataReceive.latest_data
+        if latestData is None:
             #print("receiveDataNone")
             return position, orientation
-        dic=dataReceive.latest_data.getDict()
+        dic=latestData.getDict()
         if self.sofaName not in dic:
             #print("name not in dict")
             return position, orientation
-        sofaObject=dataReceive.get(self.sofaName)
+        sofaObject=latestData.get(self.sofaName)
             
         pos=sofaObject.position
         
@@ -174,7 +188,9 @@ class Sensor:
         show_depth=True,
         zrange=0.002,
         cid=0,
-        dataReceive=None
+        dataReceive=None,
+        batch_render=False,
+        fused_post_process=False
     ):
         """
 
@@ -185,9 +201,19 @@ class Sensor:
         :param show_depth: Bool
         :param config_path:
         :param cid: Int
+        :param batch_render: Bool, render each camera from its own persistent scene
+        :param fused_post_process: Bool, use the renderer's single-pass calibration and
+                                   pooled noise
         """
         self.cid = cid
-        self.renderer = Renderer(width, height, background, config_path)
+        self.renderer = Renderer(
+            width,
+            height,
+            background,
+            config_path,
+            batch_render=batch_render,
+            fused_post_process=fused_post_process,
+        )
 
         self.visualize_gui = visualize_gui
         self.show_depth = show_depth
@@ -316,12 +342,13 @@ class Sensor:
         
         for obj_name in self.objects.keys():
             self.object_poses[obj_name] = self.objects[obj_name].get_pose(self.dataReceiver)
-            if self.objects[obj_name].mesh is not None:
-                #print(type(self.objects[obj_name].mesh))
-                #print(self.objects[obj_name].mesh)
-                #print(type(self.renderer.current_object_nodes[obj_name].mesh))
-                self.renderer.current_object_nodes[obj_name].mesh=pyrender.Mesh.from_trimesh(self.objects[obj_name].mesh)
-                self.renderer.object_nodes[obj_name].mesh==self.objects[obj_name].mesh
+            link=self.objects[obj_name]
+            if link.meshUpdated:
+                # Only new vertex positions are uploaded, the primitive is kept
+                self.renderer.update_object_mesh(
+                    obj_name, link.mesh.vertices, link.mesh.faces, link.mesh.topologyVersion
+                )
+                link.meshUpdated=False
 
     def get_force(self, cam_name):
         # Load contact force
@@ -365,7 +392,13 @@ class Sensor:
 
     def _render_static(self):
         colors, depths = self.static
-        colors = [self.renderer._add_noise(color) for color in colors]
+        if self.renderer.fused_post_process:
+            colors = [
+                self.renderer._post_process_fused(color, i, calibration=False)
+                for i, color in enumerate(colors)
+            ]
+        else:
+            colors = [self.renderer._add_noise(color) for color in colors]
         return colors, depths
 
     def render(self):
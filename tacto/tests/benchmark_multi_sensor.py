@@ -0,0 +1,99 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Benchmark rendering several sensor views per frame with and without batch_render.
+
+Every sensor is rendered in contact with a small sphere, so no view falls back to
+the static image. Run with:
+
+    python benchmark_multi_sensor.py --num_sensors 1 2 5
+"""
+
+import os
+
+os.environ["PYOPENGL_PLATFORM"] = "osmesa"
+
+import argparse  # noqa: E402
+import time  # noqa: E402
+
+import numpy as np  # noqa: E402
+import trimesh  # noqa: E402
+
+import tacto  # noqa: E402
+
+CONFIGS = {
+    "digit": tacto.get_digit_config_path(),
+    "omnitact": tacto.get_omnitact_config_path(),
+}
+
+
+def create_renderer(config_path, batch_render, width=120, height=160):
+    renderer = tacto.Renderer(
+        width=width,
+        height=height,
+        background=None,
+        config_path=config_path,
+        batch_render=batch_render,
+    )
+    sphere = trimesh.creation.icosphere(radius=0.005)
+    renderer.add_object(sphere, "2_-1", position=[0.025, 0, 0.03])
+    return renderer
+
+
+def render_sensors(renderer, num_sensors, n_times):
+    """
+    Render num_sensors sensors (at different poses) n_times, return the average time
+    per frame and the images of the last frame.
+    """
+    orientation = [0, 0, 0]
+    normal_forces = {"2_-1": 5.0}
+    poses = [[0.05 * k, 0, 0] for k in range(num_sensors)]
+
+    t = time.time()
+    for _ in range(n_times):
+        colors, depths = [], []
+        for position in poses:
+            object_poses = {"2_-1": ([position[0] + 0.025, 0, 0.03], orientation)}
+            renderer.update_camera_pose(position, orientation)
+            color, depth = renderer.render(
+                position, orientation, object_poses=object_poses,
+                normal_forces=normal_forces, noise=False,
+            )
+            colors += color
+            depths += depth
+    elapsed = (time.time() - t) / n_times
+    return elapsed, colors, depths
+
+
+def main():
+    parser = argparse.ArgumentParser("Multi-sensor rendering benchmark")
+    parser.add_argument("--num_sensors", type=int, nargs="+", default=[1, 2, 5])
+    parser.add_argument("--n_times", type=int, default=100)
+    parser.add_argument("--config", choices=CONFIGS.keys(), default="digit")
+    args = parser.parse_args()
+
+    renderers = {
+        batch_render: create_renderer(CONFIGS[args.config], batch_render)
+        for batch_render in (False, True)
+    }
+
+    for num_sensors in args.num_sensors:
+        results = {
+            batch_render: render_sensors(renderer, num_sensors, args.n_times)
+            for batch_render, renderer in renderers.items()
+        }
+        t_ref, colors_ref, _ = results[False]
+        t, colors, _ = results[True]
+        matches = all(np.array_equal(c, c_ref) for c, c_ref in zip(colors, colors_ref))
+        print(
+            f"{num_sensors} sensor(s), {len(colors)} views: "
+            f"{t_ref * 1000:.2f} ms -> {t * 1000:.2f} ms with batch_render "
+            f"[~ {1 / t:.1f} fps], identical images: {matches}"
+        )
+
+
+if __name__ == "__main__":
+    main()
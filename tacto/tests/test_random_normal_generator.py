@@ -7,7 +7,7 @@ import time
 
 import pytest
 import numpy as np
-from tacto.random_normal_generator import RandomNormalGenerator
+from tacto.random_normal_generator import RandomNormalGenerator, RandomNormalPool
 
 
 @pytest.fixture()
@@ -30,3 +30,32 @@ def test_random_normal_generator_multiprocess(image_shape):
     for i in range(100):
         r.sample()
     print(f"Took {time.time() - t} sec.")
+
+
+def test_random_normal_pool(image_shape):
+    r = RandomNormalPool(mean=0, std=7, size=image_shape, pool_size=8)
+
+    t = time.time()
+    for i in range(100):
+        noise = r.sample()
+    print(f"Took {time.time() - t} sec.")
+
+    assert noise.shape == image_shape
+    assert noise.dtype == np.float32
+    assert abs(r.pool.std() - 7) < 0.1
+
+
+def test_random_normal_pool_samples_differ(image_shape):
+    r = RandomNormalPool(mean=0, std=7, size=image_shape, pool_size=2)
+
+    samples = [r.sample() for i in range(20)]
+    for a, b in zip(samples, samples[1:]):
+        assert not np.array_equal(a, b)
+
+
+def test_random_normal_generator_dtype(image_shape):
+    r = RandomNormalGenerator(mean=0, std=7, size=image_shape, dtype=np.float32)
+
+    noise = r.sample()
+    assert noise.shape == image_shape
+    assert noise.dtype == np.float32